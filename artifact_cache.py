@@ -0,0 +1,165 @@
+# vi: set et ts=4 sw=4 sts=4:
+
+import hashlib
+import os
+import re
+import shutil
+import subprocess
+import tarfile
+import tempfile
+from cache_directory import cache_directory
+
+# The name of the archive and of its checksum inside a cache entry
+ARCHIVE = "build.tar.gz"
+CHECKSUM = "build.tar.gz.sha256"
+
+# The tools whose version is part of the toolchain identity
+TOOLS = [ "cc", "c++", "gfortran", "cmake", "make" ]
+
+def toolchain_identity(env=None):
+    """
+    A hash identifying the compilers and build tools, made up of the version
+    output of the tools (as selected by CC, CXX and FC if set) and the paths
+    they are found at.
+    """
+    env = os.environ if env is None else env
+    tools = list(TOOLS)
+    for var, default in [ ("CC", "cc"), ("CXX", "c++"), ("FC", "gfortran") ]:
+        if var in env:
+            tools[tools.index(default)] = env[var]
+
+    h = hashlib.sha256()
+    for tool in tools:
+        path = shutil.which(tool)
+        h.update(tool.encode() + b"=" + str(path).encode() + b"\0")
+        if path is None:
+            continue
+        try:
+            p = subprocess.run([ path, "--version" ],stdout=subprocess.PIPE,stderr=subprocess.DEVNULL,
+                    stdin=subprocess.DEVNULL,timeout=30)
+            h.update(p.stdout + b"\0")
+        except (OSError, subprocess.TimeoutExpired):
+            pass
+    return h.hexdigest()
+
+def sha256_file(path):
+    """The sha256 sum of the content of the file path as a hex string"""
+    h = hashlib.sha256()
+    with open(path,"rb") as f:
+        for block in iter(lambda: f.read(1 << 20),b""):
+            h.update(block)
+    return h.hexdigest()
+
+class artifact_cache:
+    """
+    A cache of the build directories of projects, which may be shared between
+    workspaces and CI runners on the same machine.
+
+    The key of a build is made up of the fingerprint of the project (i.e. its
+    source revision and local modifications, the configure options and the
+    fingerprints of all its dependencies), the toolchain identity and the
+    absolute path of the project. The latter is needed, since CMake and
+    autotools record absolute paths in the build directory, which cannot be
+    rewritten safely in binary files. Builds are hence only reused by
+    workspaces at the same location (e.g. fresh workspaces of CI runners).
+    Only the build directory is cached, which is everything a build of
+    repoiser produces.
+
+    Entries are stored as compressed tarballs together with their sha256 sum,
+    which is checked before an entry is restored. The least recently used
+    entries are evicted once the cache exceeds its maximal size.
+    """
+
+    def __init__(self,directory,max_size=None,toolchain=None):
+        """
+        directory:  The cache directory
+        max_size:   Maximal size of the cache in bytes or None for no limit
+        toolchain:  The toolchain identity, default: toolchain_identity()
+        """
+        self.__cache = cache_directory(os.path.abspath(directory),max_size)
+        self.__toolchain = toolchain if toolchain is not None else toolchain_identity()
+
+    @property
+    def directory(self):
+        """The cache directory"""
+        return self.__cache.path
+
+    def key(self,project,fingerprint):
+        """
+        The key of the build of a build_matrix.configured_project with the
+        given fingerprint (see fingerprint.fingerprinter)
+        """
+        h = hashlib.sha256()
+        h.update(b"fingerprint:" + fingerprint.encode() + b"\0")
+        h.update(b"toolchain:" + self.__toolchain.encode() + b"\0")
+        h.update(b"path:" + os.path.abspath(project.directory).encode() + b"\0")
+        name = re.sub(r"[^A-Za-z0-9_.-]","_",project.name)
+        return name + "-" + h.hexdigest()[:32]
+
+    def has(self,project,fingerprint):
+        """Is there a cached build of project with the given fingerprint"""
+        return self.__cache.has(self.key(project,fingerprint))
+
+    def store(self,project,fingerprint):
+        """
+        Store the build directory of project, which has the given fingerprint,
+        in the cache, unless there is an entry for it already. Returns True
+        if the build was stored.
+        """
+        key = self.key(project,fingerprint)
+        build = project.build_directory
+        with self.__cache.lock(key) as path:
+            if os.path.exists(path):
+                return False
+
+            tmp = tempfile.mkdtemp(dir=self.directory,prefix=".tmp")
+            try:
+                with tarfile.open(os.path.join(tmp,ARCHIVE),"w:gz",compresslevel=1) as tar:
+                    tar.add(build,arcname=os.path.basename(build))
+                with open(os.path.join(tmp,CHECKSUM),"w") as f:
+                    f.write(sha256_file(os.path.join(tmp,ARCHIVE)) + "\n")
+                os.rename(tmp,path)
+            except:
+                shutil.rmtree(tmp,ignore_errors=True)
+                raise
+        return True
+
+    def restore(self,project,fingerprint):
+        """
+        Replace the build directory of project by the cached build with the
+        given fingerprint. Returns False if there is no such build or it is
+        corrupted, in which case the entry is removed.
+
+        The restored files keep the modification times they had when they
+        were stored, such that make and CMake still see the order in which
+        outputs and their inputs were made.
+        """
+        key = self.key(project,fingerprint)
+        with self.__cache.lock(key) as path:
+            if not os.path.isdir(path):
+                return False
+
+            archive = os.path.join(path,ARCHIVE)
+            try:
+                with open(os.path.join(path,CHECKSUM)) as f:
+                    checksum = f.read().strip()
+                valid = checksum == sha256_file(archive)
+            except FileNotFoundError:
+                valid = False
+            if not valid:
+                self.__cache.remove(key)
+                return False
+
+            build = project.build_directory
+            if os.path.isdir(build):
+                shutil.rmtree(build)
+            with tarfile.open(archive,"r:gz") as tar:
+                if hasattr(tarfile,"tar_filter"):
+                    tar.extractall(project.directory,filter="tar")
+                else:
+                    tar.extractall(project.directory)
+        return True
+
+    def evict(self):
+        """Remove least recently used builds until the cache fits its maximal size"""
+        return self.__cache.evict()
@@ -0,0 +1,226 @@
+#!/usr/bin/env python3
+# vi: set et ts=4 sw=4 sts=4:
+
+import argparse
+import gc
+import json
+import math
+import platform
+import random
+import subprocess
+import sys
+import time
+import tracemalloc
+import dependency_node
+from graph_index import graph_index
+from task import task
+
+# The numbers of nodes benchmarked by default
+DEFAULT_SIZES = [ 10, 100, 1000, 10000, 100000 ]
+
+# The number of dependencies of a node in the random and layered graphs
+DEGREE = 3
+
+# The maximal number of root nodes passed to build_recursive_dependency_set
+MAX_ROOTS = 10
+
+# A timing is reported as a regression if it is slower by more than this factor
+DEFAULT_THRESHOLD = 1.5
+
+def random_dag(n,rng):
+    """
+    List of n tasks, where each task depends on up to DEGREE tasks
+    chosen at random amongst the ones created before it
+    """
+    nodes = []
+    for i in range(n):
+        deps = rng.sample(nodes,min(DEGREE,i))
+        nodes.append(task(i,*deps))
+    return nodes
+
+def layered_graph(n,rng):
+    """
+    List of n tasks arranged in layers of about sqrt(n) tasks, where each
+    task depends on up to DEGREE random tasks of the previous layer
+    """
+    width = max(1,int(math.sqrt(n)))
+    nodes = []
+    previous, layer = [], []
+    for i in range(n):
+        if len(layer) == width:
+            previous, layer = layer, []
+        t = task(i,*rng.sample(previous,min(DEGREE,len(previous))))
+        layer.append(t)
+        nodes.append(t)
+    return nodes
+
+def chain(n,rng):
+    """List of n tasks, where each task depends on the one before"""
+    nodes = []
+    for i in range(n):
+        nodes.append(task(i,*nodes[-1:]))
+    return nodes
+
+def diamond_lattice(n,rng):
+    """
+    List of n tasks on a square grid, where each task depends on its left
+    and its upper neighbour. The number of paths between two tasks grows
+    exponentially with their distance.
+    """
+    side = max(1,math.ceil(math.sqrt(n)))
+    nodes = []
+    for i in range(n):
+        row, col = divmod(i,side)
+        deps = []
+        if col > 0:
+            deps.append(nodes[i - 1])
+        if row > 0:
+            deps.append(nodes[i - side])
+        nodes.append(task(i,*deps))
+    return nodes
+
+# The graph generators by name
+GRAPHS = {
+    "random": random_dag,
+    "layered": layered_graph,
+    "chain": chain,
+    "diamond": diamond_lattice,
+}
+
+def roots(nodes):
+    """The nodes of the list nodes, which no other node depends on"""
+    depended_on = set()
+    for node in nodes:
+        depended_on.update(node.depends_on())
+    return [ node for node in nodes if node not in depended_on ]
+
+# The benchmarked operations by name. Each is called with the list of
+# nodes of the graph (dependencies before the nodes depending on them)
+# and the list of at most MAX_ROOTS root nodes.
+OPERATIONS = {
+    "build_batches": lambda nodes, r: dependency_node.build_batches(nodes),
+    "node.build_batches": lambda nodes, r: nodes[-1].build_batches(),
+    "depends_on_recursive": lambda nodes, r: nodes[-1].depends_on_recursive(),
+    "dependencies_fulfilled": lambda nodes, r: nodes[-1].dependencies_fulfilled(),
+    "build_recursive_dependency_set": lambda nodes, r: dependency_node.build_recursive_dependency_set(r),
+    "graph_index": lambda nodes, r: graph_index(r),
+}
+
+def measure(function,repeat):
+    """
+    Call function repeat times and return a tuple of the minimal and the
+    mean time in seconds a call took and the peak memory in bytes
+    allocated during an additional call traced by tracemalloc.
+    """
+    times = []
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+
+    gc.collect()
+    tracemalloc.start()
+    try:
+        function()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return (min(times), sum(times) / len(times), peak)
+
+def run_benchmarks(graphs,sizes,operations,repeat=3,seed=42,verbose=False):
+    """List of dicts with the results of all combinations of graphs, sizes and operations"""
+    results = []
+    for name in graphs:
+        for n in sizes:
+            nodes = GRAPHS[name](n,random.Random(seed))
+            r = roots(nodes)[:MAX_ROOTS]
+            edges = sum( len(node.depends_on()) for node in nodes )
+            for op in operations:
+                best, mean, peak = measure(lambda: OPERATIONS[op](nodes,r),repeat)
+                results.append({ "graph": name, "nodes": n, "edges": edges, "operation": op,
+                    "seconds_min": best, "seconds_mean": mean, "repeat": repeat, "peak_memory": peak })
+                if verbose:
+                    print_result(results[-1])
+    return results
+
+def git_revision():
+    """The commit the benchmarked code is from or None"""
+    try:
+        p = subprocess.run([ "git", "rev-parse", "HEAD" ],stdout=subprocess.PIPE,stderr=subprocess.DEVNULL,
+                cwd=sys.path[0] or ".",universal_newlines=True)
+    except OSError:
+        return None
+    return p.stdout.strip() if p.returncode == 0 else None
+
+def print_result(result):
+    print("{0:10} {1:>7} {2:32} {3:12.6f} s {4:12.1f} KiB".format(result["graph"],result["nodes"],
+        result["operation"],result["seconds_min"],result["peak_memory"] / 1024))
+
+def compare(old,new,threshold=DEFAULT_THRESHOLD):
+    """
+    Print the ratio of the timings and peak memory of the results new to
+    the results old and return the list of the new results, which are
+    slower than the old ones by more than the factor threshold.
+    """
+    def key(r):
+        return (r["graph"], r["nodes"], r["operation"])
+    old = dict( (key(r), r) for r in old )
+
+    regressions = []
+    print("{0:10} {1:>7} {2:32} {3:>10} {4:>10}".format("graph","nodes","operation","time","memory"))
+    for r in new:
+        if key(r) not in old:
+            continue
+        o = old[key(r)]
+        time_ratio = r["seconds_min"] / max(o["seconds_min"],1e-9)
+        memory_ratio = r["peak_memory"] / max(o["peak_memory"],1)
+        mark = ""
+        if time_ratio > threshold:
+            regressions.append(r)
+            mark = "  <-- regression"
+        print("{0:10} {1:>7} {2:32} {3:9.2f}x {4:9.2f}x{5}".format(r["graph"],r["nodes"],r["operation"],
+            time_ratio,memory_ratio,mark))
+    return regressions
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the dependency resolution on synthetic graphs of tasks")
+    parser.add_argument("--graphs", type=str, default=",".join(GRAPHS),
+            help="Comma-separated list of the graphs to generate, default: " + ",".join(GRAPHS))
+    parser.add_argument("--sizes", type=str, default=",".join( str(n) for n in DEFAULT_SIZES ),
+            help="Comma-separated list of the numbers of nodes, default: " + ",".join( str(n) for n in DEFAULT_SIZES ))
+    parser.add_argument("--operations", type=str, default=",".join(OPERATIONS),
+            help="Comma-separated list of the operations to benchmark, default: all")
+    parser.add_argument("--repeat", type=int, default=3, help="Number of timed calls of each operation")
+    parser.add_argument("--seed", type=int, default=42, help="Seed for generating the random graphs")
+    parser.add_argument("--output", "-o", type=str, default="benchmark.json",
+            help="File to write the results to as JSON, default: benchmark.json")
+    parser.add_argument("--compare", metavar="results.json", type=str,
+            help="Compare with the results of an earlier run and fail if something got slower")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+            help="Factor by which an operation has to be slower to count as a regression")
+    args = parser.parse_args()
+
+    graphs = args.graphs.split(",")
+    operations = args.operations.split(",")
+    for g in graphs:
+        if g not in GRAPHS:
+            raise SystemExit("Unknown graph " + g + ", choose from " + ", ".join(GRAPHS))
+    for op in operations:
+        if op not in OPERATIONS:
+            raise SystemExit("Unknown operation " + op + ", choose from " + ", ".join(OPERATIONS))
+
+    results = run_benchmarks(graphs,[ int(n) for n in args.sizes.split(",") ],operations,
+            repeat=args.repeat,seed=args.seed,verbose=True)
+    with open(args.output,"w") as f:
+        json.dump({ "revision": git_revision(), "python": platform.python_version(),
+            "platform": platform.platform(), "date": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "seed": args.seed, "results": results },f,indent=2)
+    print("Results written to " + args.output)
+
+    if args.compare is not None:
+        with open(args.compare) as f:
+            old = json.load(f)["results"]
+        print()
+        if len(compare(old,results,args.threshold)) > 0:
+            sys.exit(1)
@@ -0,0 +1,205 @@
+# vi: set et ts=4 sw=4 sts=4:
+
+import os
+import project_file
+from dependency_node import dependency_node
+
+# The build directory of the projects built without a named configuration
+DEFAULT_BUILD_DIRECTORY = "build"
+
+# The build directory of a named configuration is this prefix followed by its name
+BUILD_DIRECTORY_PREFIX = "build-"
+
+# The file marking the build directories made by configure_repo in
+# common.lib.sh (see build_dir_stamp there), which holds the compiler
+# launcher the build directory was configured with
+BUILD_DIRECTORY_STAMP = ".repoiser-build"
+
+def build_directory_name(configuration):
+    """The name of the build directory for the build_configuration configuration (or None)"""
+    if configuration is None:
+        return DEFAULT_BUILD_DIRECTORY
+    return BUILD_DIRECTORY_PREFIX + configuration.name
+
+def is_build_directory(path):
+    """
+    Is the directory path (inside a checkout) the build directory of some
+    configuration. Apart from the default build directory only directories
+    named like the build directory of a configuration and marked by
+    BUILD_DIRECTORY_STAMP are, such that e.g. build-aux of autotools is not.
+    """
+    name = os.path.basename(os.path.normpath(path))
+    if name == DEFAULT_BUILD_DIRECTORY:
+        return True
+    return name.startswith(BUILD_DIRECTORY_PREFIX) and os.path.isfile(os.path.join(path,BUILD_DIRECTORY_STAMP))
+
+def configured_name(project,configuration):
+    """The name under which the state of project built in configuration is recorded"""
+    if configuration is None:
+        return project.name
+    return project.name + "@" + configuration.name
+
+def configured_label(directory,configuration):
+    """The name in the output and the logs of the build of the checkout directory in configuration"""
+    if configuration is None:
+        return directory
+    return directory + "@" + configuration.name
+
+def configure_options(configuration):
+    """The list of options for configure or cmake of the build_configuration configuration (or None)"""
+    if configuration is None:
+        return []
+    return configuration.configure_options.split()
+
+def parse_configuration(string,known=[]):
+    """
+    Parse a build configuration given on the command line as NAME=OPTIONS,
+    where OPTIONS are the options for configure or cmake. A plain NAME
+    refers to one of the build_configuration objects known (e.g. from the
+    project file). Raises ValueError if this is not possible.
+    """
+    name, sep, options = string.partition("=")
+    if sep == "":
+        for c in known:
+            if c.name == name:
+                return c
+        raise ValueError("Unknown build configuration " + name + " (use NAME=OPTIONS to define it)")
+    try:
+        return project_file.build_configuration(name,configure_options=options)
+    except ValueError as e:
+        raise ValueError("Invalid build configuration " + string + ": " + str(e))
+
+class configured_project(dependency_node):
+    """
+    A project_file.project built in one build_configuration, i.e. in its
+    own build directory inside the common checkout of the project. It
+    depends on the same configuration of the dependencies of the project.
+
+    The configuration None stands for the in-tree build directory used
+    if no configurations are given, in which case names and directories
+    are the ones of the project itself.
+    """
+
+    def __init__(self,project,configuration,nodes):
+        """
+        project:        The project_file.project
+        configuration:  The project_file.build_configuration or None
+        nodes:          Dict from tuples (project, configuration) to the
+                        configured_project objects created so far, which
+                        is shared by all of them
+        """
+        self.__project = project
+        self.__configuration = configuration
+        self.__nodes = nodes
+        self.__dependencies = None
+
+    def __repr__(self):
+        return "{0}(project={1}, configuration={2})".format(self.__class__.__name__,
+                self.__project.name,None if self.__configuration is None else self.__configuration.name)
+
+    @staticmethod
+    def get(project,configuration,nodes):
+        """The configured_project for project in configuration out of nodes (created if needed)"""
+        key = (project, configuration)
+        if key not in nodes:
+            nodes[key] = configured_project(project,configuration,nodes)
+        return nodes[key]
+
+    # --------------------------------------------------------------------
+    # stuff needed for the dependency_node interface
+
+    def is_fulfilled(self):
+        return self.__project.is_fulfilled()
+
+    def depends_on(self):
+        """The same configuration of the projects the project depends upon"""
+        if self.__dependencies is None:
+            self.__dependencies = [ configured_project.get(d,self.__configuration,self.__nodes)
+                    for d in self.__project.depends_on() ]
+        return self.__dependencies
+
+    # --------------------------------------------------------------------
+
+    @property
+    def project(self):
+        """The project_file.project"""
+        return self.__project
+
+    @property
+    def configuration(self):
+        """The project_file.build_configuration or None"""
+        return self.__configuration
+
+    @property
+    def name(self):
+        """The name under which the state of this build is recorded"""
+        return configured_name(self.__project,self.__configuration)
+
+    @property
+    def label(self):
+        """The name of this build in the output and the logs"""
+        return configured_label(self.directory,self.__configuration)
+
+    @property
+    def directory(self):
+        """The directory of the checkout, which is shared by all configurations"""
+        return self.__project.directory
+
+    @property
+    def build_directory(self):
+        """The build directory of this configuration"""
+        return os.path.join(self.directory,build_directory_name(self.__configuration))
+
+    @property
+    def project_policy(self):
+        return self.__project.project_policy
+
+    @property
+    def compiler_launcher(self):
+        return self.__project.compiler_launcher
+
+    @property
+    def configure_options(self):
+        """The list of options for configure or cmake specific to the configuration"""
+        return configure_options(self.__configuration)
+
+    def environment(self,env=None):
+        """
+        Return a copy of the environment env (default os.environ) for
+        configuring and building in this configuration.
+
+        For named configurations the variables of the configuration are
+        set, together with REPOISER_CONFIGURATION (its name) and
+        REPOISER_BUILD_DIR (the build directory relative to the checkout).
+        The absolute paths of the build directories of the same
+        configuration of all dependencies are listed in
+        REPOISER_DEPENDENCY_BUILD_DIRS and put in front of
+        CMAKE_PREFIX_PATH, such that they are found by cmake.
+        """
+        ret = dict(os.environ if env is None else env)
+        if self.__configuration is None:
+            return ret
+
+        ret.update(self.__configuration.environment)
+        ret["REPOISER_CONFIGURATION"] = self.__configuration.name
+        ret["REPOISER_BUILD_DIR"] = build_directory_name(self.__configuration)
+
+        builds = [ os.path.abspath(d.build_directory) for d in self._iter_dependencies() ]
+        ret["REPOISER_DEPENDENCY_BUILD_DIRS"] = ":".join(builds)
+        if ret.get("CMAKE_PREFIX_PATH","") != "":
+            builds.append(ret["CMAKE_PREFIX_PATH"])
+        if len(builds) > 0:
+            ret["CMAKE_PREFIX_PATH"] = ":".join(builds)
+        return ret
+
+def configure(projects,configurations=[]):
+    """
+    Return the list of configured_project objects building each of the
+    projects in each of the project_file.build_configuration objects
+    configurations (ordered by configuration). If configurations is empty,
+    each project is built once in its in-tree build directory.
+    """
+    nodes = dict()
+    if len(configurations) == 0:
+        configurations = [ None ]
+    return [ configured_project.get(p,c,nodes) for c in configurations for p in projects ]
@@ -0,0 +1,156 @@
+# vi: set et ts=4 sw=4 sts=4:
+
+import fcntl
+import os
+import re
+import shutil
+from contextlib import contextmanager
+
+def parse_size(string):
+    """
+    Parse a size like "500M" or "20G" into a number of bytes.
+    The suffixes K, M, G and T (powers of 1024) are understood.
+    """
+    match = re.fullmatch(r"\s*([0-9]+(?:\.[0-9]*)?)\s*([KMGT]?)i?B?\s*",string,re.IGNORECASE)
+    if match is None:
+        raise ValueError("Invalid size: " + string)
+    factor = 1024 ** " KMGT".index(match.group(2).upper() or " ")
+    return int(float(match.group(1)) * factor)
+
+def disk_usage(path):
+    """The number of bytes used by the files below path (hardlinks counted once)"""
+    seen = set()
+    total = 0
+    for dirpath, dirnames, filenames in os.walk(path):
+        for name in dirnames + filenames:
+            try:
+                st = os.lstat(os.path.join(dirpath,name))
+            except FileNotFoundError:
+                continue
+            if (st.st_dev, st.st_ino) in seen:
+                continue
+            seen.add((st.st_dev, st.st_ino))
+            total += st.st_blocks * 512
+    return total
+
+class cache_directory:
+    """
+    A directory of cache entries, which may be shared between several
+    processes (e.g. multiple workspaces or CI runners on one host).
+
+    Each entry is a file or directory named by its key. Next to it a file
+    key.lock is used to lock the entry (using flock) and its modification
+    time records when the entry was last used. If a maximal size is given,
+    evict() removes the least recently used entries until the cache fits.
+    """
+
+    def __init__(self,path,max_size=None):
+        """
+        path:      The cache directory, created if it does not exist
+        max_size:  Maximal size in bytes or None for no limit
+        """
+        self.__path = path
+        self.__max_size = max_size
+        os.makedirs(path,exist_ok=True)
+
+    @property
+    def path(self):
+        """The cache directory"""
+        return self.__path
+
+    @property
+    def max_size(self):
+        """The maximal size of the cache in bytes (or None)"""
+        return self.__max_size
+
+    def entry_path(self,key):
+        """The path of the entry for key"""
+        return os.path.join(self.__path,key)
+
+    def __lock_path(self,key):
+        return os.path.join(self.__path,key + ".lock")
+
+    def has(self,key):
+        """Is there an entry for key"""
+        return os.path.exists(self.entry_path(key))
+
+    @contextmanager
+    def lock(self,key):
+        """
+        Context manager holding an exclusive lock on the entry for key.
+        Using the entry inside the context marks it as recently used.
+        """
+        lock_path = self.__lock_path(key)
+        while True:
+            f = open(lock_path,"a")
+            fcntl.flock(f,fcntl.LOCK_EX)
+
+            # the entry might have been evicted while we were waiting,
+            # in which case the lock file we hold is no longer the current one
+            try:
+                if os.stat(lock_path).st_ino == os.fstat(f.fileno()).st_ino:
+                    break
+            except FileNotFoundError:
+                pass
+            f.close()
+
+        with f:
+            try:
+                yield self.entry_path(key)
+            finally:
+                os.utime(lock_path)
+                fcntl.flock(f,fcntl.LOCK_UN)
+
+    def entries(self):
+        """List of tuples (last used, key) of all entries, oldest first"""
+        ret = []
+        for name in os.listdir(self.__path):
+            if not name.endswith(".lock"):
+                continue
+            key = name[:-len(".lock")]
+            if not self.has(key):
+                continue
+            ret.append((os.stat(os.path.join(self.__path,name)).st_mtime, key))
+        return sorted(ret)
+
+    def remove(self,key):
+        """Remove the entry for key (the caller should hold the lock)"""
+        path = self.entry_path(key)
+        if os.path.isdir(path) and not os.path.islink(path):
+            shutil.rmtree(path)
+        elif os.path.lexists(path):
+            os.unlink(path)
+
+    def evict(self):
+        """
+        Remove the least recently used entries until the cache is below
+        its maximal size. Entries locked by someone else are skipped.
+
+        Returns the list of keys removed.
+        """
+        if self.__max_size is None:
+            return []
+
+        entries = self.entries()
+        sizes = dict( (key, disk_usage(self.entry_path(key))) for _, key in entries )
+        total = sum(sizes.values())
+
+        removed = []
+        for _, key in entries:
+            if total <= self.__max_size:
+                break
+
+            with open(self.__lock_path(key),"a") as f:
+                try:
+                    fcntl.flock(f,fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    continue
+                try:
+                    self.remove(key)
+                    os.unlink(self.__lock_path(key))
+                finally:
+                    fcntl.flock(f,fcntl.LOCK_UN)
+
+            total -= sizes[key]
+            removed.append(key)
+        return removed
@@ -0,0 +1,306 @@
+#!/usr/bin/env python3
+# vi: set et ts=4 sw=4 sts=4:
+
+import argparse
+import os
+import shutil
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+import process
+import project_file
+import vcs
+from cache_directory import parse_size
+from graph_index import graph_index
+from mirror_cache import mirror_cache
+from tracing import tracer
+
+def source_host(project):
+    """
+    The host the repository of the project_file.project project is obtained from
+    or "" for local repositories (file:// or plain paths)
+    """
+    url = project.project_policy.source.repository_url(project.checkout_params())
+    parts = urlsplit(url)
+    if parts.scheme in ("", "file"):
+        return ""
+    if parts.hostname is None:
+        return parts.netloc
+    return parts.hostname
+
+class checkout_executor:
+    """
+    Check out or update a set of projects concurrently.
+
+    Projects whose directory does not yet exist are checked out, all others
+    updated. At most max_connections commands run against the same source host
+    at a time, where the limit is taken from the source of the project
+    (see project_file.source.max_connections) or the default given.
+    Failed commands are retried with exponential backoff.
+
+    If a mirror_cache is given, the repositories are obtained from local
+    mirrors, which are refreshed from the source host first.
+
+    With only_changed the repositories are asked for their current head
+    first and only the projects whose repository moved on since their last
+    update (or which are not checked out yet) are processed.
+    """
+
+    def __init__(self,projects,jobs=4,max_connections=4,retries=2,backoff=1.0,mirrors=None,trace=None,
+            only_changed=False):
+        """
+        projects:          The project_file.project objects to check out or update
+        jobs:              The maximal number of commands to run at once
+        max_connections:   Default limit for the commands run against one host
+        retries:           How often a failed command is retried
+        backoff:           Seconds to wait before the first retry. The time is
+                           doubled for each further retry.
+        mirrors:           Optional mirror_cache.mirror_cache to check out from
+        trace:             Optional tracing.tracer recording each checkout or update
+        only_changed:      Only process the projects which changed upstream
+        """
+        if jobs < 1:
+            raise ValueError("jobs needs to be at least 1")
+        if max_connections < 1:
+            raise ValueError("max_connections needs to be at least 1")
+
+        self.__projects = list(projects)
+        self.__jobs = jobs
+        self.__retries = retries
+        self.__backoff = backoff
+        self.__mirrors = mirrors
+        self.__trace = trace
+        self.__only_changed = only_changed
+        self.__updated = []
+
+        # one semaphore per host, using the smallest limit of all sources
+        # on that host
+        limits = dict()
+        for p in self.__projects:
+            host = source_host(p)
+            limit = p.project_policy.source.max_connections
+            if limit is None:
+                limit = max_connections
+            limits[host] = min(limit,limits.get(host,limit))
+        self.__host_semaphores = dict( (host, threading.Semaphore(limit)) for host, limit in limits.items() )
+
+        self.__output_lock = threading.Lock()
+        self.__n_done = 0
+        self.__n_total = len(self.__projects)
+
+    def __print(self,string):
+        with self.__output_lock:
+            sys.stdout.write(string)
+            sys.stdout.flush()
+
+    def __run(self,project,command,remote):
+        """
+        Run a command, if remote is True within the connection limit for the
+        host of project. Returns the completed process.
+        """
+        def run():
+            return process.run(["bash","-c",command])
+
+        if not remote:
+            return run()
+        with self.__host_semaphores[source_host(project)]:
+            return run()
+
+    def __attempt(self,project,exists):
+        """Try to check out or update project once and return the last completed process"""
+        if self.__mirrors is None:
+            if exists:
+                return self.__run(project,project.update_command(),True)
+            return self.__run(project,project.checkout_command(),True)
+
+        with self.__mirrors.lock(project):
+            update_command = self.__mirrors.update_command(project)
+            if exists and update_command is None:
+                # updates do not go through the mirror
+                return self.__run(project,project.update_command(),True)
+
+            had_mirror = self.__mirrors.has_mirror(project)
+            p = self.__run(project,self.__mirrors.refresh_command(project),True)
+            if p.returncode != 0:
+                if not had_mirror:
+                    self.__mirrors.remove(project)
+                return p
+
+            if exists:
+                return self.__run(project,update_command,False)
+            return self.__run(project,self.__mirrors.checkout_command(project),False)
+
+    def process(self,project):
+        """
+        Check out or update a single project.
+        Returns a tuple (success, action, number of attempts, duration)
+        """
+        exists = os.path.exists(project.directory)
+        action = "update" if exists else "checkout"
+
+        start = time.time()
+        attempt = 0
+        while True:
+            attempt += 1
+            p = self.__attempt(project,exists)
+            if p.returncode == 0 or attempt > self.__retries:
+                break
+
+            # remove the traces of a failed checkout before trying again
+            if not exists and os.path.isdir(project.directory):
+                shutil.rmtree(project.directory)
+
+            delay = self.__backoff * 2**(attempt-1)
+            self.__print("{0} of {1} failed, retrying in {2:.1f}s\n".format(action,project.directory,delay))
+            time.sleep(delay)
+
+        success = (p.returncode == 0)
+        duration = time.time() - start
+        if self.__trace is not None:
+            self.__trace.add_span(project.directory,action,start,duration,p.cpu_time,p.max_rss,p.returncode)
+        with self.__output_lock:
+            self.__n_done += 1
+            status = "done" if success else "FAILED"
+            sys.stdout.write("[{0}/{1}] {2} {3} of {4} ({5:.1f}s)\n".format(self.__n_done,
+                self.__n_total,status,action,project.directory,duration))
+            if not success:
+                sys.stdout.write("".join( "   " + l for l in p.output.splitlines(True) ))
+            sys.stdout.flush()
+
+        return (success, action, attempt, duration)
+
+    def __check_git(self,project,ref,rev):
+        """List with project if its remote branch ref no longer points to rev"""
+        url = project.project_policy.source.repository_url(project.checkout_params())
+        with self.__host_semaphores[source_host(project)]:
+            remote = vcs.git_remote_revision(url,ref)
+        return [ project ] if remote is None or remote != rev else []
+
+    def __check_svn(self,host,entries):
+        """
+        List of the projects of the list entries of tuples (project, url,
+        revision), whose url has a different last changed revision by now.
+        All urls are queried at once.
+        """
+        with self.__host_semaphores[host]:
+            info = vcs.svn_info([ url for _, url, _ in entries ])
+        if info is None:
+            return [ p for p, _, _ in entries ]
+        remote = dict(info)
+        return [ p for p, url, rev in entries if remote.get(url) != rev ]
+
+    def changed_upstream(self):
+        """
+        Return the list of projects which are not checked out yet or whose
+        repository moved on since they were last updated, i.e. the projects
+        which an update would change. Projects for which this cannot be
+        determined count as changed.
+
+        The repositories are queried concurrently, for git using git ls-remote
+        and for svn using a single svn info for all repositories on a host.
+        """
+        changed = set()
+        git = []
+        svn = dict()    # host -> list of (project, url, revision)
+        for p in self.__projects:
+            local = None
+            if os.path.exists(p.directory):
+                local = vcs.upstream_revision(p)
+            if local is None:
+                changed.add(p)
+            elif p.project_policy.source.type == "git":
+                git.append((p, ) + local)
+            else:
+                svn.setdefault(source_host(p),[]).append((p, ) + local)
+
+        with ThreadPoolExecutor(max_workers=self.__jobs) as pool:
+            futures = [ pool.submit(self.__check_git,*entry) for entry in git ]
+            futures += [ pool.submit(self.__check_svn,host,entries) for host, entries in svn.items() ]
+            for f in futures:
+                changed.update(f.result())
+        return [ p for p in self.__projects if p in changed ]
+
+    @property
+    def updated(self):
+        """The projects successfully checked out or updated by the last run()"""
+        return self.__updated
+
+    def run(self):
+        """
+        Check out or update all projects (or with only_changed those which
+        changed upstream), print a summary and return True if all succeeded.
+        """
+        start = time.time()
+        projects = self.__projects
+        if self.__only_changed:
+            projects = self.changed_upstream()
+            print("{0} of {1} repositories changed upstream or are not checked out yet ({2:.1f}s)".format(
+                len(projects),len(self.__projects),time.time()-start))
+        self.__n_done = 0
+        self.__n_total = len(projects)
+
+        with ThreadPoolExecutor(max_workers=self.__jobs) as pool:
+            results = list(pool.map(self.process,projects))
+
+        if self.__mirrors is not None:
+            for key in self.__mirrors.evict():
+                print("Evicted mirror " + key)
+
+        self.__updated = [ p for p, r in zip(projects,results) if r[0] ]
+        failed = [ p.directory for p, r in zip(projects,results) if not r[0] ]
+        n_checkout = sum( 1 for r in results if r[0] and r[1] == "checkout" )
+        n_update = sum( 1 for r in results if r[0] and r[1] == "update" )
+        n_retried = sum( 1 for r in results if r[2] > 1 )
+
+        print()
+        print("Checked out {0}, updated {1}, failed {2} repositories ({3} needed retries) in {4:.1f}s".format(
+            n_checkout,n_update,len(failed),n_retried,time.time()-start))
+        if len(failed) > 0:
+            print("The following repositories failed:")
+            for d in failed:
+                print("   " + d)
+        return len(failed) == 0
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check out or update the projects of a project.yaml file "
+            "and all their dependencies concurrently.")
+    parser.add_argument("config", metavar="project.yaml", type=str, help="The path to project.yaml file")
+    parser.add_argument("-j","--jobs", type=int, default=8, help="The maximal number of checkouts or updates at once")
+    parser.add_argument("--max-connections", type=int, default=4, help="The maximal number of checkouts or updates "
+            "from the same host at once, if not specified by the source")
+    parser.add_argument("--retries", type=int, default=2, help="How often a failed checkout or update is retried")
+    parser.add_argument("--backoff", type=float, default=1.0, help="Seconds to wait before the first retry")
+    parser.add_argument("--mirror-dir", default=os.environ.get("REPOISER_MIRROR_DIR"), help="Directory with local "
+            "mirrors of the repositories shared between workspaces (default: $REPOISER_MIRROR_DIR, if unset no mirrors are used)")
+    parser.add_argument("--mirror-size", type=parse_size, default=None, help="Maximal size of the mirror directory, "
+            "e.g. 20G. The least recently used mirrors are removed if it is exceeded.")
+    parser.add_argument("--trace", metavar="trace.json", default=None, help="Write a timeline of all checkouts and "
+            "updates to this file (in Chrome trace-event format)")
+    parser.add_argument("--only-changed", action="store_true", help="Ask the repositories for their current "
+            "head first and only update those which moved on since the last update")
+    parser.add_argument("--changed-output", metavar="file", default=None, help="Write the directories of the "
+            "repositories successfully checked out or updated to this file, one per line (see orchestrator.py --changed-file)")
+    args = parser.parse_args()
+
+    with open(args.config) as f:
+        config = project_file.reader(f)
+    index = graph_index.from_reader(config)
+    projects = index.sorted(index.descendants_of_all(config.default_projects))
+
+    mirrors = None
+    if args.mirror_dir:
+        mirrors = mirror_cache(args.mirror_dir,args.mirror_size)
+
+    trace = tracer() if args.trace is not None else None
+    e = checkout_executor(projects,jobs=args.jobs,max_connections=args.max_connections,
+            retries=args.retries,backoff=args.backoff,mirrors=mirrors,trace=trace,only_changed=args.only_changed)
+    success = e.run()
+    if trace is not None:
+        trace.write(args.trace)
+    if args.changed_output is not None:
+        with open(args.changed_output,"w") as f:
+            for p in e.updated:
+                f.write(p.directory + "\n")
+    sys.exit(0 if success else 1)
@@ -7,7 +7,8 @@ usage() {
 	$(basename "$0") [ --help | -h | <Options> ]
 
 	Remove the build folder for all libraries and projects in 
-	an .mrconfig file.
+	an .mrconfig file, including the build folders build-<name>
+	of all build configurations made by configure_build_test.sh.
 
 	--config <.mrconfig>
 	Specify the .mrconfig to use in order to obtain the list of
@@ -57,5 +58,8 @@ for repo in $(get_repos "$CONFIGFILE" "$EXCLUDE" "$ONLY"); do
 	if have_build "$repo"; then
 		rm -r "$(get_build_dir "$repo")"
 	fi
+	for dir in "$repo"/build-*; do
+		[ -f "$dir/$(build_dir_stamp)" ] && rm -r "$dir"
+	done
 done
 exit 0
@@ -10,38 +10,6 @@ die () {
 	exit 1
 }
 
-#
-# Dealing with the failed file
-#
-cleanup_failedfile() {
-	if have_failedfile; then
-		FAILED=$(< $FAILEDFILE sed 's/^/   /g')
-		rm "$FAILEDFILE"
-	fi
-
-	if [ "$FAILED" ]; then
-		echo
-		echo -----------------------------------
-		echo
-		echo "The following tests have failed:"
-		echo "$FAILED"
-		return 1
-	fi
-	return 0
-}
-
-create_failedfile() {
-	# Creates a temporary file to store test results
-	# Adds the variable FAILEDFILE to the environment
-	# which contains the path to the file
-	FAILEDFILE=$(mktemp)	
-}
-
-have_failedfile() {
-	# test if a FAILEDFILE has been set up
-	[ -f "$FAILEDFILE" ]
-}
-
 #
 # checkout/obtaining the repos:
 #
@@ -60,16 +28,29 @@ default_config() {
 	echo ".mrconfig"
 }
 
+default_project() {
+	# get the path of the project.yaml file the default .mrconfig
+	# has been generated from
+	# returns 1 if it is not known
+	[ -f ".default_project" ] || return 1
+	cat .default_project
+}
+
 get_repos() {
-	# extract all repos from an mrconfig file
+	# extract the repos to work on from an mrconfig file
 	# $1:  the .mrconfig file to use
 	# $2:  the repos to exclude
 	# $3:  only echo these repos (if they exist, else print error)
-	# 
-	# echos the repo folders 
+	# $4 to $@: further options for selection.py, e.g.
+	#           --with-dependencies or --project <project.yaml>
+	#
+	# $2 and $3 are lists of patterns in the form repo:repo2:repo3
+	#
+	# echos the repo folders in the order they need to be built
 	local FILE=$1
 	local EXCLUDE=$2
 	local ONLY=$3
+	shift 3
 
 	if [ ! -f "$FILE" ]; then
 		echo "Could not find .mrconfig file $FILE" >&2
@@ -77,63 +58,49 @@ get_repos() {
 		return 1
 	fi
 
-	# TODO implement only and exclude
-	# in the form repo:repo2:repo3
-
-	< "$FILE" awk -v "only=$ONLY" -v "exclude=$EXCLUDE" '
-		BEGIN {
-			split(only,aonly,":")
-			split(exclude,aexclude,":")
-		}
-
-		function is_excluded(a) {
-			for (i in aexclude) {
-				if (match(a,aexclude[i])) {
-					return 1
-				}
-			}
-			return 0
-		}
-
-		function matches_only(a) {
-			if (length(aonly) == 0) {
-				return 1
-			}
-
-			for (i in aonly) {
-				if (match(a,aonly[i])) {
-					return 1
-				}
-			}
-			return 0
-		}
-
-		function conditional_print(a) {
-			if (is_excluded(a)) {
-				return
-			}
-
-			if (matches_only(a)) {
-				print a
-			}
-		}
-
-		/^[[:space:]]*\[/ {
-	       		sub(/^\[/,"")
-			sub(/\]$/,"")
-
-			conditional_print($0)
-		}
-		'
-	return $?
+	local PROJECT_OPT=()
+	local PROJECTFILE
+	if PROJECTFILE=$(default_project) && [ -f "$PROJECTFILE" ]; then
+		PROJECT_OPT=(--project "$PROJECTFILE")
+	fi
+
+	"$(dirname "${BASH_SOURCE[0]}")/selection.py" "${PROJECT_OPT[@]}" --mrconfig "$FILE" \
+		--exclude "$EXCLUDE" --only "$ONLY" "$@"
+}
+
+project_depends_on() {
+	# Does the project $1 directly or indirectly depend on the project $2
+	# returns 0 if yes, 1 if not and 2 on errors
+	local PROJECTFILE
+	if ! PROJECTFILE=$(default_project); then
+		echo "Could not find the project file. Did you run \"setup_checkout.sh\" ?" >&2
+		return 2
+	fi
+	"$(dirname "${BASH_SOURCE[0]}")/graph_index.py" "$PROJECTFILE" depends "$1" "$2"
 }
 
 #
 # properties of repos
 #
+build_dir_name() {
+	# Echo the name of the build directory inside the repos, i.e.
+	# REPOISER_BUILD_DIR if set (e.g. build-debug for the build
+	# configuration debug) or build
+	echo "${REPOISER_BUILD_DIR:-build}"
+}
+
+build_dir_stamp() {
+	# Echo the name of the file marking the build directories
+	# made by configure_repo, such that other directories like
+	# build-aux are never taken for build directories. It holds
+	# the COMPILER_LAUNCHER the directory was configured with.
+	# (see BUILD_DIRECTORY_STAMP in build_matrix.py)
+	echo ".repoiser-build"
+}
+
 have_build() {
 	# Do we have a build directory in the repo $1
-	[ -d "$1/build" ]
+	[ -d "$1/$(build_dir_name)" ]
 }
 
 get_build_dir() {
@@ -142,7 +109,7 @@ get_build_dir() {
 	# if there is none, returns 1
 	
 	have_build "$1" || return 1
-	echo "$1/build"
+	echo "$1/$(build_dir_name)"
 }
 
 have_doxyfile() {
@@ -177,12 +144,6 @@ get_doxyfile() {
 }
 
 
-has_test_failed() {
-	# expect the output of the tests on stdin
-	# exit 1 if any of the tests failed
-	grep -iqE "(fail|error)"
-}
-
 #
 # actions on repos
 #
@@ -191,9 +152,20 @@ configure_repo() {
 	# $2 to $@: options for configure script
 	# configures a repository in folder $1
 	# return status of configure
+	#
+	# if COMPILER_LAUNCHER is set (e.g. to ccache), the compilers are
+	# launched using this program
+	#
+	# if REPOISER_BUILD_DIR is set to a directory other than build,
+	# the repository is configured out of tree in this directory,
+	# i.e. a configure script is run from inside it
+	#
+	# build directories made here are marked by the file build_dir_stamp
+	# holding the compiler launcher they are configured with
 
 	local repo=$1
 	shift
+	local builddir=$(build_dir_name)
 
 	if [ ! -d "$repo" ]; then
 		echo "Could not find directory $repo" >&2
@@ -203,21 +175,37 @@ configure_repo() {
 	(
 		echo
 		echo "#################################"
-		echo "#-- Configuring $(basename "$repo")"
+		echo "#-- Configuring $(basename "$repo")${REPOISER_CONFIGURATION:+ ($REPOISER_CONFIGURATION)}"
 		echo "#################################"
 
 		cd "$repo"
 
 		if [ -x "./configure" ]; then
-			./configure $@ 
+			if [ "$COMPILER_LAUNCHER" ]; then
+				export CC="$COMPILER_LAUNCHER ${CC:-cc}"
+				export CXX="$COMPILER_LAUNCHER ${CXX:-c++}"
+			fi
+			if [ "$builddir" == "build" ]; then
+				./configure $@ 
+			else
+				mkdir -p "$builddir" \
+					&& echo "$COMPILER_LAUNCHER" > "$builddir/$(build_dir_stamp)" \
+					&& cd "$builddir" && ../configure $@
+			fi
 			RET=$?
 		else
-			if ! mkdir build; then
+			if ! mkdir "$builddir"; then
 				echo "Could not make build directory" >&2
 				return 1
 			fi
-			cd build
-			cmake $@ ..
+			echo "$COMPILER_LAUNCHER" > "$builddir/$(build_dir_stamp)"
+			cd "$builddir"
+			if [ "$COMPILER_LAUNCHER" ]; then
+				cmake -DCMAKE_C_COMPILER_LAUNCHER="$COMPILER_LAUNCHER" \
+					-DCMAKE_CXX_COMPILER_LAUNCHER="$COMPILER_LAUNCHER" $@ ..
+			else
+				cmake $@ ..
+			fi
 		fi
 		return $RET
 	)
@@ -227,6 +215,7 @@ build_repo() {
 	# $1: folder containing the repository
 	# $2 to $@: options for make 
 	# builds a repository in folder $1
+	# (in the build directory REPOISER_BUILD_DIR or build)
 	# return status of make
 	#
 	# sets BUILDANYTHING to 1 if there have been any files built
@@ -234,6 +223,7 @@ build_repo() {
 
 	local repo=$1
 	shift
+	local builddir=$(build_dir_name)
 
 	# did we build anything?
 	BUILDANYTHING=0
@@ -248,63 +238,19 @@ build_repo() {
 	(
 		echo
 		echo "#################################"
-		echo "#-- Building $(basename "$repo")"
+		echo "#-- Building $(basename "$repo")${REPOISER_CONFIGURATION:+ ($REPOISER_CONFIGURATION)}"
 		echo "#################################"
 
-		cd "$repo/build"
+		cd "$repo/$builddir"
 		make $@
 	)
 	RET=$?
 	# do we have any updates:
-	find "$repo/build" -type f -newer "$TIMESTAMPFILE" -print -quit | grep -q "^" && BUILDANYTHING=1
+	find "$repo/$builddir" -type f -newer "$TIMESTAMPFILE" -print -quit | grep -q "^" && BUILDANYTHING=1
 	rm "$TIMESTAMPFILE"
 	return $RET
 }
 
-run_test() {
-	# $1: folder containing the repository
-	# run the tests for this repository
-	#
-	# if any of them fails, return 1
-
-	if ! have_failedfile; then
-		echo "run_test needs a failedfile to be configured. Run create_failedfile beforehand." >&2
-		exit 1
-	fi
-
-	local repo=$1
-
-	if [ ! -d "$repo" ]; then
-		echo "Could not find directory $repo" >&2
-		return 1
-	fi
-
-	(
-		RET=0
-
-		echo
-		echo "#################################"
-		echo "#-- Testing $(basename "$repo")"
-		echo "#################################"
-		cd "$repo/tests"
-
-		#TODO:  call make test or ctest if available 
-
-		find ../build/tests/ -maxdepth 1 -type f -executable | while read line; do
-			echo "Running $line ..."
-			$line |& tee ${line}.out | sed 's/^/   /g'
-			if < ${line}.out has_test_failed; then
-				echo "$line" >> "$FAILEDFILE"
-				RET=1
-			fi
-			rm ${line}.out
-			sleep 2
-			echo
-		done
-		return $RET
-	)
-}
-
 run_doxygen() {
 	# $1: folder containing the repository
 	# $2: options, e.g. "verbose" for verbose (full doxygen output shown)
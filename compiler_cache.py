@@ -0,0 +1,142 @@
+# vi: set et ts=4 sw=4 sts=4:
+
+import os
+from build_matrix import BUILD_DIRECTORY_STAMP
+from state_file import STATE_DIRECTORY
+
+# The counters in the statistics log marking a compilation found in the cache
+HIT_COUNTERS = { "direct_cache_hit", "preprocessed_cache_hit" }
+
+# The counters in the statistics log marking a compilation not found in the cache
+MISS_COUNTERS = { "cache_miss" }
+
+class compiler_cache:
+    """
+    Set up the environment for projects built using a compiler launcher like
+    ccache (see project_file.project.compiler_launcher) and collect the cache
+    statistics per project.
+
+    configure_repo from common.lib.sh passes the launcher given in the
+    environment variable COMPILER_LAUNCHER to cmake (as the compiler launcher)
+    or to configure scripts (by prefixing CC and CXX). For ccache the cache
+    directory and its maximal size are set as well and each compilation is
+    logged to a statistics file per project.
+
+    Since the launcher only takes effect when a build directory is configured,
+    configure_repo records it in the file BUILD_DIRECTORY_STAMP in the build
+    directory, such that launcher_changed() tells when it needs to be
+    configured again.
+    """
+
+    def __init__(self,directory=None,max_size=None,stats_directory=os.path.join(STATE_DIRECTORY,"ccache")):
+        """
+        directory:        The ccache directory, default: the one configured for ccache
+        max_size:         The maximal size of the cache as understood by ccache
+                          (e.g. 20G), default: the one configured for ccache
+        stats_directory:  The directory for the statistics files
+        """
+        self.__directory = None if directory is None else os.path.abspath(directory)
+        self.__max_size = max_size
+        self.__stats_directory = os.path.abspath(stats_directory)
+        self.__built = []
+
+    @staticmethod
+    def is_ccache(launcher):
+        """Is the compiler launcher ccache"""
+        return launcher is not None and os.path.basename(launcher.split()[0]) == "ccache"
+
+    def stats_file(self,project):
+        """The file the ccache statistics of project are logged to"""
+        return os.path.join(self.__stats_directory,project.name + ".log")
+
+    def environment(self,project,env=None):
+        """
+        Return a copy of the environment env (default os.environ) for
+        configuring and building project.
+        """
+        ret = dict(os.environ if env is None else env)
+        launcher = project.compiler_launcher
+        if launcher is None:
+            ret.pop("COMPILER_LAUNCHER",None)
+            return ret
+
+        ret["COMPILER_LAUNCHER"] = launcher
+        if compiler_cache.is_ccache(launcher):
+            if self.__directory is not None:
+                ret["CCACHE_DIR"] = self.__directory
+            if self.__max_size is not None:
+                ret["CCACHE_MAXSIZE"] = self.__max_size
+            ret["CCACHE_STATSLOG"] = self.stats_file(project)
+        return ret
+
+    @staticmethod
+    def launcher_changed(project):
+        """
+        Was the existing build directory of project (a build_matrix.configured_project)
+        configured with a different compiler launcher than the one it has now
+        (or is this unknown)
+        """
+        try:
+            with open(os.path.join(project.build_directory,BUILD_DIRECTORY_STAMP)) as f:
+                configured = f.read().strip()
+        except FileNotFoundError:
+            return True
+        return configured != (project.compiler_launcher or "")
+
+    def start_build(self,project):
+        """Reset the statistics of project before it is built"""
+        if not compiler_cache.is_ccache(project.compiler_launcher):
+            return
+        os.makedirs(self.__stats_directory,exist_ok=True)
+        try:
+            os.unlink(self.stats_file(project))
+        except FileNotFoundError:
+            pass
+        self.__built.append(project)
+
+    def statistics(self,project):
+        """
+        Tuple (hits, misses, other) of the number of compilations of project
+        during its last build, which were found in the cache, which were not
+        and which could not be cached at all (e.g. linking).
+        """
+        # ccache logs a line "# <source file>" for each compilation followed
+        # by all counters it incremented, e.g. both direct_cache_miss and
+        # cache_miss for a miss
+        records = []
+        try:
+            with open(self.stats_file(project)) as f:
+                for line in f:
+                    line = line.strip()
+                    if line.startswith("#") or len(records) == 0:
+                        records.append(set())
+                    if line != "" and not line.startswith("#"):
+                        records[-1].add(line)
+        except FileNotFoundError:
+            pass
+
+        hits, misses, other = 0, 0, 0
+        for counters in records:
+            if len(counters & HIT_COUNTERS) > 0:
+                hits += 1
+            elif len(counters & MISS_COUNTERS) > 0:
+                misses += 1
+            elif len(counters) > 0:
+                other += 1
+        return (hits, misses, other)
+
+    def print_summary(self):
+        """Print the cache statistics of all projects built using ccache"""
+        if len(self.__built) == 0:
+            return
+
+        width = max( [ len(p.label) for p in self.__built ] + [ 10 ] )
+        print()
+        print("Compiler cache statistics:")
+        print("  " + "repository".ljust(width) + "hits".rjust(8) + "misses".rjust(8)
+                + "uncached".rjust(10) + "hit rate".rjust(10))
+        for p in self.__built:
+            hits, misses, other = self.statistics(p)
+            rate = "-" if hits + misses == 0 else "{0:.0f}%".format(100 * hits / (hits + misses))
+            print("  " + p.label.ljust(width) + str(hits).rjust(8) + str(misses).rjust(8)
+                    + str(other).rjust(10) + rate.rjust(10))
@@ -15,27 +15,99 @@ usage() {
 	-j <N>
 	--jobs <N>
 	The number of jobs to use for building, default on this machine: $(noCPUs)
+	This is the total for all repositories built at the same time, which
+	share the job slots using a make jobserver.
+
+	-w <N>
+	--workers <N>
+	The number of repositories to configure, build and test at the same
+	time. A repository is started as soon as all its dependencies are
+	done, default: 1
+
+	--project <project.yaml>
+	The project file describing the dependencies between the repositories,
+	default: The file given to setup_checkout.sh
 
 	-k
 	--keep-going
-	If configuring/making a repo fails, do not exit, but proceed to the next
-	on the list
+	If configuring/making a repo fails, do not exit, but proceed with all
+	repos not depending on it. The repos depending on a failed one are
+	skipped.
 	Cancels the effect of -S, the last one counts.
 
 	-S
 	--no-keep-going
 	--strict
 	--stop
-	Stop compiling/making as soon as an error happens
+	Stop compiling/making as soon as an error happens. Configuring,
+	building or testing a repo is aborted as soon as its output shows an
+	error and everything else still running is cancelled.
 	Cancels the effect of a -k, the last one counts.
 
 	--tests
-	Always run the tests (even if no file changed during the make)
+	Always run the tests (even if no file changed during the make). This
+	also runs the tests, which passed before and did not change since
+	(otherwise they are reported as cached-pass).
+
+	--test-jobs <N>
+	The number of tests to run at the same time, default: $(noCPUs)
+
+	--test-timeout <seconds>
+	Kill tests running longer than this and count them as failed
+
+	The test results are written to .repoiser/test_results as results.json
+	and junit.xml
 
 	--doxygen
 	--docs
 	Build the doxygen documentation as well if it is available.
 
+	--trace <trace.json>
+	Write a timeline of all phases for all repos to this file, which can be
+	viewed in chrome://tracing or Perfetto, and print a summary of the time
+	spent including the critical path through the dependency graph.
+
+	--memory-budget <size>
+	The memory (e.g. 16G) all builds and tests together may use. Builds,
+	tests and make jobs are only started while the peak memory recorded
+	for them in previous runs fits into the budget and into the memory
+	currently available, default: the memory available at the start
+
+	--max-load <load>
+	Do not start builds, tests or make jobs while the load average is
+	above this value
+
+	--artifact-dir <directory>
+	Directory with cached builds, which may be shared between workspaces
+	and CI runners on the same machine. Builds of repos whose sources,
+	configure options, toolchain and dependencies did not change are
+	restored from there, default: \$REPOISER_ARTIFACT_DIR (if unset, no
+	builds are cached)
+
+	--artifact-size <size>
+	Maximal size of the artifact directory, e.g. 50G. The least recently
+	used builds are removed once it is exceeded.
+
+	--ccache-dir <directory>
+	The ccache directory for the repos whose project policy or project
+	sets ccache as the compiler_launcher. It may be shared between
+	workspaces, default: \$REPOISER_CCACHE_DIR (if unset, the directory
+	configured for ccache)
+
+	--ccache-size <size>
+	Maximal size of the ccache directory, e.g. 20G
+
+	-v
+	--verbose
+	Show the output of configuring, building and testing while it is
+	produced, each line prefixed by its repo.
+
+	--plan
+	Print the order in which the repos are expected to be processed and
+	the expected total time, based on the durations recorded in previous
+	runs, and exit. Repos on the longest remaining path through the
+	dependency graph are always started first.
+
 	--dry-run
 	Only perform a dry run (print what is done, but don't do it)
 	(TODO: not fully implemented: Currently just prints a summary and exits)
@@ -49,46 +121,88 @@ usage() {
 
 	--only <repo1>:<repo2>: ...
 	Only do the tasks on the repos matching these patterns
-	EOF
-}
 
-cleanup() {
-	cleanup_failedfile || exit 1
+	--with-dependencies
+	Also do the tasks on all repos the repos selected by --only depend on,
+	e.g. --only adcman --with-dependencies for adcman and everything it
+	needs. The repos matching --exclude are still excluded.
+
+	--with-dependents
+	Also do the tasks on all repos depending on the repos selected by
+	--only
+
+	--changed <repo1>:<repo2>: ...
+	Only do the tasks on the given repos and the repos depending on them
+	(in dependency order), e.g. after the given repos have been modified
+
+	--changed-file <file>
+	Only do the tasks on the repos listed in this file (one per line) and
+	the repos depending on them, e.g. the file written by
+	checkout.py --only-changed --changed-output <file>
+
+	--changed-vcs
+	Only do the tasks on the repos with new commits since their last
+	successful build and the repos depending on them.
+
+	--configuration <name>[=<options>]
+	Build in this configuration, in the build directory build-<name>
+	of each repo, may be given several times. <name> alone selects a
+	build configuration of the project file, <name>=<options> defines
+	one with these options for configure or cmake. All configurations
+	share the checkout and are built concurrently. Default: all
+	configurations of the project file or, if it has none, a single
+	build in the build directory of each repo
+	EOF
 }
 
 print_settings() {
 	cat <<- EOF
 	Options to configure:        $CONF_OPT
-	Options to make:             $MAKE_OPT  (use -n, -j, -k, -S to change)
+	Options to make:             $MAKE_OPT  (use -n, -k, -S to change)
+	Jobs for all repos together: $NJOBS        (use -j to change)
 	Strict / keep going:         $STRICT / $KEEP_GOING    (use -S, -k to change)
+	Repos processed in parallel: $NWORKERS        (use -w to change)
 	Generate docs with doxygen:  $DOXYGEN        (use --docs to change)
 
 	Reading repos from:          $CONFIGFILE
-	Repos considered and their order:      (use --exclude or --only to change):
+	Reading dependencies from:   $PROJECTFILE
+	Repos considered and their order:      (use --exclude, --only or --with-dependencies to change):
 	$(echo "$REPOS" | sed 's/^/    /')
 
 	EOF
 }
 
-die_or_keep_going() {
-	# die only if keep-going is not set
-	[ "$KEEP_GOING" == "n" ] && die $@
-	echo $@ >&2
-}
-
 #--------------------------------------------------------------------
 
 FORCE_TESTS=n	# force running the tests even if no compilation took place
+TEST_JOBS=$(noCPUs)		# number of tests to run at once
+TEST_TIMEOUT=""			# timeout for each test
 KEEP_GOING=n	# keep running if errors occurr in compilation
 STRICT=n	# stop as soon as error happens
 NJOBS=$(noCPUs)			# number of jobs to use
+NWORKERS=1			# number of repos to process at once
+PROJECTFILE=$(default_project)	# project file with the dependencies
 CONFIGFILE=$(default_config)	# config file to use
 EXCLUDE=""			# repos to exclude
 ONLY=""				# only work on these repos
+SELECT_OPT=""			# further options for selecting the repos
 CONF_OPT=""			# configure options
+CONFIGURATIONS=()		# build configurations to use
 MAKE_OPT="-j $NJOBS -k"		# make options
 DRYRUN="n"			# just have a dry run
 DOXYGEN=n			# build doxygen documentation
+TRACE=""			# file to write the timeline to
+CHANGED=""			# only work on these repos and their dependents
+CHANGED_FILE=""			# file listing the changed repos
+CHANGED_VCS=n			# detect changed repos from the checked out revisions
+PLAN=n				# only print the expected schedule
+VERBOSE=n			# show all output prefixed by the repos
+MEMORY_BUDGET=""		# memory all builds and tests may use together
+MAX_LOAD=""			# maximal load average to start new work
+ARTIFACT_DIR="$REPOISER_ARTIFACT_DIR"	# cache of builds
+ARTIFACT_SIZE=""		# maximal size of the cache of builds
+CCACHE_DIR_OPT="$REPOISER_CCACHE_DIR"	# ccache directory
+CCACHE_SIZE=""			# maximal size of the ccache directory
 
 while [ "$1" ]; do
 	case "$1" in 
@@ -107,15 +221,32 @@ while [ "$1" ]; do
 		--tests)
 			FORCE_TESTS=y
 			;;
+		--test-jobs)
+			shift
+			TEST_JOBS=$1
+			;;
+		--test-timeout)
+			shift
+			TEST_TIMEOUT=$1
+			;;
 		--jobs|-j)
 			shift
 			NJOBS=$1
 			;;
+		--workers|-w)
+			shift
+			NWORKERS=$1
+			;;
 		--config)
 			shift
 			[ -f "$1" ] || die "Cannot find file: $1"
 			CONFIGFILE="$1"
 			;;
+		--project)
+			shift
+			[ -f "$1" ] || die "Cannot find file: $1"
+			PROJECTFILE="$1"
+			;;
 		--exclude)
 			shift
 			EXCLUDE="$1"
@@ -127,10 +258,66 @@ while [ "$1" ]; do
 			shift
 			ONLY="$1"
 			;;
+		--with-dependencies)
+			SELECT_OPT="$SELECT_OPT --with-dependencies"
+			;;
+		--with-dependents)
+			SELECT_OPT="$SELECT_OPT --with-dependents"
+			;;
+		--changed)
+			shift
+			CHANGED="$1"
+			;;
+		--changed-file)
+			shift
+			[ -f "$1" ] || die "Cannot find file: $1"
+			CHANGED_FILE="$1"
+			;;
+		--changed-vcs)
+			CHANGED_VCS=y
+			;;
 		--conf-opt)
 			shift
 			CONF_OPT="$1"
 			;;
+		--configuration)
+			shift
+			CONFIGURATIONS+=(--configuration "$1")
+			;;
+		--trace)
+			shift
+			TRACE="$1"
+			;;
+		--memory-budget)
+			shift
+			MEMORY_BUDGET="$1"
+			;;
+		--max-load)
+			shift
+			MAX_LOAD="$1"
+			;;
+		--artifact-dir)
+			shift
+			ARTIFACT_DIR="$1"
+			;;
+		--artifact-size)
+			shift
+			ARTIFACT_SIZE="$1"
+			;;
+		--ccache-dir)
+			shift
+			CCACHE_DIR_OPT="$1"
+			;;
+		--ccache-size)
+			shift
+			CCACHE_SIZE="$1"
+			;;
+		--verbose|-v)
+			VERBOSE=y
+			;;
+		--plan)
+			PLAN=y
+			;;
 		--dry-run|-n)
 			DRYRUN=y
 			;;
@@ -143,58 +330,48 @@ shift
 done
 
 # build the make options:
-MAKE_OPT="-j $NJOBS"
+# (the number of jobs is handled by the jobserver of the orchestrator)
 if [ "$STRICT" == "y" ]; then
-	MAKE_OPT="$MAKE_OPT -S"
+	MAKE_OPT="-S"
 else
-	MAKE_OPT="$MAKE_OPT -k"
+	MAKE_OPT="-k"
 fi
 [ "$DRYRUN" == "y" ] && MAKE_OPT="$MAKE_OPT --dry-run"
 
 # get the list of repos we consider:
-REPOS=$(get_repos "$CONFIGFILE" "$EXCLUDE" "$ONLY") || die "Could not obtain list of repos"
+[ -f "$PROJECTFILE" ] || die "Could not find the project file. Please specify it using --project"
+REPOS=$(get_repos "$CONFIGFILE" "$EXCLUDE" "$ONLY" --project "$PROJECTFILE" $SELECT_OPT) \
+	|| die "Could not obtain list of repos"
 
 print_settings
 [ "$DRYRUN" == "y" ] && exit 0
 
-create_failedfile
-trap cleanup EXIT
-
 echo
 echo ----------------------------------
 echo
 
-for repo in $REPOS; do
-	if [ ! -d "$repo" ]; then
-		die "Could not find directory $repo"
-		continue
-	fi
-
-	# configure:
-	if ! have_build "$repo"; then
-		if ! configure_repo "$repo" $CONF_OPT; then
-			die_or_keep_going "Could not configure repository $repo."
-			continue
-		fi
-	fi	
-
-	# now build:
-	if ! build_repo "$repo" $MAKE_OPT; then
-		die_or_keep_going "Could not build repo $repo"
-		continue
-	fi
-
-	# if there have been updates (i.e. if any files were made):	
-	if [[ "$BUILDANYTHING" == "1" || "$FORCE_TESTS" == "y" ]]; then
-		run_test "$repo"
-	else 
-		echo
-		echo "skipping tests for $repo (use --tests to force tests)"
-	fi
-
-	if [ "$DOXYGEN" == "y" ] && have_doxyfile "$repo"; then
-		run_doxygen "$repo"
-	fi
-done
-
-exit # exit code determined by cleanup_failedfile
+# options for the orchestrator:
+ORCH_OPT=""
+[ "$KEEP_GOING" == "y" ] && ORCH_OPT="$ORCH_OPT --keep-going"
+[ "$FORCE_TESTS" == "y" ] && ORCH_OPT="$ORCH_OPT --tests"
+[ "$TEST_TIMEOUT" ] && ORCH_OPT="$ORCH_OPT --test-timeout $TEST_TIMEOUT"
+[ "$DOXYGEN" == "y" ] && ORCH_OPT="$ORCH_OPT --docs"
+[ "$TRACE" ] && ORCH_OPT="$ORCH_OPT --trace $TRACE"
+[ "$CHANGED" ] && ORCH_OPT="$ORCH_OPT --changed=$CHANGED"
+[ "$CHANGED_FILE" ] && ORCH_OPT="$ORCH_OPT --changed-file $CHANGED_FILE"
+[ "$CHANGED_VCS" == "y" ] && ORCH_OPT="$ORCH_OPT --changed-vcs"
+[ "$PLAN" == "y" ] && ORCH_OPT="$ORCH_OPT --plan"
+[ "$STRICT" == "y" ] && ORCH_OPT="$ORCH_OPT --abort-early --strict"
+[ "$VERBOSE" == "y" ] && ORCH_OPT="$ORCH_OPT --verbose"
+[ "$MEMORY_BUDGET" ] && ORCH_OPT="$ORCH_OPT --memory-budget $MEMORY_BUDGET"
+[ "$MAX_LOAD" ] && ORCH_OPT="$ORCH_OPT --max-load $MAX_LOAD"
+[ "$ARTIFACT_DIR" ] && ORCH_OPT="$ORCH_OPT --artifact-dir $ARTIFACT_DIR"
+[ "$ARTIFACT_SIZE" ] && ORCH_OPT="$ORCH_OPT --artifact-size $ARTIFACT_SIZE"
+[ "$CCACHE_DIR_OPT" ] && ORCH_OPT="$ORCH_OPT --ccache-dir $CCACHE_DIR_OPT"
+[ "$CCACHE_SIZE" ] && ORCH_OPT="$ORCH_OPT --ccache-size $CCACHE_SIZE"
+
+# configure, build and test the repos in parallel:
+$(dirname $0)/orchestrator.py --project "$PROJECTFILE" --workers "$NWORKERS" \
+	--conf-opt="$CONF_OPT" --make-opt="$MAKE_OPT" \
+	--jobs "$NJOBS" --test-jobs "$TEST_JOBS" "${CONFIGURATIONS[@]}" $ORCH_OPT -- $REPOS
+exit # exit code determined by the orchestrator
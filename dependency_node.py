@@ -6,18 +6,22 @@ from collections.abc import Iterable
 class CyclicGraphException(Exception):
     """
     Exception thrown when a circular dependency is detected when parsing the dependency graph
+    attribute cycle contains the list of nodes forming the cycle (if known)
     """
-    def __init__(self,message):
+    def __init__(self,message,cycle=None):
         super(CyclicGraphException, self).__init__(message)
+        self.cycle = cycle
 
 class DepedencyResolutionError(Exception):
     """
     Exception thrown when some dependencies could nod be resolved
-    attribute deps containes the list of unresolved dependencies
+    attribute deps containes the set of unresolved dependencies
+    attribute cycles containes the list of cycles (as sets of nodes) among them
     """
-    def __init__(self,deps):
+    def __init__(self,deps,cycles=None):
         super(DepedencyResolutionError, self).__init__("Some dependencies could not be resolved")
         self.deps = deps
+        self.cycles = cycles or []
 
 class dependency_node: #(metaclass=ABCMeta):
     """A node of an dependency graph that only supports downward traversal
@@ -56,38 +60,29 @@ class dependency_node: #(metaclass=ABCMeta):
         Per default acc just accepts any input and returns None and 
         init is None as well.
 
+        Every direct or indirect dependency is visited exactly once, even
+        if it can be reached along several paths, and always after all its
+        own dependencies. The cost is linear in the number of nodes plus
+        the number of edges reachable from this node.
+
         Note that the function is not applied to the root node
         """
-        return self._apply_all_inner(self,f,*args,op=op, is_root_node=True,init=init)
+        val = init
+        for dep in self._iter_dependencies():
+            val = op(val, f(dep,*args) )
+        return val
 
-    def _apply_all_inner(self,root,f,*args,
-            op=(lambda x,y: None), init=None, is_root_node=False):
+    def _iter_dependencies(self):
         """
-        root:    reference to the root node (to check for circles)
+        Generator over all direct or indirect dependencies of this node in
+        depth-first post-order, i.e. each node is yielded once and after all
+        of its dependencies. The root node itself is not yielded.
 
-        f:       function to apply
-        args:    args for the function f
-        is_root_node:  is the current self the root node?
-
-        op:      accumulator operation to use
-        init:    value accumulator should be initialised with
+        Raises CyclicGraphException if a cycle is reachable from this node.
         """
-
-        val = init
-
-        # check if current self is the root, althogh we already traversed the tree
-        if (not is_root_node and self == root):
-            raise CyclicGraphException("Circular dependencies detected.")
-
-        # do depth-first tree traversal:
-        for dep in self.depends_on():
-            val =  dep._apply_all_inner(root,f,*args, op=op, init=val)
-
-        if is_root_node:
-            # f should not be applied to the root node
-            return val
-        else:
-            return op(val, f(self,*args) )
+        for node in _postorder([ self ]):
+            if node is not self:
+                yield node
 
     def has_dependencies(self):
         if self.depends_on() is None:
@@ -114,11 +109,16 @@ class dependency_node: #(metaclass=ABCMeta):
         except dependency_node._AbortApply as a:
             return a.value
 
-    def depends_on_recursive(self):
-        """Get a set of all direct or indirect dependencies"""
-        depends = lambda s: s.depends_on()
-        union = lambda s,t : s.union(t)
-        return self.apply_dependencies(depends,op=union,init=self.depends_on())
+    def depends_on_recursive(self,index=None):
+        """
+        Get a set of all direct or indirect dependencies
+
+        index:   Optional graph_index.graph_index containing this node.
+                 If given the precomputed closure of the index is used.
+        """
+        if index is not None:
+            return index.descendants(self)
+        return set(self._iter_dependencies())
 
     def build_batches(self):
         """
@@ -138,15 +138,20 @@ class dependency_node: #(metaclass=ABCMeta):
         """
         return build_batches(self.depends_on_recursive().union({self}))
 
-def build_recursive_dependency_set(root_nodes,include_roots=True):
+def build_recursive_dependency_set(root_nodes,include_roots=True,index=None):
     """
     Build a set of nodes that contains the given nodes and all their dependencies
 
     include_roots=False   do not include the root nodes given in the iterable nodes
+    index                 Optional graph_index.graph_index containing the nodes,
+                          which is used to look up the dependencies
     """
     if not isinstance(root_nodes,Iterable):
         raise TypeError("root_nodes needs to be an Itarable of dependency_nodes")
 
+    if index is not None:
+        return index.descendants_of_all(root_nodes,include_roots=include_roots)
+
     recursive_dependencies = set()
     for p in root_nodes:
         if not isinstance(p,dependency_node):
@@ -160,6 +165,194 @@ def build_recursive_dependency_set(root_nodes,include_roots=True):
 
     return recursive_dependencies
 
+def _postorder(roots):
+    """
+    Generator over the nodes in the iterable roots and all their direct or
+    indirect dependencies in depth-first post-order, i.e. each node is
+    yielded once and after all of its dependencies.
+
+    The traversal uses an explicit stack, so the depth of the graph is
+    not limited by the recursion limit of python.
+
+    Raises CyclicGraphException if a cycle is reachable from the roots.
+    """
+    # nodes on the current path are "open", fully traversed ones "done"
+    OPEN, DONE = 1, 2
+    state = dict()
+
+    for root in roots:
+        if root in state:
+            continue
+
+        state[root] = OPEN
+        path = [ root ]
+        stack = [ iter(root.depends_on() or ()) ]
+
+        while len(stack) > 0:
+            for dep in stack[-1]:
+                dep_state = state.get(dep)
+                if dep_state is None:
+                    # descend into dep
+                    state[dep] = OPEN
+                    path.append(dep)
+                    stack.append(iter(dep.depends_on() or ()))
+                    break
+                elif dep_state == OPEN:
+                    # dep is on the current path: back edge
+                    cycle = path[path.index(dep):]
+                    raise CyclicGraphException("Circular dependencies detected.",cycle)
+            else:
+                # all dependencies of the top node are done
+                stack.pop()
+                node = path.pop()
+                state[node] = DONE
+                yield node
+
+def topological_order(nodes):
+    """
+    Return a list of the nodes in the iterable nodes and all their direct or
+    indirect dependencies, such that each node comes after all its dependencies.
+
+    Raises CyclicGraphException if the graph contains a cycle.
+    """
+    if not isinstance(nodes,Iterable):
+        raise TypeError("nodes has to be an iterable of dependency_node objects")
+    return list(_postorder(nodes))
+
+def critical_path(nodes,weight):
+    """
+    Find the critical path through the dependency graph spanned by the nodes
+    in the iterable nodes, i.e. the chain of dependencies with the largest
+    total weight. Dependencies which are not amongst the nodes are ignored.
+
+    weight:   Function returning the weight (e.g. the duration) of a node
+
+    Returns a tuple (length, path), where path is the list of nodes on the
+    critical path, starting with the one that needs to be processed first.
+    """
+    if not isinstance(nodes,Iterable):
+        raise TypeError("nodes has to be an iterable of dependency_node objects")
+
+    nodeset = set(nodes)
+    if len(nodeset) == 0:
+        return (0, [])
+
+    finish = dict()     # length of the longest path ending at a node
+    previous = dict()   # the predecessor of the node on this path
+    for node in topological_order(nodeset):
+        if node not in nodeset:
+            continue
+
+        previous[node] = None
+        start = 0
+        for dep in (node.depends_on() or ()):
+            if dep in nodeset and (previous[node] is None or finish[dep] > start):
+                previous[node] = dep
+                start = finish[dep]
+        finish[node] = start + weight(node)
+
+    node = max(finish,key=finish.get)
+    length = finish[node]
+    path = []
+    while node is not None:
+        path.append(node)
+        node = previous[node]
+    return (length, path[::-1])
+
+def remaining_path_lengths(nodes,weight):
+    """
+    For each node in the iterable nodes compute the length of the longest chain
+    of nodes depending on it (directly or indirectly), including the node itself,
+    where the length is the sum of weight(node) over the chain. This is the least
+    time needed to finish all work once the node is started and nodes with larger
+    values should be started first. Dependencies which are not amongst the nodes
+    are ignored.
+
+    weight:   Function returning the weight (e.g. the duration) of a node
+
+    Returns a dict from the nodes to the lengths.
+    """
+    if not isinstance(nodes,Iterable):
+        raise TypeError("nodes has to be an iterable of dependency_node objects")
+
+    nodeset = set(nodes)
+    ret = dict()
+    # each node depending on a node comes later in topological order
+    for node in reversed(topological_order(nodeset)):
+        if node not in nodeset:
+            continue
+        ret[node] = ret.get(node,0) + weight(node)
+
+        # propagate to the dependencies, ret[node] is final now
+        for dep in (node.depends_on() or ()):
+            if dep in nodeset:
+                ret[dep] = max(ret.get(dep,0),ret[node])
+    return ret
+
+def find_cycles(nodes):
+    """
+    Find all cycles in the dependency graph spanned by the iterable nodes and
+    their direct or indirect dependencies.
+
+    Returns a list of sets of dependency_node objects. Each set is a
+    strongly connected component of the graph, i.e. a maximal set of nodes
+    which all depend on each other. Only components which actually contain
+    a cycle are returned.
+
+    This is Tarjan's algorithm with an explicit stack, so the cost is
+    linear in the number of nodes plus the number of edges.
+    """
+    if not isinstance(nodes,Iterable):
+        raise TypeError("nodes has to be an iterable of dependency_node objects")
+
+    index = dict()      # node -> order of discovery
+    lowlink = dict()    # node -> smallest index reachable
+    on_stack = set()
+    component_stack = []
+    ret = []
+
+    for root in nodes:
+        if root in index:
+            continue
+
+        index[root] = lowlink[root] = len(index)
+        component_stack.append(root)
+        on_stack.add(root)
+        path = [ root ]
+        stack = [ iter(root.depends_on() or ()) ]
+
+        while len(stack) > 0:
+            node = path[-1]
+            for dep in stack[-1]:
+                if dep not in index:
+                    index[dep] = lowlink[dep] = len(index)
+                    component_stack.append(dep)
+                    on_stack.add(dep)
+                    path.append(dep)
+                    stack.append(iter(dep.depends_on() or ()))
+                    break
+                elif dep in on_stack:
+                    lowlink[node] = min(lowlink[node],index[dep])
+            else:
+                stack.pop()
+                path.pop()
+                if len(path) > 0:
+                    lowlink[path[-1]] = min(lowlink[path[-1]],lowlink[node])
+
+                if lowlink[node] == index[node]:
+                    # node is the root of a strongly connected component
+                    component = set()
+                    while True:
+                        member = component_stack.pop()
+                        on_stack.discard(member)
+                        component.add(member)
+                        if member is node:
+                            break
+
+                    if len(component) > 1 or node in (node.depends_on() or ()):
+                        ret.append(component)
+    return ret
+
 def build_batches(nodes):
     """
     Parse the dependency tree of this dependency node and return
@@ -173,8 +366,11 @@ def build_batches(nodes):
     The current node (self) will be at the very top, ie. the last batch to be
     processed.
     """
-    # This code is adapted from
-    # https://breakingcode.wordpress.com/2013/03/11/an-example-dependency-resolution-algorithm-in-python/
+    # This is Kahn's algorithm: We keep the number of unresolved
+    # dependencies for each node and an index from each node to the
+    # nodes depending on it. Resolving a node only touches its dependents,
+    # such that the total cost is linear in the number of nodes plus the
+    # number of edges.
 
     if not isinstance(nodes,Iterable):
         raise TypeError("nodes has to be an iterable of dependency_node objects")
@@ -182,27 +378,41 @@ def build_batches(nodes):
     # object to store the return
     ret = []
 
-    # build a dict from the input nodes to the set of dependencies,
-    # which are currently unresolved
-    nodes_to_unres_deps = dict( (node, set(node.depends_on()) ) for node in nodes )
-
-    while len(nodes_to_unres_deps) > 0:
-        # get the set of all nodes with no dependencies and which describe themself fulfilled dependencies:
-        ready = { node for node, dependencies in nodes_to_unres_deps.items() if (len(dependencies) == 0 and node.is_fulfilled()) }
-
-        # If there are none, we have a circular dependency somewhere
-        if len(ready) == 0:
-            raise DepedencyResolutionError(nodes_to_unres_deps.keys)
-
-        # mark the ready guys as fulfilled dependencies:
+    # the number of unresolved dependencies for each input node
+    # and the input nodes directly depending on each input node.
+    # Note that dependencies which are not amongst the input nodes
+    # can never be resolved.
+    n_unres_deps = dict()
+    dependents = dict( (node, []) for node in nodes )
+    for node in dependents:
+        deps = set(node.depends_on() or ())
+        n_unres_deps[node] = len(deps)
+        for dep in deps:
+            if dep in dependents:
+                dependents[dep].append(node)
+
+    # nodes with no dependencies and which describe themself fulfilled dependencies:
+    ready = { node for node, n in n_unres_deps.items() if (n == 0 and node.is_fulfilled()) }
+    n_resolved = 0
+
+    while len(ready) > 0:
+        ret.append(ready)
+        n_resolved += len(ready)
+
+        # mark the ready guys as fulfilled dependencies
+        # and collect the nodes which become ready by this:
+        next_ready = set()
         for node in ready:
-            # remove the nodes
-            del nodes_to_unres_deps[node]
-        for deps in nodes_to_unres_deps.values():
-            # update the dependencies
-            deps.difference_update(ready)
-
-        # add the batches to the list:
-        ret.append( { node for node in ready } )
+            for dependent in dependents[node]:
+                n_unres_deps[dependent] -= 1
+                if n_unres_deps[dependent] == 0 and dependent.is_fulfilled():
+                    next_ready.add(dependent)
+        ready = next_ready
+
+    # If not all could be resolved, we have a circular dependency,
+    # an unfulfilled node or a dependency missing from the input somewhere
+    if n_resolved < len(n_unres_deps):
+        unresolved = { node for node, n in n_unres_deps.items() if (n > 0 or not node.is_fulfilled()) }
+        raise DepedencyResolutionError(unresolved,find_cycles(unresolved))
 
     return ret
@@ -0,0 +1,103 @@
+# vi: set et ts=4 sw=4 sts=4:
+
+import hashlib
+import os
+import threading
+import vcs
+from build_matrix import is_build_directory
+from dependency_node import topological_order
+
+# Directories never considered part of the sources of a project
+# (besides the build directories)
+IGNORED_DIRECTORIES = { ".git", ".svn" }
+
+def __hash_file(h,path):
+    """Update the hash object h with the content of the file path"""
+    try:
+        if os.path.islink(path):
+            h.update(b"link:" + os.readlink(path).encode())
+            return
+        with open(path,"rb") as f:
+            for block in iter(lambda: f.read(1 << 20),b""):
+                h.update(block)
+    except FileNotFoundError:
+        h.update(b"deleted")
+
+def source_hash(project):
+    """
+    Hash of the tracked sources of the project_file.project project.
+
+    If the version control system can be queried, this is a hash of the checked
+    out revision plus the content of all locally modified files. Otherwise all
+    files in the project directory (apart from the build directories) are hashed.
+    """
+    h = hashlib.sha256()
+
+    rev = vcs.revision(project)
+    modified = vcs.modified_files(project)
+    if rev is not None and modified is not None:
+        h.update(b"revision:" + rev.encode() + b"\0")
+        for path in sorted(modified):
+            h.update(path.encode() + b"\0")
+            __hash_file(h,os.path.join(project.directory,path))
+            h.update(b"\0")
+        return h.hexdigest()
+
+    for dirpath, dirnames, filenames in os.walk(project.directory):
+        dirnames[:] = sorted( d for d in dirnames if not (dirpath == project.directory
+            and (d in IGNORED_DIRECTORIES or is_build_directory(os.path.join(dirpath,d)))) )
+        for f in sorted(filenames):
+            path = os.path.join(dirpath,f)
+            h.update(os.path.relpath(path,project.directory).encode() + b"\0")
+            __hash_file(h,path)
+            h.update(b"\0")
+    return h.hexdigest()
+
+class fingerprinter:
+    """
+    Compute fingerprints of projects, i.e. hashes which change whenever the project
+    needs to be rebuilt. The fingerprint of a project is made up of the hash of
+    its tracked sources, the configure options, the environment variables of its
+    build configuration, its compiler launcher and the fingerprints of all
+    projects it depends upon.
+
+    Fingerprints are computed once per project and cached, which is safe from
+    several threads.
+    """
+
+    def __init__(self,conf_opt=[],environment={}):
+        """
+        conf_opt:     The list of options passed to configure or cmake
+        environment:  Dict of the environment variables set by the build
+                      configuration (e.g. CC)
+        """
+        self.__conf_opt = list(conf_opt)
+        self.__environment = sorted(environment.items())
+        self.__fingerprints = dict()
+        self.__lock = threading.Lock()
+
+    def fingerprint(self,project):
+        """The fingerprint of a project (or build_matrix.configured_project) as a hex string"""
+        # compute the fingerprints of all dependencies first:
+        for node in topological_order([ project ]):
+            with self.__lock:
+                if node in self.__fingerprints:
+                    continue
+
+            # fingerprints of the dependencies (in a fixed order):
+            deps = sorted( (d.name, self.__fingerprints[d]) for d in node.depends_on() )
+
+            h = hashlib.sha256()
+            h.update(b"sources:" + source_hash(node).encode() + b"\0")
+            for opt in self.__conf_opt:
+                h.update(b"conf_opt:" + opt.encode() + b"\0")
+            for var, value in self.__environment:
+                h.update(b"environment:" + var.encode() + b"=" + value.encode() + b"\0")
+            h.update(b"compiler_launcher:" + (node.compiler_launcher or "").encode() + b"\0")
+            for name, fp in deps:
+                h.update(b"dependency:" + name.encode() + b":" + fp.encode() + b"\0")
+
+            with self.__lock:
+                self.__fingerprints[node] = h.hexdigest()
+
+        return self.__fingerprints[project]
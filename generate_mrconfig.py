@@ -4,17 +4,22 @@
 import argparse
 import project_file
 from dependency_node import dependency_node,build_batches,build_recursive_dependency_set
+from graph_index import graph_index
 from collections.abc import Iterable
 import itertools
 
-def build_mrconfig(projects):
-    """Resolve all dependencies and build mrconfig for projects"""
+def build_mrconfig(projects,index=None):
+    """
+    Resolve all dependencies and build mrconfig for projects
+
+    index:   Optional graph_index.graph_index containing the projects
+    """
 
     if not isinstance(projects,Iterable):
         raise TypeError("projects needs to be an Itarable of project_file.projects")
 
     # get all recursive dependencies:
-    recursive_dependencies = build_recursive_dependency_set(projects)
+    recursive_dependencies = build_recursive_dependency_set(projects,index=index)
 
     # arrange them in batches:
     batches = build_batches(recursive_dependencies)
@@ -31,11 +36,13 @@ def build_mrconfig(projects):
 
     return string
 
-parser = argparse.ArgumentParser(description="Generate an .mrconfig file from a project.yaml file, resolving the dependencies properly")
-parser.add_argument("config", metavar="project.yaml", type=str, help="The path to project.yaml file")
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate an .mrconfig file from a project.yaml file, resolving the dependencies properly")
+    parser.add_argument("config", metavar="project.yaml", type=str, help="The path to project.yaml file")
 
-args = parser.parse_args()
+    args = parser.parse_args()
 
-with open(args.config) as f:
-    config = project_file.reader(f)
-    print(build_mrconfig(config.default_projects))
+    with open(args.config) as f:
+        config = project_file.reader(f)
+        index = graph_index.from_reader(config)
+        print(build_mrconfig(config.default_projects,index=index))
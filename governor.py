@@ -0,0 +1,203 @@
+# vi: set et ts=4 sw=4 sts=4:
+
+import asyncio
+import os
+import threading
+from contextlib import contextmanager, asynccontextmanager
+
+# Peak memory in bytes assumed for a process we know nothing about
+DEFAULT_RSS = 512 * 1024**2
+
+# Interval in seconds in which the memory and load are checked
+POLL_INTERVAL = 1.0
+
+def read_meminfo(path="/proc/meminfo"):
+    """Dict from the fields of /proc/meminfo to their values in bytes"""
+    ret = dict()
+    with open(path) as f:
+        for line in f:
+            key, _, value = line.partition(":")
+            parts = value.split()
+            if len(parts) == 0:
+                continue
+            factor = 1024 if len(parts) > 1 and parts[1] == "kB" else 1
+            ret[key] = int(parts[0]) * factor
+    return ret
+
+def available_memory():
+    """The memory in bytes available for new processes without swapping"""
+    info = read_meminfo()
+    if "MemAvailable" in info:
+        return info["MemAvailable"]
+    # kernels before 3.14:
+    return info["MemFree"] + info.get("Buffers",0) + info.get("Cached",0)
+
+class resource_governor:
+    """
+    Admit new builds, tests and make jobs only as long as the memory they are
+    expected to use fits into a memory budget and the load is not too high.
+
+    The memory a phase of a repository needs is the peak resident set size
+    recorded in previous runs. The governor only uses /proc/meminfo and the
+    load average, hence no special privileges (e.g. for cgroups) are needed.
+
+    If a jobserver.jobserver is watched, tokens are taken out of it while the
+    available memory or the load would not allow another make job and given
+    back once they do.
+    """
+
+    def __init__(self,memory_budget=None,max_load=None,peaks=None):
+        """
+        memory_budget:  Memory in bytes all admitted processes together may use,
+                        default: The memory available when the governor is created
+        max_load:       Do not admit anything while the load average is above
+                        this value, default: no limit
+        peaks:          Optional state_file in which the peak resident set size
+                        of the phases is recorded
+        """
+        self.__budget = memory_budget if memory_budget is not None else available_memory()
+        self.__max_load = max_load
+        self.__peaks = peaks
+
+        self.__reserved = dict()    # reservation id -> bytes
+        self.__next_id = 0
+        self.__condition = threading.Condition()
+
+        self.__jobserver = None
+        self.__withheld = []
+        self.__watcher = None
+        self.__stop = threading.Event()
+
+    @property
+    def memory_budget(self):
+        """The memory budget in bytes"""
+        return self.__budget
+
+    def expected_rss(self,key,phase):
+        """The peak resident set size in bytes expected for the phase of key"""
+        if self.__peaks is not None:
+            peak = self.__peaks.get(key,{}).get(phase)
+            if peak is not None:
+                return peak
+        return DEFAULT_RSS
+
+    def record(self,key,phase,max_rss):
+        """Record the peak resident set size max_rss in bytes of the phase of key"""
+        if self.__peaks is None or max_rss is None:
+            return
+        peaks = dict(self.__peaks.get(key,{}))
+        old = peaks.get(phase)
+        # follow a decreasing memory usage only slowly
+        peaks[phase] = max_rss if old is None else max(max_rss,(old + max_rss) // 2)
+        self.__peaks.set(key,peaks)
+
+    def __overloaded(self):
+        return self.__max_load is not None and os.getloadavg()[0] > self.__max_load
+
+    @contextmanager
+    def admit(self,key,phase):
+        """
+        Context manager, which blocks until the phase of key may be started
+        and reserves its expected memory while the block is executed.
+
+        If nothing else is running, the phase is always admitted.
+        """
+        need = self.expected_rss(key,phase)
+        with self.__condition:
+            while True:
+                rid = self.__try_reserve(need)
+                if rid is not None:
+                    break
+                self.__condition.wait(POLL_INTERVAL)
+
+        try:
+            yield
+        finally:
+            self.__release(rid)
+
+    @asynccontextmanager
+    async def admit_async(self,key,phase):
+        """Asynchronous version of admit(), which does not block the event loop"""
+        need = self.expected_rss(key,phase)
+        while True:
+            with self.__condition:
+                rid = self.__try_reserve(need)
+            if rid is not None:
+                break
+            await asyncio.sleep(POLL_INTERVAL / 10)
+
+        try:
+            yield
+        finally:
+            self.__release(rid)
+
+    def __try_reserve(self,need):
+        """
+        Reserve need bytes if this is possible now and return the id of the
+        reservation or None. The caller needs to hold the condition.
+        """
+        if len(self.__reserved) > 0:
+            if (sum(self.__reserved.values()) + need > self.__budget
+                    or need > available_memory() or self.__overloaded()):
+                return None
+
+        rid = self.__next_id
+        self.__next_id += 1
+        self.__reserved[rid] = need
+        return rid
+
+    def __release(self,rid):
+        with self.__condition:
+            del self.__reserved[rid]
+            self.__condition.notify_all()
+
+    def save(self):
+        """Write the recorded peak memory to disk"""
+        if self.__peaks is not None:
+            self.__peaks.save()
+
+    # --------------------------------------------------------------------
+
+    def watch(self,jobserver):
+        """Start withholding tokens of the jobserver.jobserver while memory is low"""
+        self.__jobserver = jobserver
+        self.__stop.clear()
+        self.__watcher = threading.Thread(target=self.__watch,daemon=True)
+        self.__watcher.start()
+
+    def __job_rss(self):
+        """The memory expected per make job"""
+        if self.__peaks is None:
+            return DEFAULT_RSS
+        peaks = [ self.__peaks.get(k,{}).get("build") for k in self.__peaks.keys() ]
+        peaks = [ p for p in peaks if p is not None ]
+        return max(peaks) if len(peaks) > 0 else DEFAULT_RSS
+
+    def __watch(self):
+        while not self.__stop.wait(POLL_INTERVAL):
+            per_job = self.__job_rss()
+            available = available_memory()
+            if available < per_job or self.__overloaded():
+                # always leave one token, such that the builds make progress
+                if len(self.__withheld) < self.__jobserver.jobs - 1:
+                    token = self.__jobserver.acquire()
+                    if self.__stop.is_set():
+                        self.__jobserver.release(token)
+                        return
+                    self.__withheld.append(token)
+            elif available > 2 * per_job and len(self.__withheld) > 0:
+                self.__jobserver.release(self.__withheld.pop())
+
+    def stop(self):
+        """Stop watching the jobserver and return all withheld tokens"""
+        if self.__watcher is None:
+            return
+        self.__stop.set()
+        # wake up the watcher if it is waiting for a token
+        self.__jobserver.release()
+        self.__watcher.join()
+        self.__jobserver.acquire()
+        self.__watcher = None
+
+        while len(self.__withheld) > 0:
+            self.__jobserver.release(self.__withheld.pop())
@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+# vi: set et ts=4 sw=4 sts=4:
+
+from array import array
+from collections.abc import Iterable
+import dependency_node
+
+class graph_index:
+    """
+    Immutable reachability index over a graph of dependency_node objects.
+
+    The graph is built once from a set of nodes (and all their direct or
+    indirect dependencies). Each node gets an integer id, such that the
+    dependencies of a node always have smaller ids than the node itself.
+    The edges are stored as compact adjacency arrays and the transitive
+    closure of each node in both directions as a bitset (a python int
+    where bit i is set if the node with id i is contained).
+
+    Queries about dependencies and dependents are therefore cheap set
+    operations on integers. The index does not notice changes to the
+    dependencies of the nodes after it has been built.
+    """
+
+    def __init__(self,nodes):
+        """
+        nodes:   Iterable of dependency_node objects to index. Their
+                 direct or indirect dependencies are indexed as well.
+
+        Raises dependency_node.CyclicGraphException if the graph has a cycle.
+        """
+        if not isinstance(nodes,Iterable):
+            raise TypeError("nodes has to be an iterable of dependency_node objects")
+
+        order = dependency_node.topological_order(nodes)
+        self.__nodes = tuple(order)
+        self.__ids = dict( (node, i) for i, node in enumerate(order) )
+
+        # adjacency arrays in compressed sparse row format:
+        # the dependencies of the node with id i are
+        # __dep_ids[__dep_offsets[i]:__dep_offsets[i+1]]
+        # and likewise for the nodes directly depending on it
+        self.__dep_offsets = array("l",[ 0 ])
+        self.__dep_ids = array("l")
+        dependents = [ [] for _ in order ]
+        for i, node in enumerate(order):
+            deps = sorted({ self.__ids[d] for d in (node.depends_on() or ()) })
+            self.__dep_ids.extend(deps)
+            self.__dep_offsets.append(len(self.__dep_ids))
+            for d in deps:
+                dependents[d].append(i)
+
+        self.__rdep_offsets = array("l",[ 0 ])
+        self.__rdep_ids = array("l")
+        for rdeps in dependents:
+            self.__rdep_ids.extend(rdeps)
+            self.__rdep_offsets.append(len(self.__rdep_ids))
+
+        # transitive closures: Dependencies always have a smaller id,
+        # so one pass in each direction is enough.
+        n = len(order)
+        self.__descendants = [ 0 ] * n
+        for i in range(n):
+            bits = 0
+            for d in self.__direct(self.__dep_offsets,self.__dep_ids,i):
+                bits |= self.__descendants[d] | (1 << d)
+            self.__descendants[i] = bits
+
+        self.__ancestors = [ 0 ] * n
+        for i in reversed(range(n)):
+            bits = 0
+            for d in self.__direct(self.__rdep_offsets,self.__rdep_ids,i):
+                bits |= self.__ancestors[d] | (1 << d)
+            self.__ancestors[i] = bits
+
+    @classmethod
+    def from_reader(cls,config):
+        """Build the index over all projects of a project_file.reader"""
+        return cls(config.projects)
+
+    # --------------------------------------------------------------------
+
+    @staticmethod
+    def __direct(offsets,ids,i):
+        return ids[offsets[i]:offsets[i+1]]
+
+    def __bits_to_nodes(self,bits):
+        ret = set()
+        while bits:
+            low = bits & -bits
+            ret.add(self.__nodes[low.bit_length()-1])
+            bits ^= low
+        return ret
+
+    def __bits_of(self,nodes):
+        bits = 0
+        for node in nodes:
+            bits |= 1 << self.id(node)
+        return bits
+
+    # --------------------------------------------------------------------
+
+    def __len__(self):
+        return len(self.__nodes)
+
+    def __contains__(self,node):
+        return node in self.__ids
+
+    def __iter__(self):
+        """Iterate over the nodes in topological order"""
+        return iter(self.__nodes)
+
+    def id(self,node):
+        """The integer id of a node"""
+        try:
+            return self.__ids[node]
+        except KeyError:
+            raise KeyError("Node " + repr(node) + " is not part of the graph_index")
+
+    def node(self,i):
+        """The node with id i"""
+        return self.__nodes[i]
+
+    def direct_dependencies(self,node):
+        """The set of nodes node directly depends upon"""
+        return { self.__nodes[d] for d in self.__direct(self.__dep_offsets,self.__dep_ids,self.id(node)) }
+
+    def direct_dependents(self,node):
+        """The set of nodes directly depending on node"""
+        return { self.__nodes[d] for d in self.__direct(self.__rdep_offsets,self.__rdep_ids,self.id(node)) }
+
+    def descendants(self,node):
+        """The set of all direct or indirect dependencies of node"""
+        return self.__bits_to_nodes(self.__descendants[self.id(node)])
+
+    def ancestors(self,node):
+        """The set of all nodes which directly or indirectly depend on node"""
+        return self.__bits_to_nodes(self.__ancestors[self.id(node)])
+
+    def reaches(self,node,dependency):
+        """Does node directly or indirectly depend on dependency"""
+        return bool((self.__descendants[self.id(node)] >> self.id(dependency)) & 1)
+
+    def descendants_of_all(self,roots,include_roots=True):
+        """
+        The union of the recursive dependencies of all nodes in roots
+
+        include_roots=False   do not include the roots themselves
+                              (unless one root depends on another)
+        """
+        bits = 0
+        for root in roots:
+            bits |= self.__descendants[self.id(root)]
+        if include_roots:
+            bits |= self.__bits_of(roots)
+        return self.__bits_to_nodes(bits)
+
+    def ancestors_of_all(self,roots,include_roots=True):
+        """
+        The union of all nodes which directly or indirectly depend on
+        any of the nodes in roots
+
+        include_roots=False   do not include the roots themselves
+                              (unless one root depends on another)
+        """
+        bits = 0
+        for root in roots:
+            bits |= self.__ancestors[self.id(root)]
+        if include_roots:
+            bits |= self.__bits_of(roots)
+        return self.__bits_to_nodes(bits)
+
+    def sorted(self,nodes):
+        """Return the nodes as a list sorted in topological order"""
+        return sorted(nodes,key=self.id)
+
+# ------------------------------------------------------------------------
+
+if __name__ == "__main__":
+    import argparse
+    import sys
+    import project_file
+
+    parser = argparse.ArgumentParser(description="Query the dependencies between the projects of a project.yaml file")
+    parser.add_argument("config", metavar="project.yaml", type=str, help="The path to project.yaml file")
+    sub = parser.add_subparsers(dest="query")
+    sub.required = True
+    p = sub.add_parser("dependencies", help="Print all direct or indirect dependencies of the projects in topological order")
+    p.add_argument("projects", nargs="+")
+    p = sub.add_parser("dependents", help="Print all projects directly or indirectly depending on the projects in topological order")
+    p.add_argument("projects", nargs="+")
+    p = sub.add_parser("depends", help="Exit with status 0 if the first project depends on the second, else with 1 (2 on errors)")
+    p.add_argument("projects", nargs=2)
+    args = parser.parse_args()
+
+    with open(args.config) as f:
+        config = project_file.reader(f)
+    index = graph_index.from_reader(config)
+
+    by_name = dict( (p.name, p) for p in index )
+    try:
+        projects = [ by_name[name] for name in args.projects ]
+    except KeyError as e:
+        print("Unknown project: " + str(e),file=sys.stderr)
+        sys.exit(2)
+
+    if args.query == "depends":
+        sys.exit(0 if index.reaches(*projects) else 1)
+    elif args.query == "dependencies":
+        result = index.descendants_of_all(projects,include_roots=False)
+    else:
+        result = index.ancestors_of_all(projects,include_roots=False)
+
+    for p in index.sorted(result):
+        print(p.name)
@@ -0,0 +1,188 @@
+# vi: set et ts=4 sw=4 sts=4:
+
+import asyncio
+import os
+import re
+import select
+from collections import deque
+from contextlib import contextmanager, asynccontextmanager
+
+# The byte written to the pipe for each token (as GNU make does)
+TOKEN = b"+"
+
+class jobserver:
+    """
+    A GNU make jobserver shared by all make processes we start.
+
+    The jobserver is a pipe holding one byte per job slot. A make which is
+    given the pipe in MAKEFLAGS reads a token from it before starting any
+    additional job and writes it back once the job is done, such that all
+    makes together (including the sub-makes CMake-generated Makefiles start)
+    never run more than the given number of jobs at once.
+
+    Each make runs one job without taking a token from the pipe. To account
+    for this implicit slot, a token has to be taken with slot() for the
+    whole time a make is running.
+    """
+
+    def __init__(self,jobs):
+        """
+        jobs:  The total number of jobs which may run at the same time
+        """
+        if jobs < 1:
+            raise ValueError("jobs needs to be at least 1")
+        self.__jobs = jobs
+        self.__read, self.__write = os.pipe()
+        os.write(self.__write,TOKEN * jobs)
+        self.__waiters = deque()        # futures of the coroutines waiting for a token
+        self.__reader_loop = None       # the event loop watching the pipe for them
+
+    @property
+    def jobs(self):
+        """The total number of job slots"""
+        return self.__jobs
+
+    @property
+    def fds(self):
+        """The file descriptors of the pipe, which need to be passed to make"""
+        return (self.__read, self.__write)
+
+    def makeflags(self):
+        """The value for MAKEFLAGS to make a make use the jobserver"""
+        # make 4.2 and later use --jobserver-auth, older versions --jobserver-fds
+        auth = "{0},{1}".format(self.__read,self.__write)
+        return " -j{0} --jobserver-auth={1} --jobserver-fds={1}".format(self.__jobs,auth)
+
+    def environment(self,env=None):
+        """
+        Return a copy of the environment env (default os.environ) in which
+        MAKEFLAGS is set up to use the jobserver.
+        """
+        ret = dict(os.environ if env is None else env)
+        ret["MAKEFLAGS"] = self.makeflags()
+        return ret
+
+    def acquire(self):
+        """Take a token from the jobserver, blocks until one is available"""
+        while True:
+            try:
+                token = os.read(self.__read,1)
+            except InterruptedError:
+                continue
+            except BlockingIOError:
+                # make switches the pipe to non-blocking mode
+                select.select([ self.__read ],[],[])
+                continue
+            if len(token) == 1:
+                return token
+
+    def __read_token(self):
+        """Read a token from the pipe in non-blocking mode, None if there is none"""
+        try:
+            token = os.read(self.__read,1)
+        except (BlockingIOError, InterruptedError):
+            return None
+        return token if len(token) == 1 else None
+
+    def __hand_out(self):
+        """
+        Called by the event loop once the pipe is readable: pass the
+        available tokens to the waiting coroutines in the order they
+        started to wait and stop watching the pipe once none is left
+        """
+        while len(self.__waiters) > 0:
+            if self.__waiters[0].done():
+                self.__waiters.popleft()
+                continue
+            token = self.__read_token()
+            if token is None:
+                return
+            self.__waiters.popleft().set_result(token)
+        self.__reader_loop.remove_reader(self.__read)
+        self.__reader_loop = None
+
+    async def acquire_async(self):
+        """
+        Coroutine taking a token from the jobserver without blocking the event
+        loop. Coroutines waiting at the same time get the tokens in the order
+        they started to wait, the pipe is watched by a single reader for all
+        of them.
+        """
+        loop = asyncio.get_running_loop()
+        # make uses the pipe in non-blocking mode as well
+        os.set_blocking(self.__read,False)
+        if len(self.__waiters) == 0:
+            token = self.__read_token()
+            if token is not None:
+                return token
+
+        future = loop.create_future()
+        self.__waiters.append(future)
+        if self.__reader_loop is None:
+            self.__reader_loop = loop
+            loop.add_reader(self.__read,self.__hand_out)
+        try:
+            return await future
+        except asyncio.CancelledError:
+            # the token may have been handed to us just before we were cancelled
+            if future.done() and not future.cancelled():
+                self.release(future.result())
+            raise
+        finally:
+            if future in self.__waiters:
+                self.__waiters.remove(future)
+            if len(self.__waiters) == 0 and self.__reader_loop is not None:
+                self.__reader_loop.remove_reader(self.__read)
+                self.__reader_loop = None
+
+    def release(self,token=TOKEN):
+        """Return a token to the jobserver"""
+        os.write(self.__write,token)
+
+    @contextmanager
+    def slot(self):
+        """Context manager holding a token while the block is executed"""
+        token = self.acquire()
+        try:
+            yield
+        finally:
+            self.release(token)
+
+    @asynccontextmanager
+    async def slot_async(self):
+        """Asynchronous context manager holding a token while the block is executed"""
+        token = await self.acquire_async()
+        try:
+            yield
+        finally:
+            self.release(token)
+
+    def close(self):
+        """Close the pipe"""
+        if self.__reader_loop is not None and not self.__reader_loop.is_closed():
+            self.__reader_loop.remove_reader(self.__read)
+        self.__reader_loop = None
+        for fd in (self.__read, self.__write):
+            try:
+                os.close(fd)
+            except OSError:
+                pass
+
+def strip_jobs_options(options):
+    """
+    Remove the options setting the number of jobs (-j, -jN, -j N, --jobs
+    and --jobs=N) from the list of make options, since a make given an
+    explicit number of jobs would ignore the jobserver.
+    """
+    ret = []
+    skip = False
+    for opt in options:
+        if skip:
+            skip = False
+            if re.fullmatch("[0-9]+",opt):
+                continue
+        if opt in [ "-j", "--jobs" ]:
+            skip = True
+        elif re.fullmatch("-j[0-9]+|--jobs=[0-9]*",opt) is None:
+            ret.append(opt)
+    return ret
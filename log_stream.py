@@ -0,0 +1,93 @@
+# vi: set et ts=4 sw=4 sts=4:
+
+import gzip
+import os
+from collections import deque
+from state_file import STATE_DIRECTORY
+
+# The directory inside the workspace where the logs are kept
+LOG_DIRECTORY = os.path.join(STATE_DIRECTORY,"logs")
+
+# The number of lines kept for failure reports
+TAIL_LINES = 50
+
+class log_stream:
+    """
+    Process the output of a command line by line, such that the memory
+    needed does not depend on the amount of output.
+
+    All lines are written to a gzip-compressed log file, the last lines are
+    kept in a ring buffer for failure reports and each line is matched
+    against a failure pattern.
+    """
+
+    def __init__(self,path=None,failure_pattern=None,abort_on_failure=False,tail=TAIL_LINES):
+        """
+        path:              The file to write the compressed log to or None
+        failure_pattern:   Compiled regular expression, lines matching it
+                           mark a failure
+        abort_on_failure:  Request to abort the command on the first
+                           line matching the failure pattern
+        tail:              The number of lines to keep
+        """
+        self.__path = path
+        self.__file = None
+        if path is not None:
+            os.makedirs(os.path.dirname(os.path.abspath(path)),exist_ok=True)
+            self.__file = gzip.open(path,"wt",compresslevel=6,errors="replace")
+        self.__pattern = failure_pattern
+        self.__abort = abort_on_failure
+        self.__tail = deque(maxlen=tail)
+        self.__failure = None
+        self.__lines = 0
+
+    @property
+    def path(self):
+        """The path of the log file or None"""
+        return self.__path
+
+    @property
+    def failure(self):
+        """The first line matching the failure pattern or None"""
+        return self.__failure
+
+    @property
+    def lines(self):
+        """The number of lines seen"""
+        return self.__lines
+
+    @property
+    def tail(self):
+        """The last lines seen as a single string"""
+        return "".join(self.__tail)
+
+    def write_line(self,line):
+        """
+        Process a line of output (including its line break). Returns True
+        if the command should be aborted.
+        """
+        self.__lines += 1
+        self.__tail.append(line)
+        if self.__file is not None:
+            self.__file.write(line)
+
+        if self.__failure is None and self.__pattern is not None and self.__pattern.search(line):
+            self.__failure = line.rstrip("\n")
+            return self.__abort
+        return False
+
+    def close(self):
+        """Close the log file"""
+        if self.__file is not None:
+            self.__file.close()
+            self.__file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self,*args):
+        self.close()
+
+def log_path(repo,name):
+    """The path of the log file name (without extension) of the repository repo"""
+    return os.path.join(LOG_DIRECTORY,os.path.normpath(repo).strip(os.sep).replace(os.sep,"_"),name + ".log.gz")
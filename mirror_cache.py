@@ -0,0 +1,124 @@
+# vi: set et ts=4 sw=4 sts=4:
+
+import hashlib
+import os
+import re
+from cache_directory import cache_directory
+
+class mirror_cache:
+    """
+    A cache of local mirrors of the repositories of projects, which is shared
+    between workspaces on the same machine.
+
+    For git sources a bare mirror of the repository is kept. New checkouts
+    clone from the mirror (using hardlinks) and set the origin to the real
+    repository, updates fetch from the mirror.
+    For svn sources a pristine working copy of the checked out branch is kept
+    and copied for new checkouts. Updates of svn checkouts go to the server
+    directly, since svn has no way to update from a local copy.
+
+    Mirrors are refreshed incrementally before they are used and the least
+    recently used mirrors are evicted once the cache exceeds its maximal size.
+    """
+
+    def __init__(self,directory,max_size=None):
+        """
+        directory:   The cache directory
+        max_size:    Maximal size of all mirrors in bytes or None for no limit
+        """
+        self.__cache = cache_directory(os.path.abspath(directory),max_size)
+
+    @property
+    def directory(self):
+        """The cache directory"""
+        return self.__cache.path
+
+    def key(self,project):
+        """
+        The key of the mirror for a project_file.project, made up from
+        the project name and the path pattern of its source.
+        For svn the checked out branch is part of the key as well.
+        """
+        source = project.project_policy.source
+        string = source.path_pattern + "\n" + project.name
+        if source.type == "svn":
+            string += "\n" + project.branch
+        name = re.sub(r"[^A-Za-z0-9_.-]","_",project.name)
+        return name + "-" + hashlib.sha1(string.encode()).hexdigest()[:16]
+
+    def path(self,project):
+        """The path of the mirror for project"""
+        return self.__cache.entry_path(self.key(project))
+
+    def has_mirror(self,project):
+        """Is there a mirror for project"""
+        return self.__cache.has(self.key(project))
+
+    def lock(self,project):
+        """Context manager locking the mirror of project"""
+        return self.__cache.lock(self.key(project))
+
+    def remove(self,project):
+        """Remove the mirror of project (the caller should hold the lock)"""
+        self.__cache.remove(self.key(project))
+
+    def evict(self):
+        """Remove least recently used mirrors until the cache fits its maximal size"""
+        return self.__cache.evict()
+
+    # --------------------------------------------------------------------
+
+    def refresh_command(self,project):
+        """The command to create or incrementally refresh the mirror of project"""
+        source = project.project_policy.source
+        mirror = self.path(project)
+        params = project.checkout_params()
+
+        if source.type == "git":
+            if self.has_mirror(project):
+                return "git --git-dir='" + mirror + "' remote update --prune"
+            return "git clone --mirror '" + source.repository_url(params) + "' '" + mirror + "'"
+        elif source.type == "svn":
+            if self.has_mirror(project):
+                return "svn update '" + mirror + "'"
+            params["DIRECTORY"] = mirror
+            return source.checkout_command(params)
+
+    def checkout_command(self,project):
+        """The command to check out project from its (refreshed) mirror"""
+        source = project.project_policy.source
+        mirror = self.path(project)
+        params = project.checkout_params()
+        folder = params["DIRECTORY"]
+
+        if source.type == "git":
+            # the history and the blobs are complete in the mirror,
+            # so only the sparse paths apply to the checkout
+            sparse = source.sparse_command(params)
+            string = "git clone"
+            if (params["BRANCH"] != source.default_branch()):
+                string += " --branch '" + params["BRANCH"] + "'"
+            if sparse is not None:
+                string += " --sparse"
+            string += " '" + mirror + "' '" + folder + "'"
+            string += " && git -C '" + folder + "' remote set-url origin '" + source.repository_url(params) + "'"
+            if sparse is not None:
+                string += " && " + sparse
+            return string
+        elif source.type == "svn":
+            return "cp -a --reflink=auto '" + mirror + "' '" + folder + "'"
+
+    def update_command(self,project):
+        """
+        The command to update an existing checkout of project from its
+        (refreshed) mirror or None if updates do not use the mirror.
+        """
+        source = project.project_policy.source
+        folder = project.directory
+
+        if source.type == "git":
+            sparse = source.sparse_command(project.checkout_params())
+            string = "" if sparse is None else sparse + " && "
+            return string + "git -C '" + folder + "' fetch --tags '" + self.path(project) + "' '+refs/heads/*:refs/remotes/origin/*'" \
+                    + " && git -C '" + folder + "' merge '@{upstream}'"
+        return None
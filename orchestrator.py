@@ -0,0 +1,732 @@
+#!/usr/bin/env python3
+# vi: set et ts=4 sw=4 sts=4:
+
+import argparse
+import asyncio
+import os
+import re
+import shutil
+import sys
+import threading
+import time
+import process
+from contextlib import nullcontext
+import project_file
+import vcs
+import build_matrix
+from artifact_cache import artifact_cache
+from cache_directory import parse_size
+from compiler_cache import compiler_cache
+from fingerprint import fingerprinter
+from dependency_node import build_recursive_dependency_set
+from governor import resource_governor
+from graph_index import graph_index
+from jobserver import jobserver, strip_jobs_options
+from log_stream import log_stream, log_path
+from dependency_node import remaining_path_lengths
+from scheduler import async_scheduler, simulate
+from state_file import state_file, STATE_DIRECTORY
+from test_runner import test_runner, test_cache, write_results, print_summary
+from tracing import tracer
+
+# The shell library containing the functions for the individual phases
+LIBRARY = os.path.join(os.path.dirname(os.path.abspath(__file__)),"common.lib.sh")
+
+class orchestrator:
+    """
+    Configure, build, test and document a set of repositories in parallel,
+    respecting the dependencies between them.
+
+    Configuring, building and documenting is performed by the functions
+    configure_repo, build_repo and run_doxygen from common.lib.sh, the tests
+    are run by a test_runner.test_runner. All of them run as asynchronous
+    subprocesses on a single asyncio event loop, such that all of them can be
+    cancelled at once, e.g. by Ctrl-C.
+
+    Each project is built in each of the build configurations in its own
+    build directory (see build_matrix.configured_project), where the builds
+    of all configurations share the checkout and the scheduler.
+    """
+
+    def __init__(self,projects,conf_opt=[],make_opt=[],workers=1,
+            keep_going=False,force_tests=False,doxygen=False,revisions=None,
+            fingerprints=None,tests=None,trace=None,durations=None,jobs=None,
+            governor=None,artifacts=None,compilers=None,abort_early=False,
+            strict=False,echo=False,configurations=[]):
+        """
+        projects:     The project_file.project objects to process
+        conf_opt:     List of options for configure or cmake
+        make_opt:     List of options for make
+        workers:      Number of repositories to process concurrently
+        keep_going:   Continue with the repositories not depending on a
+                      failed one
+        force_tests:  Run tests even if nothing was built
+        doxygen:      Build the doxygen documentation as well
+        revisions:    Optional state_file in which the revision of each
+                      successfully built project is recorded
+        fingerprints: Optional state_file in which the fingerprint of each
+                      successfully built project is recorded. Projects
+                      whose fingerprint did not change are skipped.
+        tests:        The test_runner.test_runner to use for the tests
+        trace:        Optional tracing.tracer recording the phases
+        durations:    Optional state_file in which the duration of the
+                      phases of each project is recorded. If given, the
+                      projects on the longest remaining path through the
+                      dependency graph are started first.
+        jobs:         If given, all makes share a jobserver with this many
+                      job slots and the number of jobs in make_opt is
+                      ignored.
+        governor:     Optional governor.resource_governor admitting the builds
+                      and withholding jobserver tokens while memory is low
+        artifacts:    Optional artifact_cache.artifact_cache from which builds
+                      are restored and to which new builds are stored
+        compilers:    The compiler_cache.compiler_cache setting up the compiler
+                      launchers of the projects
+        abort_early:  Abort configuring or building a project as soon as its
+                      output shows an error
+        strict:       Cancel everything still running once a project failed
+        echo:         Print the output of all phases while they run, each
+                      line prefixed by the repository
+        configurations: The project_file.build_configuration objects to
+                      build each project in. If empty, each project is
+                      built once in its in-tree build directory.
+        """
+        self.__projects = build_matrix.configure(projects,configurations)
+        self.__conf_opt = list(conf_opt)
+        self.__make_opt = list(make_opt)
+        self.__jobserver = None
+        if jobs is not None:
+            self.__jobserver = jobserver(jobs)
+            self.__make_opt = strip_jobs_options(self.__make_opt)
+        self.__workers = workers
+        self.__keep_going = keep_going
+        self.__force_tests = force_tests
+        self.__doxygen = doxygen
+        self.__revisions = revisions
+        self.__fingerprints = fingerprints
+        self.__fingerprinters = dict( (c, fingerprinter(conf_opt + build_matrix.configure_options(c),
+            {} if c is None else c.environment)) for c in set( p.configuration for p in self.__projects ) )
+        self.__artifacts = artifacts
+        self.__compilers = compilers if compilers is not None else compiler_cache()
+        self.__abort_early = abort_early
+        self.__strict = strict
+        self.__echo = echo
+        self.__scheduler = None
+        self.__state = dict()
+        self.__failures = []
+        self.__tests = tests if tests is not None else test_runner()
+        self.__test_results = []
+        self.__trace = trace
+        self.__durations = durations
+        self.__governor = governor
+        self.__names = dict( (p.label, p.name) for p in self.__projects )
+        self.__by_label = dict( (p.label, p) for p in self.__projects )
+
+        # lock serialising the output of the phases
+        self.__output_lock = threading.Lock()
+
+        # projects which are not up to date after this run, i.e. which
+        # failed or depend on a project which is not up to date
+        self.__stale = set()
+        self.__stale_lock = threading.Lock()
+
+    # --------------------------------------------------------------------
+
+    def __print(self,string):
+        with self.__output_lock:
+            sys.stdout.write(string)
+            sys.stdout.flush()
+
+    async def __run_function(self,function,*args,phase=None,make=False,env=None,label=None):
+        """
+        Coroutine running a function from common.lib.sh in a bash subshell,
+        which returns True if it succeeded.
+
+        If phase is given, the output is written to the log of the phase, the
+        run is recorded under this name in the trace and only the last lines
+        of the output are printed if it fails. Otherwise the output is printed
+        in one block. The first argument is taken to be the repository. The
+        output, the log and the trace are labelled by label (default: the
+        repository). If make is True, the function runs make, which is
+        connected to the jobserver (if any). env is the environment to run
+        the function in (default os.environ).
+        """
+        command = '. "$0" || exit 1; ' + function + ' "$@"'
+        command_line = ["bash","-c",command,LIBRARY] + list(args)
+        if label is None:
+            label = args[0]
+
+        log = None
+        echo = None
+        if phase is not None:
+            log = log_stream(log_path(label,phase),BUILD_FAILURE_PATTERN,self.__abort_early)
+            if self.__echo:
+                echo = lambda line: self.__print(label + " | " + line)
+        try:
+            if make and self.__jobserver is not None:
+                async with self.__jobserver.slot_async():
+                    start = time.time()
+                    p = await process.run_async(command_line,env=self.__jobserver.environment(env),
+                            pass_fds=self.__jobserver.fds,log=log,echo=echo)
+            else:
+                start = time.time()
+                p = await process.run_async(command_line,env=env,log=log,echo=echo)
+        finally:
+            if log is not None:
+                log.close()
+
+        if log is None:
+            self.__print(p.output)
+        elif p.returncode == 0:
+            self.__print("{0} {1}: done ({2:.1f}s, complete output in {3})\n".format(
+                phase,label,p.wall_time,log.path))
+        else:
+            self.__report_failure(label,phase,p,log)
+
+        if phase is not None:
+            if self.__trace is not None:
+                self.__trace.add_result(label,phase,start,p,self.__track(label))
+            self.__record_duration(label,phase,p.wall_time)
+            if self.__governor is not None and label in self.__names:
+                self.__governor.record(self.__names[label],phase,p.max_rss)
+        return p.returncode == 0
+
+    def __track(self,label):
+        """The track of the trace for the phases of label: the worker slot running it"""
+        if self.__scheduler is None or label not in self.__by_label:
+            return None
+        return self.__scheduler.slot(self.__by_label[label])
+
+    def __report_failure(self,repo,phase,result,log):
+        """Print the last lines of the output of a failed phase"""
+        reason = "aborted" if result.aborted else "failed"
+        string = "\n#################################\n"
+        string += "#-- {0} {1} {2}, last lines of the output:\n".format(phase,repo,reason)
+        string += "#################################\n"
+        string += "".join( "   " + l for l in result.output.splitlines(True) )
+        if log.failure is not None:
+            string += "\nFirst error: " + log.failure + "\n"
+        string += "Complete output in " + log.path + "\n"
+        self.__print(string)
+
+        with self.__stale_lock:
+            self.__failures.append((repo, phase, log.failure, log.path))
+
+    def __record_duration(self,repo,phase,seconds):
+        """Update the recorded duration of a phase of repo"""
+        if self.__durations is None or repo not in self.__names:
+            return
+        name = self.__names[repo]
+        phases = dict(self.__durations.get(name,{}))
+        phases[phase] = update_estimate(phases.get(phase),seconds)
+        self.__durations.set(name,phases)
+
+    @staticmethod
+    def __built_anything(build,since):
+        """Has any file in the build directory build been modified since the time since"""
+        for dirpath, dirnames, filenames in os.walk(build):
+            for f in filenames:
+                try:
+                    if os.lstat(os.path.join(dirpath,f)).st_mtime > since:
+                        return True
+                except FileNotFoundError:
+                    pass
+        return False
+
+    async def process(self,project):
+        """
+        Coroutine configuring, building, testing and documenting a single
+        project. Returns True if configuring and building succeeded.
+        """
+        ok, tests_ok = await self.__process(project)
+
+        with self.__stale_lock:
+            if not ok or not tests_ok or any( d in self.__stale for d in project.depends_on() ):
+                self.__stale.add(project)
+            up_to_date = project not in self.__stale
+
+        if up_to_date:
+            rev = await asyncio.to_thread(vcs.revision,project)
+            if self.__revisions is not None and rev is not None:
+                self.__revisions.set(project.name,rev)
+            if self.__fingerprints is not None:
+                self.__fingerprints.set(project.name,await self.__fingerprint(project))
+        return ok
+
+    async def __fingerprint(self,project):
+        """The fingerprint of project, computed without blocking the event loop"""
+        return await asyncio.to_thread(self.__fingerprinters[project.configuration].fingerprint,project)
+
+    async def __process(self,project):
+        """
+        Returns a tuple of two bools: Did configuring and building succeed
+        and did all tests pass?
+        """
+        repo = project.directory
+        label = project.label
+        build = project.build_directory
+
+        if not os.path.isdir(repo):
+            self.__print("Could not find directory " + repo + "\n")
+            return (False, True)
+
+        up_to_date = (self.__fingerprints is not None and os.path.isdir(build)
+                and self.__fingerprints.get(project.name) == await self.__fingerprint(project))
+        if up_to_date and not self.__force_tests:
+            self.__print("\nskipping " + label + " since neither it nor its dependencies changed (use --tests to force)\n")
+            return (True, True)
+
+        # the build directory is about to change, so the project may only
+        # count as up to date again once it has succeeded completely
+        await self.__forget(project)
+
+        if not up_to_date and await self.__restore(project):
+            built = False
+        else:
+            env = project.environment(self.__compilers.environment(project))
+            if os.path.isdir(build) and self.__compilers.launcher_changed(project):
+                self.__print("\nthe compiler launcher of " + label + " changed, configuring it again\n")
+                await asyncio.to_thread(shutil.rmtree,build)
+            if not os.path.isdir(build):
+                if not await self.__run_function("configure_repo",repo,*self.__conf_opt,*project.configure_options,
+                        phase="configure",env=env,label=label):
+                    self.__print("Could not configure repository " + label + ".\n")
+                    return (False, True)
+
+            start = time.time()
+            self.__compilers.start_build(project)
+            admit = nullcontext() if self.__governor is None else self.__governor.admit_async(project.name,"build")
+            async with admit:
+                ok = await self.__run_function("build_repo",repo,*self.__make_opt,phase="build",make=True,env=env,
+                        label=label)
+            if not ok:
+                self.__print("Could not build repo " + label + "\n")
+                return (False, True)
+            built = await asyncio.to_thread(orchestrator.__built_anything,build,start)
+
+        tests_ok = True
+        if self.__force_tests or built:
+            self.__print("\n#################################\n#-- Testing " + os.path.basename(label)
+                    + "\n#################################\n")
+            test_start = time.time()
+            results = await self.__tests.run_build_async(repo,build,label)
+            if len(results) > 0:
+                if self.__trace is not None:
+                    self.__trace.add_span(label,"test",test_start,time.time() - test_start,
+                            sum( r.cpu_time for r in results ),max( r.max_rss for r in results ),
+                            max( r.returncode for r in results ),self.__track(label))
+                self.__record_duration(label,"test",time.time() - test_start)
+            with self.__stale_lock:
+                self.__test_results.extend(results)
+            tests_ok = all( r.passed for r in results )
+        else:
+            self.__print("\nskipping tests for " + label + " (use --tests to force tests)\n")
+
+        if built and tests_ok and self.__artifacts is not None:
+            start = time.time()
+            await asyncio.to_thread(self.__artifacts.store,project,await self.__fingerprint(project))
+            if self.__trace is not None:
+                self.__trace.add_span(label,"store",start,time.time() - start,track=self.__track(label))
+
+        # the documentation does not depend on the configuration
+        if self.__doxygen and project.configuration == self.__projects[0].configuration \
+                and await self.__run_function("have_doxyfile",repo):
+            await self.__run_function("run_doxygen",repo,phase="doxygen")
+        return (True, tests_ok)
+
+    async def __forget(self,project):
+        """
+        Remove the revision and the fingerprint recorded for the last
+        successful build of project and write this to disk at once
+        """
+        for state in [ self.__revisions, self.__fingerprints ]:
+            if state is not None and state.get(project.name) is not None:
+                state.remove(project.name)
+                await asyncio.to_thread(state.save)
+
+    async def __restore(self,project):
+        """
+        Restore the build of project from the artifact cache, if the cache
+        has a build for its current state. Returns True if the build was
+        restored.
+        """
+        if self.__artifacts is None:
+            return False
+        fp = await self.__fingerprint(project)
+        if not await asyncio.to_thread(self.__artifacts.has,project,fp):
+            return False
+
+        start = time.time()
+        restored = await asyncio.to_thread(self.__artifacts.restore,project,fp)
+        if self.__trace is not None:
+            self.__trace.add_span(project.label,"restore",start,time.time() - start,
+                    track=self.__track(project.label))
+        if restored:
+            self.__print("\nrestored the build of " + project.label + " from the artifact cache\n")
+        return restored
+
+    @property
+    def projects(self):
+        """The build_matrix.configured_project objects processed"""
+        return self.__projects
+
+    @property
+    def compilers(self):
+        """The compiler_cache.compiler_cache used"""
+        return self.__compilers
+
+    @property
+    def failures(self):
+        """
+        List of tuples (label of the repository, phase, first error or None,
+        log file) of the phases which failed
+        """
+        return self.__failures
+
+    @property
+    def test_results(self):
+        """List of test_runner.test_result objects of all tests run"""
+        return self.__test_results
+
+    @property
+    def states(self):
+        """
+        Dict from the build_matrix.configured_project objects to their state
+        (one of the states of the scheduler.async_scheduler) after run()
+        """
+        return self.__state
+
+    def skipped_because(self,project):
+        """The list of failed projects because of which project was skipped"""
+        if self.__scheduler is None:
+            return []
+        return [ p for p in self.__projects if p in self.__scheduler.skipped_because(project) ]
+
+    def print_report(self,file=sys.stdout):
+        """Print which projects failed, were skipped, succeeded or were not run"""
+        def by_state(st):
+            return [ p for p in self.__projects if self.__state.get(p) == st ]
+
+        failed = by_state(async_scheduler.FAILED) + by_state(async_scheduler.CANCELLED)
+        skipped = by_state(async_scheduler.SKIPPED)
+        succeeded = by_state(async_scheduler.SUCCEEDED)
+        not_run = by_state(async_scheduler.NOT_RUN)
+
+        print(file=file)
+        if len(failed) > 0:
+            print("Failed repositories:",file=file)
+            phases = dict( (repo, (phase, failure, log)) for repo, phase, failure, log in reversed(self.__failures) )
+            for p in failed:
+                if self.__state[p] == async_scheduler.CANCELLED:
+                    print("   {0}: cancelled".format(p.label),file=file)
+                elif p.label in phases:
+                    phase, failure, log = phases[p.label]
+                    print("   {0} ({1}): {2}".format(p.label,phase,failure if failure is not None else "see " + log),
+                            file=file)
+                else:
+                    print("   " + p.label,file=file)
+        if len(skipped) > 0:
+            print("Skipped repositories, since they depend on a failed one:",file=file)
+            for p in skipped:
+                print("   {0}: due to {1}".format(p.label,", ".join( c.label for c in self.skipped_because(p) )),
+                        file=file)
+        if len(succeeded) > 0:
+            print("Succeeded repositories: " + " ".join( p.label for p in succeeded ),file=file)
+        if len(not_run) > 0:
+            print("Repositories not run: " + " ".join( p.label for p in not_run ),file=file)
+
+    def expected_duration(self,project):
+        """
+        The expected time in seconds to process a project, estimated from
+        the phase durations recorded in previous runs. For projects never
+        processed before, the mean over all other projects is used.
+        """
+        if self.__durations is None:
+            return DEFAULT_DURATION
+
+        def estimate(name,build):
+            phases = self.__durations.get(name)
+            if phases is None:
+                return None
+            ret = sum( t for ph, t in phases.items() if ph in [ "build", "test" ] )
+            if not os.path.isdir(build):
+                ret += phases.get("configure",0)
+            if self.__doxygen:
+                ret += phases.get("doxygen",0)
+            return ret
+
+        ret = estimate(project.name,project.build_directory)
+        if ret is not None:
+            return ret
+
+        known = [ estimate(p.name,p.build_directory) for p in self.__projects ]
+        known = [ t for t in known if t is not None ]
+        if len(known) == 0:
+            return DEFAULT_DURATION
+        return sum(known) / len(known)
+
+    def priorities(self):
+        """
+        Dict from each project to the expected time needed to process it
+        and all projects (directly or indirectly) depending on it.
+        """
+        return remaining_path_lengths(self.__projects,self.expected_duration)
+
+    def plan(self):
+        """
+        Print the order in which the projects are expected to be processed
+        and the expected total time compared to starting the projects in
+        the order in which they become ready.
+        """
+        priority = self.priorities()
+        span_cp, timeline = simulate(self.__projects,self.expected_duration,self.__workers,priority.get)
+        span_fifo, _ = simulate(self.__projects,self.expected_duration,self.__workers)
+
+        width = max( [ len(p.label) for p in self.__projects ] + [ 10 ] )
+        print("Expected schedule with " + str(self.__workers) + " workers (times in seconds):")
+        print("  " + "repository".ljust(width) + "start".rjust(10) + "end".rjust(10) + "remaining".rjust(11))
+        for p, start, end in timeline:
+            print("  " + p.label.ljust(width) + "{0:10.1f}{1:10.1f}{2:11.1f}".format(start,end,priority[p]))
+        print()
+        print("Expected total time:  {0:.1f}s (longest remaining path first)".format(span_cp))
+        print("                      {0:.1f}s (in the order the repositories become ready)".format(span_fifo))
+
+    def finished(self,project):
+        """
+        Awaitable for the state of project (one of the states of the
+        scheduler.async_scheduler), which is done once it has been processed
+        or it is clear that it will not be processed. Only available while
+        run_async() is running.
+        """
+        if self.__scheduler is None:
+            raise RuntimeError("The orchestrator is not running")
+        return self.__scheduler.finished(project)
+
+    def run(self):
+        """
+        Process all projects and return True if all of them could be
+        configured and built.
+        """
+        return asyncio.run(self.run_async())
+
+    async def run_async(self):
+        """
+        Coroutine processing all projects, which returns True if all of them
+        could be configured and built. If it is cancelled, all phases still
+        running are cancelled as well.
+        """
+        priority = None
+        if self.__durations is not None:
+            priority = self.priorities().get
+
+        self.__scheduler = async_scheduler(self.__projects,self.process,workers=self.__workers,
+                keep_going=self.__keep_going,priority=priority,cancel_on_failure=self.__strict)
+        if self.__governor is not None and self.__jobserver is not None:
+            self.__governor.watch(self.__jobserver)
+        try:
+            state = await self.__scheduler.run()
+            self.__state = state
+        finally:
+            if self.__revisions is not None:
+                self.__revisions.save()
+            if self.__fingerprints is not None:
+                self.__fingerprints.save()
+            if self.__durations is not None:
+                self.__durations.save()
+            self.__tests.save()
+            if self.__governor is not None:
+                self.__governor.stop()
+                self.__governor.save()
+            if self.__jobserver is not None:
+                self.__jobserver.close()
+            if self.__artifacts is not None:
+                for key in self.__artifacts.evict():
+                    print("Evicted build " + key)
+        return all( st == async_scheduler.SUCCEEDED for st in state.values() )
+
+# ------------------------------------------------------------------------
+
+# Output lines matching this pattern show an error while configuring or building
+BUILD_FAILURE_PATTERN = re.compile(r"(: (fatal )?error:|\*\*\* \[|^CMake Error|^configure: error|^Error:)")
+
+# Expected duration of a project in seconds if nothing is known about it
+DEFAULT_DURATION = 60
+
+# Weight of the latest measurement when updating a recorded duration
+DURATION_SMOOTHING = 0.5
+
+def update_estimate(old,seconds):
+    """
+    Combine the previous estimate old (or None) of a duration with a new
+    measurement, such that the estimate follows slow changes, but single
+    outliers do not dominate.
+    """
+    if old is None:
+        return seconds
+    return DURATION_SMOOTHING * seconds + (1 - DURATION_SMOOTHING) * old
+
+def select_projects(config,directories):
+    """
+    Return the projects of the project_file.reader config, which are checked out
+    to the given directories, in the order of the directories.
+    """
+    by_directory = dict( (p.directory, p) for p in config.projects )
+
+    ret = []
+    for d in directories:
+        try:
+            ret.append(by_directory[d])
+        except KeyError:
+            raise ValueError("Directory " + d + " does not belong to any project in the project file")
+    return ret
+
+def changed_since_build(projects,revisions,configurations=[]):
+    """
+    Return the set of projects whose checked out revision differs from the
+    one recorded in the state_file revisions at their last successful build
+    in any of the build configurations (see orchestrator). Projects which
+    have never been built count as changed.
+    """
+    ret = set()
+    for p in projects:
+        rev = vcs.revision(p)
+        names = [ build_matrix.configured_name(p,c) for c in configurations or [ None ] ]
+        if rev is None or any( rev != revisions.get(name) for name in names ):
+            ret.add(p)
+    return ret
+
+def affected_projects(projects,changed,index):
+    """
+    Return the list of those projects, which are amongst the changed projects
+    or directly or indirectly depend on one of them, i.e. the projects which
+    need to be rebuilt if the changed projects are modified.
+
+    index:    A graph_index.graph_index containing all projects
+    """
+    affected = index.ancestors_of_all(changed)
+    return [ p for p in projects if p in affected ]
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Configure, build and test a set of repositories in parallel, "
+            "starting each repository as soon as its dependencies are done.")
+    parser.add_argument("repos", metavar="repo", nargs="*", help="The directories of the repositories to process. "
+            "Default: All projects required by the default projects of the project file.")
+    parser.add_argument("--project", metavar="project.yaml", required=True, help="The project file describing the dependencies")
+    parser.add_argument("--workers", type=int, default=1, help="The number of repositories to process at the same time")
+    parser.add_argument("--conf-opt", default="", help="Options for configure or cmake as a single string")
+    parser.add_argument("--make-opt", default="", help="Options for make as a single string")
+    parser.add_argument("--configuration", metavar="NAME[=OPTIONS]", action="append", default=[],
+            help="Build in this configuration in the build directory build-NAME, may be given several times. "
+            "NAME alone selects a build configuration of the project file, NAME=OPTIONS defines one with these "
+            "options for configure or cmake. Default: all configurations of the project file or, if it has none, "
+            "a single build in the directory build")
+    parser.add_argument("--jobs", type=int, default=None, help="The total number of jobs all makes "
+            "together may run at the same time (using a shared make jobserver)")
+    parser.add_argument("--memory-budget", metavar="size", type=parse_size, default=None, help="The memory "
+            "(e.g. 16G) all builds and tests together may use. Builds, tests and make jobs are only started "
+            "while the peak memory recorded for them in previous runs fits. Default: the available memory")
+    parser.add_argument("--max-load", type=float, default=None, help="Do not start builds, tests or "
+            "make jobs while the load average is above this")
+    parser.add_argument("--keep-going", action="store_true", help="Proceed with the repositories not depending on a failed one")
+    parser.add_argument("--tests", action="store_true", help="Always run the tests (even if no file changed during the make), "
+            "including the tests which passed before and did not change since")
+    parser.add_argument("--test-jobs", type=int, default=os.cpu_count(), help="The number of tests to run at the same time")
+    parser.add_argument("--test-timeout", type=float, default=None, help="Timeout for each test in seconds")
+    parser.add_argument("--test-results", default=os.path.join(STATE_DIRECTORY,"test_results"),
+            help="Directory to write the test results to (as results.json and junit.xml)")
+    parser.add_argument("--docs", action="store_true", help="Build the doxygen documentation as well if it is available.")
+    parser.add_argument("--trace", metavar="trace.json", default=None, help="Write a timeline of all phases to this file "
+            "(in Chrome trace-event format, see chrome://tracing or Perfetto) and print a summary of the time spent")
+    parser.add_argument("--changed", metavar="repo1:repo2:...", default=None, help="Only process the repositories "
+            "in these directories and those depending on them.")
+    parser.add_argument("--changed-file", metavar="file", default=None, help="Only process the repositories "
+            "listed in this file (one directory per line, see checkout.py --changed-output) and those depending on them.")
+    parser.add_argument("--changed-vcs", action="store_true", help="Only process the repositories with new "
+            "commits since their last successful build and those depending on them.")
+    parser.add_argument("--artifact-dir", default=os.environ.get("REPOISER_ARTIFACT_DIR"), help="Directory "
+            "with cached builds shared between workspaces (default: $REPOISER_ARTIFACT_DIR, if unset no builds "
+            "are cached)")
+    parser.add_argument("--artifact-size", type=parse_size, default=None, help="Maximal size of the artifact "
+            "directory, e.g. 50G. The least recently used builds are removed if it is exceeded.")
+    parser.add_argument("--ccache-dir", default=os.environ.get("REPOISER_CCACHE_DIR"), help="The ccache "
+            "directory for the projects using ccache as their compiler_launcher, which may be shared between "
+            "workspaces (default: $REPOISER_CCACHE_DIR, if unset the directory configured for ccache)")
+    parser.add_argument("--ccache-size", default=None, help="Maximal size of the ccache directory, e.g. 20G")
+    parser.add_argument("--strict", action="store_true", help="Cancel everything still running as soon as "
+            "a repository fails")
+    parser.add_argument("-v","--verbose", action="store_true", help="Print the output of all phases while they "
+            "run, each line prefixed by its repository")
+    parser.add_argument("--abort-early", action="store_true", help="Abort configuring, building or testing "
+            "a repository as soon as its output shows an error")
+    parser.add_argument("--plan", action="store_true", help="Only print the expected schedule based on the "
+            "durations recorded in previous runs and exit.")
+    args = parser.parse_args()
+
+    with open(args.project) as f:
+        config = project_file.reader(f)
+
+    try:
+        configurations = [ build_matrix.parse_configuration(c,config.build_configurations)
+                for c in args.configuration ]
+    except ValueError as e:
+        parser.error(str(e))
+    if len(args.configuration) == 0:
+        configurations = list(config.build_configurations)
+    if len(set( c.name for c in configurations )) < len(configurations):
+        parser.error("Each build configuration may only be given once")
+
+    if len(args.repos) > 0:
+        projects = select_projects(config,args.repos)
+    else:
+        projects = build_recursive_dependency_set(config.default_projects)
+
+    revisions = state_file("revisions")
+    if args.changed is not None or args.changed_file is not None or args.changed_vcs:
+        changed = set()
+        if args.changed is not None:
+            changed.update(select_projects(config,[ d for d in args.changed.split(":") if d != "" ]))
+        if args.changed_file is not None:
+            with open(args.changed_file) as f:
+                changed.update(select_projects(config,[ l.strip() for l in f if l.strip() != "" ]))
+        if args.changed_vcs:
+            changed.update(changed_since_build(projects,revisions,configurations))
+
+        projects = affected_projects(projects,changed,graph_index.from_reader(config))
+        print("Repositories affected by the changes: " + " ".join( p.directory for p in projects ))
+
+    trace = tracer() if args.trace is not None else None
+    artifacts = None
+    if args.artifact_dir:
+        artifacts = artifact_cache(args.artifact_dir,args.artifact_size)
+    governor = resource_governor(memory_budget=args.memory_budget,max_load=args.max_load,
+            peaks=state_file("peak_memory"))
+    o = orchestrator(projects,conf_opt=args.conf_opt.split(),make_opt=args.make_opt.split(),
+            workers=args.workers,keep_going=args.keep_going,force_tests=args.tests,
+            doxygen=args.docs,revisions=revisions,fingerprints=state_file("fingerprints"),
+            tests=test_runner(jobs=args.test_jobs,timeout=args.test_timeout,governor=governor,
+                cache=test_cache(state_file("test_cache")),force=args.tests,abort_early=args.abort_early,
+                echo=args.verbose),
+            trace=trace,durations=state_file("durations"),jobs=args.jobs,governor=governor,
+            artifacts=artifacts,compilers=compiler_cache(args.ccache_dir,args.ccache_size),
+            abort_early=args.abort_early,strict=args.strict,echo=args.verbose,configurations=configurations)
+    if args.plan:
+        o.plan()
+        sys.exit(0)
+
+    try:
+        success = o.run()
+    except KeyboardInterrupt:
+        print("\nInterrupted, all running phases have been cancelled.",file=sys.stderr)
+        sys.exit(130)
+    write_results(o.test_results,args.test_results)
+    if trace is not None:
+        trace.write(args.trace)
+        trace.print_summary(o.projects)
+    o.compilers.print_summary()
+    if success:
+        o.print_report()
+    else:
+        print("Some repositories could not be configured or built.",file=sys.stderr)
+        o.print_report(file=sys.stderr)
+    tests_passed = print_summary(o.test_results)
+    sys.exit(0 if success and tests_passed else 1)
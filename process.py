@@ -0,0 +1,191 @@
+# vi: set et ts=4 sw=4 sts=4:
+
+import asyncio
+import os
+import signal
+import subprocess
+import threading
+import time
+
+class process_result:
+    """The outcome of a child process run by run()"""
+
+    def __init__(self,returncode,output,wall_time,cpu_time,max_rss,timed_out=False,aborted=False):
+        """
+        returncode:  Exit status of the process
+        output:      Combined stdout and stderr as a string
+        wall_time:   Wall time in seconds
+        cpu_time:    User plus system CPU time in seconds of the process
+                     and all its descendants
+        max_rss:     Peak resident set size in bytes of the process or
+                     the largest of its descendants
+        timed_out:   Was the process terminated due to a timeout
+        aborted:     Was the process terminated, since the log_stream.log_stream
+                     processing its output requested so
+        """
+        self.returncode = returncode
+        self.output = output
+        self.wall_time = wall_time
+        self.cpu_time = cpu_time
+        self.max_rss = max_rss
+        self.timed_out = timed_out
+        self.aborted = aborted
+
+# Seconds processes get to terminate after SIGTERM before they are killed
+TERMINATE_GRACE = 5
+
+# Maximal length of a line of output read at once by run_async
+LINE_LIMIT = 1 << 20
+
+def __kill_group(pid,sig):
+    try:
+        os.killpg(pid,sig)
+    except ProcessLookupError:
+        pass
+
+def run(args,cwd=None,env=None,timeout=None,pass_fds=(),log=None):
+    """
+    Run the command args with stdout and stderr captured and return a
+    process_result. The process runs in its own session, such that on
+    a timeout the process and everything it started can be terminated.
+
+    In contrast to subprocess.run the resource usage of the process is
+    obtained as well. The file descriptors pass_fds are kept open in the
+    child.
+
+    If a log_stream.log_stream log is given, the output is passed to it line
+    by line instead of being collected and the output of the result are the
+    last lines kept by log. If log requests it, the process is terminated.
+
+    Processes are terminated by sending SIGTERM to their process group and
+    only killed if they did not exit after TERMINATE_GRACE seconds, which
+    gives a make using a jobserver the chance to return its tokens.
+    """
+    start = time.time()
+    p = subprocess.Popen(args,cwd=cwd,env=env,stdin=subprocess.DEVNULL,
+            stdout=subprocess.PIPE,stderr=subprocess.STDOUT,start_new_session=True,pass_fds=pass_fds)
+
+    timed_out = threading.Event()
+    killer = threading.Timer(TERMINATE_GRACE,__kill_group,(p.pid, signal.SIGKILL))
+    def terminate(reason=timed_out):
+        reason.set()
+        __kill_group(p.pid,signal.SIGTERM)
+        if killer.ident is None:
+            killer.start()
+
+    timer = None
+    if timeout is not None:
+        timer = threading.Timer(timeout,terminate)
+        timer.start()
+
+    aborted = threading.Event()
+    try:
+        if log is None:
+            output = p.stdout.read().decode(errors="replace")
+        else:
+            for line in p.stdout:
+                if log.write_line(line.decode(errors="replace")) and not aborted.is_set():
+                    terminate(aborted)
+            output = log.tail
+        p.stdout.close()
+
+        # reap the process ourselves to get its resource usage
+        _, status, usage = os.wait4(p.pid,0)
+        p.returncode = os.waitstatus_to_exitcode(status)
+    finally:
+        if timer is not None:
+            timer.cancel()
+        killer.cancel()
+
+    return process_result(p.returncode,output,time.time() - start,
+            usage.ru_utime + usage.ru_stime,usage.ru_maxrss * 1024,timed_out.is_set(),aborted.is_set())
+
+async def __reap(pid,grace=None):
+    """
+    Wait for the process pid to exit and return the result of os.wait4. If
+    grace is given, the process group is killed if it does not exit in time.
+    """
+    loop = asyncio.get_running_loop()
+    if grace is not None:
+        deadline = time.time() + grace
+        while time.time() < deadline:
+            rpid, status, usage = os.wait4(pid,os.WNOHANG)
+            if rpid != 0:
+                return (rpid, status, usage)
+            await asyncio.sleep(0.05)
+        __kill_group(pid,signal.SIGKILL)
+    return await loop.run_in_executor(None,os.wait4,pid,0)
+
+async def run_async(args,cwd=None,env=None,timeout=None,pass_fds=(),log=None,echo=None):
+    """
+    Coroutine running the command args like run(), but which does not block
+    the event loop while the command runs. If echo is given, it is called
+    with each line of output as soon as it is read.
+
+    If the coroutine is cancelled, the process and everything it started is
+    terminated (and killed after TERMINATE_GRACE seconds), the same happens
+    on a timeout or if log requests it.
+    """
+    loop = asyncio.get_running_loop()
+    start = time.time()
+    p = subprocess.Popen(args,cwd=cwd,env=env,stdin=subprocess.DEVNULL,
+            stdout=subprocess.PIPE,stderr=subprocess.STDOUT,start_new_session=True,pass_fds=pass_fds)
+
+    timed_out = False
+    aborted = False
+    killer = None
+    def terminate():
+        nonlocal killer
+        __kill_group(p.pid,signal.SIGTERM)
+        if killer is None:
+            killer = loop.call_later(TERMINATE_GRACE,__kill_group,p.pid,signal.SIGKILL)
+
+    def on_timeout():
+        nonlocal timed_out
+        timed_out = True
+        terminate()
+
+    timer = None
+    if timeout is not None:
+        timer = loop.call_later(timeout,on_timeout)
+
+    reader = asyncio.StreamReader(limit=LINE_LIMIT)
+    transport, _ = await loop.connect_read_pipe(lambda: asyncio.StreamReaderProtocol(reader),p.stdout)
+    chunks = []
+    try:
+        while True:
+            try:
+                data = await reader.readline()
+            except (ValueError, asyncio.LimitOverrunError):
+                # line too long, process it in pieces
+                data = await reader.read(LINE_LIMIT)
+            if len(data) == 0:
+                break
+
+            line = data.decode(errors="replace")
+            if echo is not None:
+                echo(line)
+            if log is None:
+                chunks.append(line)
+            elif log.write_line(line) and not aborted:
+                aborted = True
+                terminate()
+
+        # reap the process ourselves to get its resource usage
+        _, status, usage = await __reap(p.pid)
+        p.returncode = os.waitstatus_to_exitcode(status)
+    except asyncio.CancelledError:
+        __kill_group(p.pid,signal.SIGTERM)
+        _, status, _ = await asyncio.shield(__reap(p.pid,TERMINATE_GRACE))
+        p.returncode = os.waitstatus_to_exitcode(status)
+        raise
+    finally:
+        if timer is not None:
+            timer.cancel()
+        if killer is not None:
+            killer.cancel()
+        transport.close()
+
+    output = "".join(chunks) if log is None else log.tail
+    return process_result(p.returncode,output,time.time() - start,
+            usage.ru_utime + usage.ru_stime,usage.ru_maxrss * 1024,timed_out,aborted)
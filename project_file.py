@@ -1,9 +1,28 @@
 # vi: set et ts=4 sw=4 sts=4:
 
+import hashlib
+import os
+import pickle
+import re
+import sys
+import tempfile
 import yaml
 from collections.abc import Iterable
 import dependency_node
 
+# Use the loader implemented in C on top of libyaml if available
+try:
+    from yaml import CSafeLoader as SafeLoader
+except ImportError:
+    from yaml import SafeLoader
+
+# The loaders our YAML objects are registered with
+YAML_LOADERS = [ yaml.SafeLoader ] + ([ SafeLoader ] if SafeLoader is not yaml.SafeLoader else [])
+
+# The directory in which the parsed project files are cached
+CACHE_DIRECTORY = os.path.join(os.environ.get("XDG_CACHE_HOME",os.path.join(os.path.expanduser("~"),".cache")),
+        "repoiser","projects")
+
 class InvalidYAMLObject(Exception):
     """
     Exception thrown when YAML produced an invalid object due to a syntax error
@@ -12,14 +31,52 @@ class InvalidYAMLObject(Exception):
     def __init__(self,message):
         super(InvalidYAMLObject, self).__init__(message)
 
+# The values allowed for the depth of svn checkouts
+SVN_DEPTHS = [ "empty", "files", "immediates", "infinity" ]
+
+def _checked_depth(val):
+    """Check the value for the depth of git clones and return it"""
+    if val is None:
+        return None
+    if not isinstance(val,int) or isinstance(val,bool):
+        raise TypeError("depth can only be an integer")
+    if val < 1:
+        raise ValueError("depth has to be at least 1")
+    return val
+
+def _checked_sparse_paths(val):
+    """Check the value for the list of sparse paths and return it as a list"""
+    if val is None:
+        return None
+    if isinstance(val,str) or not isinstance(val,Iterable):
+        raise TypeError("sparse_paths can only be a list of strings")
+    val = list(val)
+    for path in val:
+        if not isinstance(path,str):
+            raise TypeError("sparse_paths can only be a list of strings")
+        if path == "" or path.startswith("/") or ".." in path.split("/"):
+            raise ValueError("sparse_paths have to be relative paths inside the repository, not \"" + path + "\"")
+    return val
+
+def _checked_svn_depth(val):
+    """Check the value for the depth of svn checkouts and return it"""
+    if val is None:
+        return None
+    if not isinstance(val,str):
+        raise TypeError("svn_depth can only be a string")
+    if val not in SVN_DEPTHS:
+        raise ValueError("svn_depth has to be one of " + ", ".join(SVN_DEPTHS))
+    return val
+
 ############################################################################
 
 class source(yaml.YAMLObject):
     yaml_tag = "!Source"
-    yaml_loader = yaml.SafeLoader
+    yaml_loader = YAML_LOADERS
 
     def __getstate__(self):
-        return { "name": self.name, "type":self.type, "path_pattern": self.path_pattern, "description": self.description };
+        return { "name": self.name, "type":self.type, "path_pattern": self.path_pattern, "description": self.description,
+                "max_connections": self.max_connections };
 
     def __setstate__(self,state):
         # TODO this is a lof of python magic
@@ -44,6 +101,9 @@ class source(yaml.YAMLObject):
 
             key = "description"
             self.description = state.get(key)
+
+            key = "max_connections"
+            self.max_connections = state.get(key)
         except KeyError:
             raise InvalidYAMLObject("Could not find property \""+key+"\".")
         except TypeError as e:
@@ -51,21 +111,23 @@ class source(yaml.YAMLObject):
         except ValueError as e:
             raise InvalidYAMLObject("Invalid value for property \"" + key +"\": " + str(e))
 
-    def __init__(self, name, type, path_pattern, description=""):
+    def __init__(self, name, type, path_pattern, description="", max_connections=None):
         self.name = name
         self.type = type
         self.path_pattern = path_pattern
         self.description = description
+        self.max_connections = max_connections
 
         #self.normalise()
 
     def __repr__(self):
-        return "{0}(name={1}, type={2}, path_pattern={3}, description={4})".format(
+        return "{0}(name={1}, type={2}, path_pattern={3}, description={4}, max_connections={5})".format(
                     self.__class__.__name__,
                     self.name,
                     self.type,
                     self.path_pattern,
-                    self.description
+                    self.description,
+                    self.max_connections
                     )
 
     # --------------------------------------------------------------------
@@ -121,6 +183,26 @@ class source(yaml.YAMLObject):
             raise TypeError("description can only be a string")
         self.__description = val
 
+    @property
+    def max_connections(self):
+        """
+        The maximal number of connections to the host of this source, which
+        may be used at the same time. None if there is no specific limit.
+        """
+        return self.__max_connections
+
+    @max_connections.setter
+    def max_connections(self,val):
+        if val is None:
+            self.__max_connections = None
+            return
+
+        if not isinstance(val,int) or isinstance(val,bool):
+            raise TypeError("max_connections can only be an integer")
+        if val < 1:
+            raise ValueError("max_connections has to be at least 1")
+        self.__max_connections = val
+
     # --------------------------------------------------------------------
 
     def default_branch(self):
@@ -141,23 +223,43 @@ class source(yaml.YAMLObject):
             BRANCH          The branch to check out
             DIRECTORY       The directory to checkout to.
 
+        Optional parameters are:
+            DEPTH           git: Only fetch this many commits of history
+            CLONE_FILTER    git: The filter of a partial clone, e.g. blob:none
+            SPARSE_PATHS    Only check out the files in the top directory
+                            and these directories
+            SVN_DEPTH       svn: The depth of the checkout (of the top
+                            directory if SPARSE_PATHS are given)
+
         We substitute ${PARAMETER} --> value and add the branch directive
         """
 
-        string = self.path_pattern
-
-        for subst in [ "PROJECT" ]:
-            string = string.replace("${" + subst + "}" ,str(params.get(subst)));
+        url = self.repository_url(params)
 
         # folder into which the checkout should happen
         folder = params["DIRECTORY"]
+        sparse = self.sparse_command(params)
         
         if self.type == "git":
-            string = "git clone '" + string + "' '" + folder + "'"
+            string = "git clone"
             if (params["BRANCH"] != self.default_branch()):
-                string += "; git checkout '" + params["BRANCH"] + "'"
+                string += " --branch '" + params["BRANCH"] + "'"
+            if params.get("DEPTH") is not None:
+                string += " --depth " + str(params["DEPTH"])
+            if params.get("CLONE_FILTER") is not None:
+                string += " --filter='" + params["CLONE_FILTER"] + "'"
+            if sparse is not None:
+                string += " --sparse"
+            string += " '" + url + "' '" + folder + "'"
         elif self.type == "svn":
-            string = "svn checkout '" + string
+            depth = params.get("SVN_DEPTH")
+            if sparse is not None and depth is None:
+                depth = "files"
+
+            string = "svn checkout"
+            if depth is not None:
+                string += " --depth " + depth
+            string += " '" + url
             if (params["BRANCH"] == self.default_branch()):
                 string += "/" +  self.default_branch()
             elif (params["BRANCH"] == ""):
@@ -165,17 +267,71 @@ class source(yaml.YAMLObject):
             else:
                 string += "/branches/" + params["BRANCH"]
             string += "' '" + folder + "'"
+
+        if sparse is not None:
+            string += " && " + sparse
+        return string
+
+    def update_command(self,params):
+        """
+        Generate the command to update an existing checkout,
+        the parameters are the same as for checkout_command.
+        Changes of the SPARSE_PATHS are applied as well.
+        """
+        folder = params["DIRECTORY"]
+        sparse = self.sparse_command(params)
+        string = "" if sparse is None else sparse + " && "
+
+        if self.type == "git":
+            string += "git -C '" + folder + "' pull"
+            if params.get("DEPTH") is not None:
+                string += " --depth " + str(params["DEPTH"])
+            return string
+        elif self.type == "svn":
+            if sparse is None and params.get("SVN_DEPTH") is not None:
+                string += "svn update --set-depth " + params["SVN_DEPTH"] + " '" + folder + "'"
+            else:
+                string += "svn update '" + folder + "'"
+            return string
+
+    def sparse_command(self,params):
+        """
+        The command restricting an existing checkout in the directory
+        DIRECTORY to the SPARSE_PATHS or None if there are no SPARSE_PATHS.
+        """
+        paths = params.get("SPARSE_PATHS")
+        if not paths:
+            return None
+        folder = params["DIRECTORY"]
+
+        if self.type == "git":
+            return "git -C '" + folder + "' sparse-checkout set " + " ".join( "'" + p + "'" for p in paths )
+        elif self.type == "svn":
+            return "svn update --parents --set-depth infinity " + " ".join( "'" + folder + "/" + p + "'" for p in paths )
+
+    def repository_url(self,params):
+        """
+        The location of the repository root for a project, i.e. the path_pattern
+        with the parameters substituted. The parameters are the same as for
+        checkout_command.
+        """
+        string = self.path_pattern
+
+        for subst in [ "PROJECT" ]:
+            string = string.replace("${" + subst + "}" ,str(params.get(subst)));
         return string
 
 ############################################################################
 
 class project_policy(yaml.YAMLObject):
     yaml_tag = "!ProjectPolicy"
-    yaml_loader = yaml.SafeLoader
+    yaml_loader = YAML_LOADERS
 
     def __getstate__(self):
         return { "name": self.name, "source":self.source, "description": self.description, 
-                "branch" : self.branch };
+                "branch" : self.branch, "compiler_launcher": self.compiler_launcher,
+                "depth": self.depth, "clone_filter": self.clone_filter,
+                "sparse_paths": self.sparse_paths, "svn_depth": self.svn_depth };
 
     def __setstate__(self,state):
         # TODO see comment on source above
@@ -192,6 +348,21 @@ class project_policy(yaml.YAMLObject):
 
             key = "branch"
             self.branch = state.get(key)
+
+            key = "compiler_launcher"
+            self.compiler_launcher = state.get(key)
+
+            key = "depth"
+            self.depth = state.get(key)
+
+            key = "clone_filter"
+            self.clone_filter = state.get(key)
+
+            key = "sparse_paths"
+            self.sparse_paths = state.get(key)
+
+            key = "svn_depth"
+            self.svn_depth = state.get(key)
         except KeyError:
             raise InvalidYAMLObject("Could not find property \""+key+"\".")
         except TypeError as e:
@@ -200,19 +371,31 @@ class project_policy(yaml.YAMLObject):
             raise InvalidYAMLObject("Invalid value for property \"" + key +"\": " + str(e))
 
     def __repr__(self):
-        return "{0}(name={1}, source={2}, description={3}, branch={4})".format(
+        return ("{0}(name={1}, source={2}, description={3}, branch={4}, compiler_launcher={5}, depth={6}, "
+                "clone_filter={7}, sparse_paths={8}, svn_depth={9})").format(
                     self.__class__.__name__,
                     self.name,
                     self.source,
                     self.description,
-                    self.branch
+                    self.branch,
+                    self.compiler_launcher,
+                    self.depth,
+                    self.clone_filter,
+                    self.sparse_paths,
+                    self.svn_depth
                     )
 
-    def __init__(self,name,source,description="", branch=None):
+    def __init__(self,name,source,description="", branch=None, compiler_launcher=None, depth=None,
+            clone_filter=None, sparse_paths=None, svn_depth=None):
         self.name = name
         self.source = source
         self.description = description
         self.branch = branch
+        self.compiler_launcher = compiler_launcher
+        self.depth = depth
+        self.clone_filter = clone_filter
+        self.sparse_paths = sparse_paths
+        self.svn_depth = svn_depth
 
     # --------------------------------------------------------------------
 
@@ -268,6 +451,69 @@ class project_policy(yaml.YAMLObject):
         else:
             raise TypeError("branch can only be None or a string")
 
+    @property
+    def compiler_launcher(self):
+        """
+        The program to launch the compilers with (e.g. ccache) when
+        building or None
+        """
+        return self.__compiler_launcher
+
+    @compiler_launcher.setter
+    def compiler_launcher(self,val):
+        if val is None or isinstance(val,str):
+            self.__compiler_launcher = val
+        else:
+            raise TypeError("compiler_launcher can only be None or a string")
+
+    @property
+    def depth(self):
+        """
+        The number of commits of history to fetch for git sources
+        or None to fetch the complete history
+        """
+        return self.__depth
+
+    @depth.setter
+    def depth(self,val):
+        self.__depth = _checked_depth(val)
+
+    @property
+    def clone_filter(self):
+        """
+        The filter for partial clones of git sources (e.g. blob:none to
+        fetch file contents only when they are checked out) or None
+        """
+        return self.__clone_filter
+
+    @clone_filter.setter
+    def clone_filter(self,val):
+        if val is None or isinstance(val,str):
+            self.__clone_filter = val
+        else:
+            raise TypeError("clone_filter can only be None or a string")
+
+    @property
+    def sparse_paths(self):
+        """
+        The list of directories to check out (besides the files in the
+        top directory) or None to check out everything
+        """
+        return self.__sparse_paths
+
+    @sparse_paths.setter
+    def sparse_paths(self,val):
+        self.__sparse_paths = _checked_sparse_paths(val)
+
+    @property
+    def svn_depth(self):
+        """The depth of svn checkouts (e.g. immediates) or None for all"""
+        return self.__svn_depth
+
+    @svn_depth.setter
+    def svn_depth(self,val):
+        self.__svn_depth = _checked_svn_depth(val)
+
     # --------------------------------------------------------------------
 
     def checkout_command(self,params):
@@ -276,16 +522,25 @@ class project_policy(yaml.YAMLObject):
         """
         return self.source.checkout_command(params)
 
+    def update_command(self,params):
+        """
+        Calls self.source.update_command(params)
+        """
+        return self.source.update_command(params)
+
 ############################################################################
 
 class project(yaml.YAMLObject,dependency_node.dependency_node):
     yaml_tag = "!Project"
-    yaml_loader = yaml.SafeLoader
+    yaml_loader = YAML_LOADERS
 
     def __getstate__(self):
         return { "name": self.name, "directory": self.directory, "project_policy":self.project_policy, 
                 "description": self.description, "dependencies" : list(self.dependencies),
-                "branch" : self.branch };
+                "branch" : self.branch, "is_enabled": self.is_enabled,
+                "compiler_launcher": self.__compiler_launcher, "depth": self.__depth,
+                "clone_filter": self.__clone_filter, "sparse_paths": self.__sparse_paths,
+                "svn_depth": self.__svn_depth };
 
     def __setstate__(self,state):
         # TODO see comment on Source above
@@ -311,6 +566,21 @@ class project(yaml.YAMLObject,dependency_node.dependency_node):
 
             key = "is_enabled"
             self.is_enabled = state.get(key)
+
+            key = "compiler_launcher"
+            self.compiler_launcher = state.get(key)
+
+            key = "depth"
+            self.depth = state.get(key)
+
+            key = "clone_filter"
+            self.clone_filter = state.get(key)
+
+            key = "sparse_paths"
+            self.sparse_paths = state.get(key)
+
+            key = "svn_depth"
+            self.svn_depth = state.get(key)
         except KeyError:
             raise InvalidYAMLObject("Could not find property \""+key+"\".")
         except TypeError as e:
@@ -318,23 +588,35 @@ class project(yaml.YAMLObject,dependency_node.dependency_node):
         except ValueError as e:
             raise InvalidYAMLObject("Invalid value for property \"" + key +"\": " + str(e))
 
-    def __init__(self, name, project_policy, dependencies=[], description="", branch="", is_enabled=True):
+    def __init__(self, name, project_policy, dependencies=[], description="", branch="", is_enabled=True,
+            compiler_launcher=None, depth=None, clone_filter=None, sparse_paths=None, svn_depth=None):
         self.name = name
         self.project_policy=project_policy
         self.dependencies = dependencies            # also allow None
         self.description = description
         self.branch = branch
         self.is_enabled = is_enabled
+        self.compiler_launcher = compiler_launcher
+        self.depth = depth
+        self.clone_filter = clone_filter
+        self.sparse_paths = sparse_paths
+        self.svn_depth = svn_depth
 
     def __repr__(self):
-        str1 = "{0}(name={1}, directory={2}, project_policy={3}, description={4}, branch={5}, is_enabled={6}, dependencies=".format(
+        str1 = ("{0}(name={1}, directory={2}, project_policy={3}, description={4}, branch={5}, is_enabled={6}, "
+                "compiler_launcher={7}, depth={8}, clone_filter={9}, sparse_paths={10}, svn_depth={11}, dependencies=").format(
                 self.__class__.__name__,
                 self.name,
                 self.directory,
                 self.project_policy,
                 self.description,
                 self.branch,
-                self.is_enabled
+                self.is_enabled,
+                self.compiler_launcher,
+                self.depth,
+                self.clone_filter,
+                self.sparse_paths,
+                self.svn_depth
                 )
         for dep in self.dependencies:
             str1 += " " + str(dep)
@@ -480,30 +762,271 @@ class project(yaml.YAMLObject,dependency_node.dependency_node):
         else:
             raise TypeError("branch can only be None or a string")
 
+    @property
+    def compiler_launcher(self):
+        """
+        The program to launch the compilers with (e.g. ccache) when
+        building or None. Unless set for the project, the one of the
+        project_policy is used. An empty string disables it.
+        """
+        if self.__compiler_launcher is None:
+            return self.project_policy.compiler_launcher
+        elif self.__compiler_launcher == "":
+            return None
+        else:
+            return self.__compiler_launcher
+
+    @compiler_launcher.setter
+    def compiler_launcher(self,val):
+        if val is None or isinstance(val,str):
+            self.__compiler_launcher = val
+        else:
+            raise TypeError("compiler_launcher can only be None or a string")
+
+    @property
+    def depth(self):
+        """
+        The number of commits of history to fetch for git sources or None
+        to fetch the complete history. Unless set for the project, the one
+        of the project_policy is used.
+        """
+        if self.__depth is None:
+            return self.project_policy.depth
+        return self.__depth
+
+    @depth.setter
+    def depth(self,val):
+        self.__depth = _checked_depth(val)
+
+    @property
+    def clone_filter(self):
+        """
+        The filter for partial clones of git sources (e.g. blob:none) or
+        None. Unless set for the project, the one of the project_policy is
+        used. An empty string disables it.
+        """
+        if self.__clone_filter is None:
+            return self.project_policy.clone_filter
+        elif self.__clone_filter == "":
+            return None
+        return self.__clone_filter
+
+    @clone_filter.setter
+    def clone_filter(self,val):
+        if val is None or isinstance(val,str):
+            self.__clone_filter = val
+        else:
+            raise TypeError("clone_filter can only be None or a string")
+
+    @property
+    def sparse_paths(self):
+        """
+        The list of directories to check out (besides the files in the top
+        directory) or None to check out everything. Unless set for the
+        project, the ones of the project_policy are used. An empty list
+        checks out everything.
+        """
+        if self.__sparse_paths is None:
+            return self.project_policy.sparse_paths
+        elif len(self.__sparse_paths) == 0:
+            return None
+        return self.__sparse_paths
+
+    @sparse_paths.setter
+    def sparse_paths(self,val):
+        self.__sparse_paths = _checked_sparse_paths(val)
+
+    @property
+    def svn_depth(self):
+        """
+        The depth of svn checkouts (e.g. immediates) or None for all. Unless
+        set for the project, the one of the project_policy is used.
+        """
+        if self.__svn_depth is None:
+            return self.project_policy.svn_depth
+        return self.__svn_depth
+
+    @svn_depth.setter
+    def svn_depth(self,val):
+        self.__svn_depth = _checked_svn_depth(val)
+
     # --------------------------------------------------------------------
 
-    def checkout_command(self):
-        params = {
+    def checkout_params(self):
+        """The parameters to substitute in the commands of the source"""
+        return {
                 "BRANCH": self.branch,
                 "PROJECT": self.name,
                 "DIRECTORY": self.directory,
+                "DEPTH": self.depth,
+                "CLONE_FILTER": self.clone_filter,
+                "SPARSE_PATHS": self.sparse_paths,
+                "SVN_DEPTH": self.svn_depth,
                 }
-        return self.project_policy.checkout_command(params);
+
+    def checkout_command(self):
+        return self.project_policy.checkout_command(self.checkout_params());
+
+    def update_command(self):
+        return self.project_policy.update_command(self.checkout_params());
 
 ############################################################################
 
-class reader:
-    def __init__(self,stream):
+# The characters allowed in the names of build configurations
+BUILD_CONFIGURATION_NAME = re.compile(r"^[A-Za-z0-9_.+-]+$")
+
+class build_configuration(yaml.YAMLObject):
+    yaml_tag = "!BuildConfiguration"
+    yaml_loader = YAML_LOADERS
+
+    def __getstate__(self):
+        return { "name": self.name, "description": self.description,
+                "configure_options": self.configure_options, "environment": dict(self.environment) };
+
+    def __setstate__(self,state):
+        # TODO see comment on source above
+
         try:
-            d = yaml.safe_load(stream)
-        except yaml.YAMLError as exc:
-            string = "Could not parse config file: " + str(exc)
+            key = "name"
+            self.name = state[key]
 
-            if hasattr(exc, 'problem_mark'):
-                mark = exc.problem_mark
-                raise ValueError(string + ": Error at ({0}:{1})".format(mark.line +1,mark.column+1))
-            else:
-                raise ValueError(string)
+            key = "description"
+            self.description = state.get(key)
+
+            key = "configure_options"
+            self.configure_options = state.get(key)
+
+            key = "environment"
+            self.environment = state.get(key)
+        except KeyError:
+            raise InvalidYAMLObject("Could not find property \""+key+"\".")
+        except TypeError as e:
+            raise InvalidYAMLObject("Invalid type for property \"" + key +"\": " + str(e))
+        except ValueError as e:
+            raise InvalidYAMLObject("Invalid value for property \"" + key +"\": " + str(e))
+
+    def __repr__(self):
+        return "{0}(name={1}, description={2}, configure_options={3}, environment={4})".format(
+                self.__class__.__name__,
+                self.name,
+                self.description,
+                self.configure_options,
+                self.environment
+                )
+
+    def __init__(self,name,description="",configure_options="",environment=None):
+        self.name = name
+        self.description = description
+        self.configure_options = configure_options
+        self.environment = environment
+
+    # --------------------------------------------------------------------
+
+    @property
+    def name(self):
+        """The name of the configuration, which is part of its build directory"""
+        return self.__name
+
+    @name.setter
+    def name(self,val):
+        if not isinstance(val,str):
+            raise TypeError("name can only be a string")
+        if not BUILD_CONFIGURATION_NAME.match(val):
+            raise ValueError("name may only contain letters, digits and the characters _.+-")
+        self.__name = val
+
+    @property
+    def description(self):
+        """A short description"""
+        return self.__description
+
+    @description.setter
+    def description(self,val):
+        if val is None:
+            self.__description = ""
+        elif isinstance(val,str):
+            self.__description = val
+        else:
+            raise TypeError("description can only be a string")
+
+    @property
+    def configure_options(self):
+        """The options for configure or cmake as a single string"""
+        return self.__configure_options
+
+    @configure_options.setter
+    def configure_options(self,val):
+        if val is None:
+            self.__configure_options = ""
+        elif isinstance(val,str):
+            self.__configure_options = val
+        else:
+            raise TypeError("configure_options can only be a string")
+
+    @property
+    def environment(self):
+        """Dict of environment variables to set for configuring and building (e.g. CC)"""
+        return self.__environment
+
+    @environment.setter
+    def environment(self,val):
+        if val is None:
+            self.__environment = dict()
+            return
+        if not isinstance(val,dict):
+            raise TypeError("environment can only be a mapping from names to strings")
+        for k, v in val.items():
+            if not isinstance(k,str) or not isinstance(v,(str,int,float)) or isinstance(v,bool):
+                raise TypeError("environment can only be a mapping from names to strings")
+        self.__environment = dict( (k, str(v)) for k, v in val.items() )
+
+############################################################################
+
+def _cache_key(content):
+    """
+    The key of the cached result of parsing the project file content (bytes),
+    which changes as well if the code of this module or the python version
+    changes.
+    """
+    h = hashlib.sha256()
+    with open(__file__,"rb") as f:
+        h.update(f.read())
+    h.update(sys.version.encode() + b"\0")
+    h.update(content)
+    return h.hexdigest()
+
+class reader:
+    def __init__(self,stream,cache_directory=CACHE_DIRECTORY):
+        """
+        stream:           The project file as an open file or a string
+        cache_directory:  Directory in which the parsed project files are
+                          cached by the hash of their content or None to
+                          always parse the file
+        """
+        content = stream.read() if hasattr(stream,"read") else stream
+        if isinstance(content,str):
+            content = content.encode()
+
+        cache = None
+        d = None
+        if cache_directory is not None:
+            cache = os.path.join(cache_directory,_cache_key(content) + ".pickle")
+            d = reader.__load_cache(cache)
+
+        if d is None:
+            try:
+                d = yaml.load(content,Loader=SafeLoader)
+            except yaml.YAMLError as exc:
+                string = "Could not parse config file: " + str(exc)
+
+                if hasattr(exc, 'problem_mark'):
+                    mark = exc.problem_mark
+                    raise ValueError(string + ": Error at ({0}:{1})".format(mark.line +1,mark.column+1))
+                else:
+                    raise ValueError(string)
+
+            if cache is not None:
+                reader.__store_cache(cache,d)
 
         self.__version = d["version"]
         
@@ -512,11 +1035,45 @@ class reader:
         else:
             raise ValueError("Unknown config version: " + self.version)
 
+    @staticmethod
+    def __load_cache(path):
+        """The parsed project file cached in path or None"""
+        try:
+            with open(path,"rb") as f:
+                return pickle.load(f)
+        except FileNotFoundError:
+            return None
+        except Exception:
+            # a corrupted cache entry is just parsed again
+            return None
+
+    @staticmethod
+    def __store_cache(path,d):
+        """Cache the parsed project file d in path, if this is possible"""
+        try:
+            os.makedirs(os.path.dirname(path),mode=0o700,exist_ok=True)
+            fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path),prefix=".tmp")
+            try:
+                with os.fdopen(fd,"wb") as f:
+                    pickle.dump(d,f,protocol=pickle.HIGHEST_PROTOCOL)
+                os.replace(tmp,path)
+            except:
+                os.unlink(tmp)
+                raise
+        except (OSError, pickle.PicklingError, RecursionError):
+            pass
+
     def __deal_with_1_0(self,d):
         self.__sources = d["sources"]
         self.__policies = d["project_policies"]
         self.__projects = d["projects"]
         self.__default_projects = d["default_projects"]
+        self.__configurations = d.get("build_configurations") or []
+
+        names = [ c.name for c in self.__configurations ]
+        for name in names:
+            if names.count(name) > 1:
+                raise ValueError("Build configuration " + name + " is given more than once")
 
     @property
     def version(self):
@@ -542,3 +1099,8 @@ class reader:
     def default_projects(self):
         """The default projects selected for preparation"""
         return self.__default_projects
+
+    @property
+    def build_configurations(self):
+        """The build configurations given in the projects file (may be empty)"""
+        return self.__configurations
@@ -18,11 +18,29 @@ usage() {
 	--only <repo1>:<repo2>: ...
 	Only run the tests for the repos matching these patterns
 
-	EOF
-}
+	-j <N>
+	--jobs <N>
+	The number of tests to run at the same time, default: $(noCPUs)
+
+	--timeout <seconds>
+	Kill tests running longer than this and count them as failed
+
+	--configuration <name>[=<options>]
+	Run the tests of this build configuration in the build directory
+	build-<name>, may be given several times. <name> alone selects a
+	build configuration of the project file. Default: all build
+	configurations of the project file or, if it has none, the tests
+	in the build directory build
 
-cleanup() {
-	cleanup_failedfile || exit 1
+	--force
+	Also run the tests which passed before, although neither they, nor the
+	shared libraries from the workspace they use, nor the files in the
+	tests directory changed since. Otherwise these are reported as
+	cached-pass.
+
+	The test results are written to .repoiser/test_results as results.json
+	and junit.xml
+	EOF
 }
 
 #--------------------------------------------------------------------
@@ -30,6 +48,10 @@ cleanup() {
 CONFIGFILE=$(default_config)
 EXCLUDE=""
 ONLY=""
+JOBS=$(noCPUs)
+TIMEOUT_OPT=""
+FORCE_OPT=""
+CONFIGURATIONS=()
 
 while [ "$1" ]; do
 	case "$1" in 
@@ -50,6 +72,21 @@ while [ "$1" ]; do
 			shift
 			ONLY="$1"
 			;;
+		"--jobs"|"-j")
+			shift
+			JOBS="$1"
+			;;
+		"--timeout")
+			shift
+			TIMEOUT_OPT="--timeout $1"
+			;;
+		"--force")
+			FORCE_OPT="--force"
+			;;
+		"--configuration")
+			shift
+			CONFIGURATIONS+=(--configuration "$1")
+			;;
 		*)
 			die "Unrecognised option: $1"
 			;;
@@ -57,15 +94,15 @@ while [ "$1" ]; do
 	shift
 done
 
-create_failedfile
-trap cleanup EXIT
+PROJECT_OPT=()
+if PROJECTFILE=$(default_project) && [ -f "$PROJECTFILE" ]; then
+	PROJECT_OPT=(--project "$PROJECTFILE")
+fi
 
-for repo in $(get_repos "$CONFIGFILE" "$EXCLUDE" "$ONLY"); do
-	if ! have_build "$repo"; then
-		echo "skipping testing $repo (no build folder)"
-		continue
-	fi
-	run_test "$repo"
-done
+# repositories without the build folder of a configuration are skipped
+# by the test runner
+TESTREPOS=$(get_repos "$CONFIGFILE" "$EXCLUDE" "$ONLY") || exit 1
 
-exit # exit code determined by cleanup_failedfile
+$(dirname $0)/test_runner.py --jobs "$JOBS" $TIMEOUT_OPT $FORCE_OPT "${PROJECT_OPT[@]}" \
+	"${CONFIGURATIONS[@]}" -- $TESTREPOS
+exit # exit code determined by the test runner
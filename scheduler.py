@@ -0,0 +1,280 @@
+# vi: set et ts=4 sw=4 sts=4:
+
+import asyncio
+import heapq
+from collections.abc import Iterable
+from dependency_node import dependency_node, DepedencyResolutionError, find_cycles
+
+class dependency_tracker:
+    """
+    Keep track of which nodes of a set of dependency_node objects are ready
+    to be processed, while the nodes are processed in some order.
+
+    A node is ready once all of its dependencies which are part of the set
+    have finished successfully. If a node fails, all nodes depending on it
+    directly or indirectly are skipped, while all other nodes still become
+    ready as usual. Dependencies which are not part of the set are ignored.
+
+    Amongst the ready nodes the one with the highest priority is returned
+    first, nodes of equal priority in the order they became ready.
+    """
+
+    def __init__(self,nodes,priority=None):
+        """
+        nodes:     Iterable of dependency_node objects
+        priority:  Optional function returning the priority of a node
+        """
+        self.__nodes = list(nodes)
+        self.__priority = priority
+        nodeset = set(self.__nodes)
+
+        # the nodes depending on a given node and the number of
+        # dependencies of each node, which have not yet finished
+        self.__dependents = dict( (node, []) for node in self.__nodes )
+        self.__n_unfinished = dict()
+        for node in self.__nodes:
+            deps = [ d for d in node.depends_on() if d in nodeset ]
+            self.__n_unfinished[node] = len(deps)
+            for d in deps:
+                self.__dependents[d].append(node)
+
+        # the failed nodes because of which a node is skipped
+        self.__causes = dict()
+
+        self.__ready = []       # heap of the nodes ready to be started
+        self.__n_ready = 0
+        for node in self.__nodes:
+            if self.__n_unfinished[node] == 0:
+                self.__make_ready(node)
+
+    def __make_ready(self,node):
+        prio = 0 if self.__priority is None else -self.__priority(node)
+        heapq.heappush(self.__ready,(prio, self.__n_ready, node))
+        self.__n_ready += 1
+
+    def has_ready(self):
+        """Is there a node ready to be started"""
+        return len(self.__ready) > 0
+
+    def pop_ready(self):
+        """Remove the ready node with the highest priority and return it"""
+        return heapq.heappop(self.__ready)[2]
+
+    def finish(self,node,success=True):
+        """
+        Mark node as finished. Returns the list of nodes which are skipped
+        as a consequence, i.e. the nodes depending on a failed node, whose
+        dependencies have all finished now.
+        """
+        skipped = []
+        stack = [ (node, set() if success else { node }) ]
+        while len(stack) > 0:
+            node, causes = stack.pop()
+            for d in self.__dependents[node]:
+                if len(causes) > 0:
+                    self.__causes.setdefault(d,set()).update(causes)
+                self.__n_unfinished[d] -= 1
+                if self.__n_unfinished[d] > 0:
+                    continue
+
+                if d in self.__causes:
+                    skipped.append(d)
+                    stack.append((d, self.__causes[d]))
+                else:
+                    self.__make_ready(d)
+        return skipped
+
+    def causes(self,node):
+        """The set of failed nodes because of which node was skipped"""
+        return set(self.__causes.get(node,()))
+
+    def check(self):
+        """
+        Raise DepedencyResolutionError if some nodes can never become ready,
+        since they are part of or depend on a cycle.
+        """
+        stuck = { node for node in self.__nodes if self.__n_unfinished[node] > 0 }
+        if len(stuck) > 0:
+            raise DepedencyResolutionError(stuck,find_cycles(stuck))
+
+class async_scheduler:
+    """
+    Run a coroutine for each node of a set of dependency_node objects on an
+    asyncio event loop, at most workers at the same time.
+
+    A node is started as soon as all of its dependencies which are part of
+    the set have finished. In contrast to processing the result of
+    build_batches one batch after another we never wait for unrelated nodes
+    to finish. Dependencies which are not part of the set of nodes are
+    assumed to be dealt with elsewhere and are ignored.
+
+    If a priority function is given, the ready node with the highest
+    priority is started first, otherwise the nodes are started in the
+    order they became ready. If a job fails, the nodes depending on it
+    directly or indirectly are skipped. With keep_going all other nodes
+    are still processed.
+
+    Each running job occupies one of the worker slots 1 to workers, which
+    is given by slot() while it runs.
+
+    If the scheduler is cancelled (e.g. by Ctrl-C in asyncio.run), all running
+    jobs are cancelled as well. With cancel_on_failure the same happens as soon
+    as a job fails.
+    """
+
+    # Possible states of the nodes after run()
+    SUCCEEDED = "succeeded"
+    FAILED = "failed"
+    SKIPPED = "skipped"
+    NOT_RUN = "not run"
+    CANCELLED = "cancelled"
+
+    def __init__(self,nodes,job,workers=1,keep_going=False,priority=None,cancel_on_failure=False):
+        """
+        nodes:              Iterable of dependency_node objects to process
+        job:                Coroutine function called with the node as its only
+                            argument. Should return True on success and False
+                            on failure.
+        workers:            Maximal number of jobs to run at the same time
+        keep_going:         If False no further jobs are started once a job failed
+        priority:           Optional function returning the priority of a node
+        cancel_on_failure:  Cancel all running jobs once a job failed
+        """
+        if not isinstance(nodes,Iterable):
+            raise TypeError("nodes has to be an iterable of dependency_node objects")
+
+        self.__nodes = list(nodes)
+        for n in self.__nodes:
+            if not isinstance(n,dependency_node):
+                raise TypeError("nodes has to be an iterable of dependency_node objects")
+
+        if workers < 1:
+            raise ValueError("workers needs to be at least 1")
+
+        self.__job = job
+        self.__workers = workers
+        self.__keep_going = keep_going and not cancel_on_failure
+        self.__priority = priority
+        self.__cancel_on_failure = cancel_on_failure
+        self.__futures = dict()
+        self.__slots = dict()
+        self.__tracker = None
+
+    @property
+    def workers(self):
+        """The maximal number of jobs run concurrently"""
+        return self.__workers
+
+    def skipped_because(self,node):
+        """The set of failed nodes because of which node was skipped in the last run"""
+        if self.__tracker is None:
+            return set()
+        return self.__tracker.causes(node)
+
+    def slot(self,node):
+        """The worker slot (1 to workers) of node while it runs, else None"""
+        return self.__slots.get(node)
+
+    def finished(self,node):
+        """
+        Awaitable for the state of node, which is done once the node has been
+        processed or it is clear that it will not be processed.
+        """
+        if node not in self.__futures:
+            self.__futures[node] = asyncio.get_running_loop().create_future()
+        return self.__futures[node]
+
+    def __finish(self,node,state):
+        future = self.finished(node)
+        if not future.done():
+            future.set_result(state)
+
+    async def run(self):
+        """
+        Process all nodes and return a dict from each node to its state,
+        i.e. one of SUCCEEDED, FAILED, CANCELLED, SKIPPED or NOT_RUN.
+
+        Raises DepedencyResolutionError if the dependencies between the nodes
+        contain a cycle.
+        """
+        tracker = dependency_tracker(self.__nodes,self.__priority)
+        self.__tracker = tracker
+
+        state = dict( (node, async_scheduler.NOT_RUN) for node in self.__nodes )
+        running = dict()
+        aborted = False
+
+        try:
+            while True:
+                while tracker.has_ready() and not aborted and len(running) < self.__workers:
+                    node = tracker.pop_ready()
+                    used = set(self.__slots.values())
+                    self.__slots[node] = min( i for i in range(1,self.__workers + 1) if i not in used )
+                    running[asyncio.ensure_future(self.__job(node))] = node
+
+                if len(running) == 0:
+                    break
+
+                done, _ = await asyncio.wait(running,return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    node = running.pop(task)
+                    del self.__slots[node]
+
+                    if task.cancelled():
+                        state[node] = async_scheduler.CANCELLED
+                    elif task.result():
+                        state[node] = async_scheduler.SUCCEEDED
+                    else:
+                        state[node] = async_scheduler.FAILED
+                        if not self.__keep_going:
+                            aborted = True
+                        if self.__cancel_on_failure:
+                            for t in running:
+                                t.cancel()
+                    self.__finish(node,state[node])
+
+                    # cancelled nodes count as failed for their dependents
+                    for d in tracker.finish(node,state[node] == async_scheduler.SUCCEEDED):
+                        state[d] = async_scheduler.SKIPPED
+                        self.__finish(d,state[d])
+        finally:
+            # cancel the jobs still running if we are cancelled or a job raised
+            for t in running:
+                t.cancel()
+            if len(running) > 0:
+                await asyncio.gather(*running,return_exceptions=True)
+            self.__slots.clear()
+            for node in self.__nodes:
+                self.__finish(node,state[node])
+
+        if not aborted:
+            tracker.check()
+        return state
+
+def simulate(nodes,duration,workers=1,priority=None):
+    """
+    Simulate processing the iterable of dependency_node objects nodes in the way
+    a scheduler would, assuming each node takes duration(node) seconds.
+
+    Returns a tuple (makespan, timeline), where timeline is a list of tuples
+    (node, start, end) in the order the nodes are started.
+    """
+    tracker = dependency_tracker(nodes,priority)
+
+    now = 0
+    running = []    # heap of (end, sequence number, node)
+    timeline = []
+    while tracker.has_ready() or len(running) > 0:
+        while tracker.has_ready() and len(running) < workers:
+            node = tracker.pop_ready()
+            end = now + duration(node)
+            heapq.heappush(running,(end, len(timeline), node))
+            timeline.append((node, now, end))
+
+        if len(running) == 0:
+            break
+        now, _, node = heapq.heappop(running)
+        tracker.finish(node)
+
+    tracker.check()
+    return (max( [ end for _, _, end in timeline ] + [ 0 ] ), timeline)
@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+# vi: set et ts=4 sw=4 sts=4:
+
+import hashlib
+import json
+import re
+from graph_index import graph_index
+from state_file import state_file
+
+def matches_any(string,patterns):
+    """Does any of the regular expressions in patterns match somewhere in string"""
+    return any( re.search(p,string) for p in patterns )
+
+def mrconfig_directories(path):
+    """The list of directories of the repositories in the .mrconfig file path"""
+    ret = []
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            if line.startswith("[") and line.endswith("]"):
+                ret.append(line[1:-1])
+    return ret
+
+class selection:
+    """
+    Select the projects to work on out of the projects of a workspace.
+
+    Projects are selected by regular expressions matched against their
+    directory or their name. The selection may be extended by all
+    dependencies or all dependents of the selected projects (within the
+    workspace) and is always returned in topological order, i.e. each
+    project after all of its dependencies.
+    """
+
+    def __init__(self,projects,index=None):
+        """
+        projects:  The projects of the workspace, i.e. those to select from
+        index:     Optional graph_index.graph_index containing the projects
+        """
+        self.__projects = list(projects)
+        self.__index = index if index is not None else graph_index(self.__projects)
+        self.__workspace = set(self.__projects)
+
+    @classmethod
+    def from_reader(cls,config,directories=None):
+        """
+        The selection amongst the projects checked out for the project_file.reader
+        config, i.e. the default projects and all their dependencies. If the list
+        directories is given, only the projects checked out to one of them are
+        considered.
+        """
+        index = graph_index.from_reader(config)
+        projects = index.descendants_of_all(config.default_projects)
+        if directories is not None:
+            directories = set(directories)
+            projects = { p for p in projects if p.directory in directories }
+        return cls(index.sorted(projects),index)
+
+    @property
+    def projects(self):
+        """All projects of the workspace in topological order"""
+        return self.__index.sorted(self.__workspace)
+
+    def matching(self,patterns):
+        """The set of projects whose directory or name matches one of the patterns"""
+        return { p for p in self.__projects if matches_any(p.directory,patterns) or matches_any(p.name,patterns) }
+
+    def select(self,only=[],exclude=[],dependencies=False,dependents=False):
+        """
+        Return the list of projects in topological order, which
+
+        only:          match one of these patterns (all projects if empty),
+        dependencies:  or which the matching projects depend on,
+        dependents:    or which depend on the matching projects,
+        exclude:       but do not match any of these patterns.
+
+        Raises ValueError if one of the patterns in only matches nothing.
+        """
+        selected = set(self.__workspace)
+        if len(only) > 0:
+            for pattern in only:
+                if len(self.matching([ pattern ])) == 0:
+                    raise ValueError("No repository matches " + pattern)
+            selected = self.matching(only)
+
+        if dependencies:
+            selected |= self.__index.descendants_of_all(selected) & self.__workspace
+        if dependents:
+            selected |= self.__index.ancestors_of_all(selected) & self.__workspace
+        if len(exclude) > 0:
+            selected -= self.matching(exclude)
+        return self.__index.sorted(selected)
+
+def file_hash(*paths):
+    """The sha256 of the content of the files paths (which may be None)"""
+    h = hashlib.sha256()
+    for path in paths:
+        if path is not None:
+            with open(path,"rb") as f:
+                h.update(f.read())
+        h.update(b"\0")
+    return h.hexdigest()
+
+# ------------------------------------------------------------------------
+
+if __name__ == "__main__":
+    import argparse
+    import sys
+
+    parser = argparse.ArgumentParser(description="Print the directories of the selected repositories of the "
+            "workspace in the order they need to be built")
+    parser.add_argument("--project", metavar="project.yaml", type=str, help="The project file with the dependencies, "
+            "if not given only --only and --exclude can be used")
+    parser.add_argument("--mrconfig", metavar=".mrconfig", type=str, help="Only consider the repositories in this file")
+    parser.add_argument("--only", type=str, default="", help="Colon-separated list of patterns, "
+            "only select the repositories matching one of them")
+    parser.add_argument("--exclude", type=str, default="", help="Colon-separated list of patterns, "
+            "do not select the repositories matching one of them")
+    parser.add_argument("--with-dependencies", action="store_true", help="Add all repositories the selected "
+            "ones depend on")
+    parser.add_argument("--with-dependents", action="store_true", help="Add all repositories depending on "
+            "the selected ones")
+    parser.add_argument("--no-cache", action="store_true", help="Do not reuse or record the plan "
+            "in .repoiser/selection.json")
+    args = parser.parse_args()
+
+    only = [ p for p in args.only.split(":") if p != "" ]
+    exclude = [ p for p in args.exclude.split(":") if p != "" ]
+    if args.project is None and args.mrconfig is None:
+        parser.error("At least one of --project and --mrconfig is needed")
+    if args.project is None and (args.with_dependencies or args.with_dependents):
+        parser.error("--with-dependencies and --with-dependents need --project")
+
+    # Reuse the plan of an earlier call with the same arguments
+    # as long as neither of the files changed.
+    plans = None
+    try:
+        inputs = file_hash(args.project,args.mrconfig)
+    except OSError as e:
+        print("Could not read " + e.filename + ": " + e.strerror,file=sys.stderr)
+        sys.exit(1)
+    query = json.dumps([ only, exclude, args.with_dependencies, args.with_dependents ])
+    if not args.no_cache:
+        plans = state_file("selection")
+        plan = plans.get(query)
+        if plan is not None and plan["inputs"] == inputs:
+            for d in plan["repos"]:
+                print(d)
+            sys.exit(0)
+
+    directories = None if args.mrconfig is None else mrconfig_directories(args.mrconfig)
+    try:
+        if args.project is not None:
+            import project_file
+            with open(args.project) as f:
+                config = project_file.reader(f)
+            projects = selection.from_reader(config,directories).select(only,exclude,
+                    args.with_dependencies,args.with_dependents)
+            repos = [ p.directory for p in projects ]
+        else:
+            for pattern in only:
+                if not any( matches_any(d,[ pattern ]) for d in directories ):
+                    raise ValueError("No repository matches " + pattern)
+            repos = [ d for d in directories if (len(only) == 0 or matches_any(d,only))
+                    and not matches_any(d,exclude) ]
+    except ValueError as e:
+        print(str(e),file=sys.stderr)
+        sys.exit(1)
+
+    if plans is not None:
+        for key in plans.keys():
+            if plans.get(key)["inputs"] != inputs:
+                plans.remove(key)
+        plans.set(query,{ "inputs": inputs, "repos": repos })
+        try:
+            plans.save()
+        except OSError:
+            pass
+
+    for d in repos:
+        print(d)
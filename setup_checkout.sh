@@ -14,18 +14,15 @@ usage() {
 	Specify the name of the .mrconfig file to be generated. This name is stored
 	in the file .default_config, such that the other scripts in this bundle
 	automatically know where to look for the .mrconfig, default: $(default_config)
+
+	-j <N>
+	--jobs <N>
+	The number of repositories to check out at the same time, default: $NJOBS
 	EOF
 }
 
 preliminary_checks() {
 	ERRORS=0
-	if ! type mr &> /dev/null; then
-		echo "The mr program is not installed. " >&2
-		echo "Please ask your administrator to install the \"mr\" package" >&2
-		echo
-		ERRORS=1
-	fi
-
 	if [ -f "$CONFIGFILE" ]; then
 		echo "Configfile \"$CONFIGFILE\" already exists." >&2
 		echo "Please choose a different file name using --config or delete it" >&2
@@ -57,6 +54,7 @@ config_hd_projects() {
 
 PROJ_YAML=""
 CONFIGFILE=$(default_config)
+NJOBS=8
 
 while [ "$1" ] ; do
 	case "$1" in 
@@ -68,6 +66,10 @@ while [ "$1" ] ; do
 			shift
 			CONFIGFILE=$1
 			;;
+		-j|--jobs)
+			shift
+			NJOBS=$1
+			;;
 
 		*)
 			if [ -f "$1" ]; then
@@ -91,7 +93,7 @@ if [ !  -r "$PROJ_YAML" ]; then
 	exit 1
 fi
 
-# check if mr exists, we do not overwrite ...
+# check that we do not overwrite ...
 preliminary_checks
 
 if ! $(dirname $0)/generate_mrconfig.py "$PROJ_YAML" > "$CONFIGFILE"; then
@@ -101,11 +103,12 @@ fi
 
 # Since generation was successful, store this
 echo "$CONFIGFILE" > .default_config
+readlink -f "$PROJ_YAML" > .default_project
 
-read -p "Should the repositories be checked out using \"mr update --config $CONFIGFILE\"?  (Y/n)" RET
+read -p "Should the repositories be checked out now?  (Y/n)" RET
 [ -z "$RET" ] && RET="y"
 if [ "$RET" == "y" ]; then
-	mr --config "$CONFIGFILE" update
+	$(dirname $0)/checkout.py --jobs "$NJOBS" "$PROJ_YAML"
 	exit $?
 fi
 exit 0
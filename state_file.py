@@ -0,0 +1,71 @@
+# vi: set et ts=4 sw=4 sts=4:
+
+import json
+import os
+import tempfile
+import threading
+
+# The directory inside the workspace where the state files are kept
+STATE_DIRECTORY = ".repoiser"
+
+class state_file:
+    """
+    A dictionary persisted as a JSON file in the state directory of the
+    workspace, which is used to remember information between runs.
+
+    The file is read when the object is created and written atomically
+    by save(). Access from several threads is serialised.
+    """
+
+    def __init__(self,name,directory=STATE_DIRECTORY):
+        """
+        name:       Name of the state file (without extension)
+        directory:  The directory containing the state files
+        """
+        self.__path = os.path.join(directory,name + ".json")
+        self.__lock = threading.Lock()
+
+        try:
+            with open(self.__path) as f:
+                self.__data = json.load(f)
+        except FileNotFoundError:
+            self.__data = dict()
+        except ValueError:
+            # ignore corrupted state, it is rebuilt anyway
+            self.__data = dict()
+
+    @property
+    def path(self):
+        """The path of the state file"""
+        return self.__path
+
+    def get(self,key,default=None):
+        with self.__lock:
+            return self.__data.get(key,default)
+
+    def set(self,key,value):
+        with self.__lock:
+            self.__data[key] = value
+
+    def remove(self,key):
+        with self.__lock:
+            self.__data.pop(key,None)
+
+    def keys(self):
+        with self.__lock:
+            return list(self.__data.keys())
+
+    def save(self):
+        """Write the state to disk"""
+        with self.__lock:
+            directory = os.path.dirname(self.__path)
+            os.makedirs(directory,exist_ok=True)
+
+            fd, tmp = tempfile.mkstemp(dir=directory,prefix=".tmp")
+            try:
+                with os.fdopen(fd,"w") as f:
+                    json.dump(self.__data,f,indent=1,sort_keys=True)
+                os.replace(tmp,self.__path)
+            except:
+                os.unlink(tmp)
+                raise
@@ -1,6 +1,7 @@
 #! /usr/bin/env python3
 # vi: set et ts=4 sw=4 sts=4:
 import dependency_node
+import graph_index
 
 class task(dependency_node.dependency_node):
     """
@@ -94,6 +95,23 @@ if __name__ == "__main__":
     d = task("d",b)
     __test("batches for union(c.deps d.deps)", dependency_node.build_batches( c.depends_on_recursive().union(d.depends_on_recursive()).union({c,d})), [{a},{b},{c,d}])
 
+    # the same results using a graph_index:
+    index = graph_index.graph_index([c,d])
+    __test("index.descendants(c)",c.depends_on_recursive(index=index),{a,b})
+    __test("index.ancestors(a)",index.ancestors(a),{b,c,d})
+    __test("index.reaches(d,a)",index.reaches(d,a),True)
+    __test("index.reaches(a,d)",index.reaches(a,d),False)
+    __test("index.descendants_of_all([c,d])",dependency_node.build_recursive_dependency_set([c,d],index=index),{a,b,c,d})
+    __test("index.sorted",index.sorted([d,a,b]),[a,b,d])
+
+    # the critical path through the graph:
+    weights = { a: 1, b: 5, c: 2, d: 1 }
+    __test("critical_path of {a,b,c,d}",dependency_node.critical_path({a,b,c,d},weights.get),(8,[a,b,c]))
+    __test("critical_path of {a,d}",dependency_node.critical_path({a,d},weights.get),(1,[a]))
+    __test("remaining_path_lengths of {a,b,c,d}",dependency_node.remaining_path_lengths({a,b,c,d},weights.get),
+            { a: 8, b: 7, c: 2, d: 1 })
+    __test("remaining_path_lengths of {b,d}",dependency_node.remaining_path_lengths({b,d},weights.get),{ b: 6, d: 1 })
+
     # have an example with a cyclic dependency:
     e = task("e",a)
     a.set_dependencies(e)
@@ -101,5 +119,50 @@ if __name__ == "__main__":
         __test("a.dependencies_fulfilled",a.dependencies_fulfilled(),None)
         raise SystemExit("Did not detect an CyclicGraphException as required")
     except dependency_node.CyclicGraphException as g:
-        pass
+        __test("cycle of a.dependencies_fulfilled",set(g.cycle),{a,e})
+    __test("find_cycles with a <-> e",dependency_node.find_cycles([c,d]),[{a,e}])
+
+    try:
+        dependency_node.build_batches({a,b,c,d,e})
+        raise SystemExit("Did not detect an DepedencyResolutionError as required")
+    except dependency_node.DepedencyResolutionError as g:
+        __test("unresolved nodes of build_batches",g.deps,{a,b,c,d,e})
+        __test("cycles of build_batches",g.cycles,[{a,e}])
+
+    # cycles which do not pass through the root are detected as well:
+    f = task("f",c)
+    try:
+        f.depends_on_recursive()
+        raise SystemExit("Did not detect an CyclicGraphException as required")
+    except dependency_node.CyclicGraphException as g:
+        __test("cycle of f.depends_on_recursive",set(g.cycle),{a,e})
+
+    # shared dependencies in diamond-shaped graphs are only visited once:
+    layers = [ [ task("l0") ] ]
+    for i in range(1,40):
+        layers.append([ task("l"+str(i)+"_"+str(j),*layers[-1]) for j in range(2) ])
+    top = task("top",*layers[-1])
+    counter = []
+    top.apply_dependencies(lambda t: counter.append(t))
+    __test("nodes visited in diamond lattice",len(counter),79)
+    __test("l0 visited first in diamond lattice",counter[0],layers[0][0])
+    __test("top.dependencies_fulfilled",top.dependencies_fulfilled(),True)
+    __test("find_cycles in diamond lattice",dependency_node.find_cycles([top]),[])
+    __test("top.build_batches()",top.build_batches(),[ set(l) for l in layers ] + [{top}])
+
+    # unfulfilled nodes and dependencies missing from the input are never resolved:
+    layers[5][0].disable()
+    try:
+        top.build_batches()
+        raise SystemExit("Did not detect an DepedencyResolutionError as required")
+    except dependency_node.DepedencyResolutionError as g:
+        __test("number of unresolved nodes in diamond lattice",len(g.deps),1+2*34+1)
+        __test("cycles in diamond lattice",g.cycles,[])
+    layers[5][0].enable()
+
+    # deep chains do not hit the recursion limit:
+    chain = task("chain0")
+    for i in range(1,20000):
+        chain = task("chain"+str(i),chain)
+    __test("length of recursive dependencies of chain",len(chain.depends_on_recursive()),19999)
 
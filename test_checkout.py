@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+# vi: set et ts=4 sw=4 sts=4:
+
+import os
+import subprocess
+import tempfile
+import threading
+import time
+import process
+import project_file
+from checkout import checkout_executor
+
+def git(*args,cwd=None):
+    """Run git with the arguments args and return its stripped output"""
+    return subprocess.run([ "git", "-c", "user.name=test", "-c", "user.email=test@example.com" ] + list(args),
+            cwd=cwd,check=True,stdout=subprocess.PIPE,stderr=subprocess.DEVNULL,universal_newlines=True).stdout.strip()
+
+def make_remote(path,content="initial"):
+    """Create a git repository in path with a single commit"""
+    os.makedirs(path)
+    git("init","-q","-b","master",cwd=path)
+    commit(path,content)
+
+def commit(path,content):
+    """Commit a new content of the file README in the git repository path"""
+    with open(os.path.join(path,"README"),"w") as f:
+        f.write(content + "\n")
+    git("add","README",cwd=path)
+    git("commit","-q","-m",content,cwd=path)
+
+def make_projects(remotes,names,max_connections=None):
+    """List of project_file.project objects for the git repositories names in the directory remotes"""
+    config = "\n".join([
+        'version: "1.0"',
+        'sources:',
+        '  - &local !Source',
+        '    name: local',
+        '    type: git',
+        '    path_pattern: "file://' + remotes + '/${PROJECT}"',
+        '    max_connections: ' + ("" if max_connections is None else str(max_connections)),
+        'project_policies:',
+        '  - &policy !ProjectPolicy',
+        '    name: policy',
+        '    source: *local',
+        'projects:' ] + [
+        '  - !Project { name: ' + name + ', project_policy: *policy }' for name in names ] + [
+        'default_projects: []' ])
+    return project_file.reader(config,cache_directory=None).projects
+
+class run_recorder:
+    """
+    Replacement for process.run recording the number of commands running at
+    the same time. After the first run of a command containing pattern the
+    function after_first is called.
+    """
+
+    def __init__(self,pattern=None,after_first=None,delay=0.1):
+        self.__run = process.run
+        self.__lock = threading.Lock()
+        self.__pattern = pattern
+        self.__after_first = after_first
+        self.__delay = delay
+        self.running = 0
+        self.max_running = 0
+        self.results = []
+
+    def __call__(self,args,**kwargs):
+        with self.__lock:
+            self.running += 1
+            self.max_running = max(self.max_running,self.running)
+        try:
+            time.sleep(self.__delay)
+            p = self.__run(args,**kwargs)
+        finally:
+            with self.__lock:
+                self.running -= 1
+
+        with self.__lock:
+            self.results.append(p.returncode)
+            first = self.__pattern is not None and self.__pattern in args[-1]
+            if first:
+                self.__pattern = None
+        if first:
+            self.__after_first()
+        return p
+
+    def __enter__(self):
+        process.run = self
+        return self
+
+    def __exit__(self,*args):
+        process.run = self.__run
+
+if __name__ == "__main__":
+    def __test(prestring,actual,expected):
+        if (expected != actual):
+            raise SystemExit(prestring+ ": " + str(actual) + " where " + str(expected) + " was expected.")
+
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp:
+        remotes = os.path.join(tmp,"remotes")
+        names = [ "a", "b", "c", "d" ]
+        for name in names:
+            make_remote(os.path.join(remotes,name))
+        os.makedirs(os.path.join(tmp,"ws"))
+        os.chdir(os.path.join(tmp,"ws"))
+        try:
+            # all four are checked out at the same time
+            with run_recorder() as recorder:
+                e = checkout_executor(make_projects(remotes,names),jobs=4,backoff=0.01)
+                __test("concurrent checkout",e.run(),True)
+            __test("concurrent checkouts",recorder.max_running,4)
+            __test("checked out",[ os.path.isfile(os.path.join(n,"README")) for n in names ],[ True ] * 4)
+
+            # but no more than the connection limit of the source allows
+            with run_recorder() as recorder:
+                e = checkout_executor(make_projects(remotes,names,max_connections=2),jobs=4)
+                __test("update with connection limit",e.run(),True)
+            __test("updates at once with max_connections=2",recorder.max_running,2)
+            with run_recorder() as recorder:
+                e = checkout_executor(make_projects(remotes,names),jobs=4,max_connections=1)
+                __test("update with default connection limit",e.run(),True)
+            __test("updates at once with max_connections=1",recorder.max_running,1)
+
+            # a checkout failing once is retried after cleaning up: the
+            # repository only appears after the first attempt, which left a
+            # partial checkout behind
+            def server_back():
+                os.makedirs(os.path.join("flaky",".git"))
+                make_remote(os.path.join(remotes,"flaky"))
+            flaky = make_projects(remotes,[ "flaky" ])
+            with run_recorder("/flaky",server_back) as recorder:
+                e = checkout_executor(flaky,retries=2,backoff=0.05)
+                start = time.time()
+                p = e.process(flaky[0])
+                elapsed = time.time() - start
+            __test("retried checkout (success, action, attempts)",p[:3],(True, "checkout", 2))
+            __test("exit codes of the attempts",[ r != 0 for r in recorder.results ],[ True, False ])
+            __test("backoff waited",elapsed >= 0.05,True)
+            __test("checked out after partial checkout was removed",os.path.isfile(os.path.join("flaky","README")),True)
+
+            # a repository which never comes back fails after all retries
+            missing = make_projects(remotes,[ "missing" ])
+            e = checkout_executor(missing,retries=2,backoff=0.01)
+            __test("missing repository (success, action, attempts)",e.process(missing[0])[:3],(False, "checkout", 3))
+            __test("no partial checkout of missing repository",os.path.exists("missing"),False)
+
+            # with only_changed just the repository with a new commit is updated
+            upstream = [ "up1", "up2" ]
+            for name in upstream:
+                make_remote(os.path.join(remotes,name))
+            projects = make_projects(remotes,upstream)
+            __test("checkout of up1 and up2",checkout_executor(projects).run(),True)
+            __test("changed upstream after checkout",checkout_executor(projects).changed_upstream(),[])
+            commit(os.path.join(remotes,"up2"),"second")
+            head = git("rev-parse","HEAD",cwd=os.path.join(remotes,"up2"))
+            e = checkout_executor(projects,only_changed=True)
+            __test("changed upstream after commit",[ p.name for p in e.changed_upstream() ],[ "up2" ])
+            __test("update of changed repositories",e.run(),True)
+            __test("updated repositories",[ p.name for p in e.updated ],[ "up2" ])
+            __test("head of updated repository",git("rev-parse","HEAD",cwd="up2"),head)
+            __test("changed upstream after update",checkout_executor(projects).changed_upstream(),[])
+        finally:
+            os.chdir(cwd)
@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+# vi: set et ts=4 sw=4 sts=4:
+
+import asyncio
+import os
+import tempfile
+import process
+from jobserver import jobserver
+
+# A Makefile with more jobs than job slots, each printing a line when it starts
+MAKEFILE = """all: a b c d e f
+a b c d e f:
+\t@echo start $@; sleep 2
+"""
+
+class slot_user:
+    """
+    Coroutine function holding a slot of a jobserver for a while, which
+    records the number of slots held at the same time.
+    """
+
+    def __init__(self,server,delay=0.01):
+        self.__server = server
+        self.__delay = delay
+        self.holding = 0
+        self.max_holding = 0
+        self.done = 0
+
+    async def __call__(self):
+        async with self.__server.slot_async():
+            self.holding += 1
+            self.max_holding = max(self.max_holding,self.holding)
+            await asyncio.sleep(self.__delay)
+            self.holding -= 1
+        self.done += 1
+
+async def run_users(server,n,timeout=5):
+    """Run n slot_user coroutines on server at once and return the slot_user"""
+    user = slot_user(server)
+    await asyncio.wait_for(asyncio.gather(*[ user() for _ in range(n) ]),timeout)
+    return user
+
+async def cancel_waiter(server):
+    """Cancel a coroutine waiting for a token and check the others still get theirs"""
+    async with server.slot_async():
+        waiter = asyncio.ensure_future(server.acquire_async())
+        await asyncio.sleep(0.01)
+        waiter.cancel()
+        await asyncio.gather(waiter,return_exceptions=True)
+    return await run_users(server,3)
+
+class abort_on_start:
+    """Minimal log_stream.log_stream requesting to abort at the first job started"""
+    tail = ""
+
+    def write_line(self,line):
+        return line.startswith("start")
+
+def count_tokens(server):
+    """Take all tokens out of the jobserver and return their number"""
+    read = server.fds[0]
+    os.set_blocking(read,False)
+    n = 0
+    try:
+        while len(os.read(read,1)) == 1:
+            n += 1
+    except BlockingIOError:
+        pass
+    return n
+
+async def aborted_make(server,directory):
+    """Run make with the jobserver and abort it once the first job started"""
+    return await process.run_async([ "make", "-s", "-C", directory ],env=server.environment(),
+            pass_fds=server.fds,log=abort_on_start())
+
+if __name__ == "__main__":
+    def __test(prestring,actual,expected):
+        if (expected != actual):
+            raise SystemExit(prestring+ ": " + str(actual) + " where " + str(expected) + " was expected.")
+
+    for jobs, n in [ (1, 3), (2, 7), (3, 3) ]:
+        server = jobserver(jobs)
+        try:
+            user = asyncio.run(run_users(server,n))
+            __test("users done with {0} tokens".format(jobs),user.done,n)
+            __test("slots held at once with {0} tokens".format(jobs),user.max_holding,min(jobs,n))
+
+            # the tokens can be used by the next event loop as well
+            user = asyncio.run(run_users(server,n))
+            __test("users done in second loop with {0} tokens".format(jobs),user.done,n)
+        finally:
+            server.close()
+
+    server = jobserver(1)
+    try:
+        user = asyncio.run(cancel_waiter(server))
+        __test("users done after cancelled waiter",user.done,3)
+    finally:
+        server.close()
+
+    # an aborted make returns the tokens its jobs hold
+    server = jobserver(3)
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            with open(os.path.join(tmp,"Makefile"),"w") as f:
+                f.write(MAKEFILE)
+            p = asyncio.run(aborted_make(server,tmp))
+        __test("make aborted",p.aborted,True)
+        __test("tokens after aborted make",count_tokens(server),3)
+    finally:
+        server.close()
@@ -0,0 +1,415 @@
+#!/usr/bin/env python3
+# vi: set et ts=4 sw=4 sts=4:
+
+import asyncio
+import hashlib
+import json
+import os
+import re
+import subprocess
+import sys
+import threading
+import process
+import build_matrix
+from log_stream import log_stream, log_path
+from contextlib import nullcontext
+from xml.etree import ElementTree
+
+# Output matching this pattern marks a test as failed, even if it exits with 0
+FAILURE_PATTERN = re.compile("(fail|error)",re.IGNORECASE)
+
+class test_result:
+    """The outcome of running a single test executable"""
+
+    def __init__(self,repo,path,returncode,duration,output,timed_out=False,cpu_time=None,max_rss=None,
+            cached=False,failure=None,log=None):
+        """
+        repo:        The repository the test belongs to
+        path:        Path of the test executable
+        returncode:  Exit status of the test
+        duration:    Wall time in seconds
+        output:      Combined stdout and stderr of the test (or its last lines)
+        timed_out:   Was the test killed because it exceeded the timeout
+        cpu_time:    CPU time in seconds used by the test
+        max_rss:     Peak resident set size in bytes
+        cached:      Was the test not run, since it passed before and
+                     neither it nor its inputs changed since
+        failure:     The first line of the output matching FAILURE_PATTERN,
+                     default: searched in output
+        log:         The path of the log file with the complete output
+        """
+        self.repo = repo
+        self.path = path
+        self.returncode = returncode
+        self.duration = duration
+        self.output = output
+        self.timed_out = timed_out
+        self.cpu_time = cpu_time
+        self.max_rss = max_rss
+        self.cached = cached
+        if failure is None:
+            match = FAILURE_PATTERN.search(output)
+            if match is not None:
+                failure = output[output.rfind("\n",0,match.start()) + 1:].split("\n",1)[0]
+        self.failure = failure
+        self.log = log
+
+    @property
+    def name(self):
+        """The name of the test executable"""
+        return os.path.basename(self.path)
+
+    @property
+    def passed(self):
+        """Did the test pass"""
+        return not self.timed_out and self.returncode == 0 and self.failure is None
+
+    @property
+    def status(self):
+        if self.timed_out:
+            return "timeout"
+        if self.cached:
+            return "cached-pass"
+        return "passed" if self.passed else "failed"
+
+    def to_dict(self):
+        return { "repo": self.repo, "name": self.name, "path": self.path, "status": self.status,
+                "returncode": self.returncode, "duration": self.duration,
+                "cpu_time": self.cpu_time, "max_rss": self.max_rss, "cached": self.cached,
+                "failure": self.failure, "log": self.log }
+
+# ------------------------------------------------------------------------
+
+def linked_libraries(path):
+    """
+    List of the absolute paths of the shared libraries the executable path
+    is linked to (as reported by ldd) or None if they cannot be determined.
+    """
+    try:
+        p = subprocess.run([ "ldd", path ],stdout=subprocess.PIPE,stderr=subprocess.DEVNULL,
+                stdin=subprocess.DEVNULL,universal_newlines=True)
+    except OSError:
+        return None
+    if p.returncode != 0:
+        return None
+
+    ret = []
+    for line in p.stdout.splitlines():
+        # lines look like "libfoo.so.1 => /path/libfoo.so.1 (0x...)"
+        # or "/lib64/ld-linux-x86-64.so.2 (0x...)"
+        if "=>" in line:
+            line = line.split("=>",1)[1]
+        line = line.strip()
+        if line.startswith("/"):
+            ret.append(line.split(" (")[0])
+    return ret
+
+class test_cache:
+    """
+    Remember the tests which passed, together with a key made up of the
+    hashes of the test executable, the shared libraries from the workspace
+    it links to and the files in the tests directory of its repository
+    (its input data). As long as the key does not change, the test does not
+    need to be run again.
+    """
+
+    def __init__(self,state,workspace=None):
+        """
+        state:      The state_file to keep the keys of the passed tests in
+        workspace:  Shared libraries in this directory are part of the key,
+                    default: the current directory
+        """
+        self.__state = state
+        self.__workspace = os.path.abspath(workspace if workspace is not None else os.getcwd())
+        self.__hashes = dict()
+        self.__lock = threading.Lock()
+
+    def __hash_file(self,path):
+        """The hash of the file path, cached as long as the file is not modified"""
+        st = os.stat(path)
+        stamp = (st.st_mtime_ns, st.st_size, st.st_ino)
+        with self.__lock:
+            if path in self.__hashes and self.__hashes[path][0] == stamp:
+                return self.__hashes[path][1]
+
+        h = hashlib.sha256()
+        with open(path,"rb") as f:
+            for block in iter(lambda: f.read(1 << 20),b""):
+                h.update(block)
+        with self.__lock:
+            self.__hashes[path] = (stamp, h.hexdigest())
+        return h.hexdigest()
+
+    def key(self,repo,path):
+        """The key of the test path of repo or None if it cannot be determined"""
+        libraries = linked_libraries(path)
+        if libraries is None:
+            return None
+
+        h = hashlib.sha256()
+        try:
+            h.update(b"test:" + self.__hash_file(path).encode() + b"\0")
+            for lib in sorted( os.path.realpath(l) for l in libraries ):
+                if lib.startswith(self.__workspace + os.sep):
+                    h.update(b"library:" + lib.encode() + b":" + self.__hash_file(lib).encode() + b"\0")
+
+            data = os.path.join(repo,"tests")
+            for dirpath, dirnames, filenames in os.walk(data):
+                dirnames.sort()
+                for f in sorted(filenames):
+                    h.update(b"data:" + os.path.relpath(os.path.join(dirpath,f),data).encode() + b":"
+                            + self.__hash_file(os.path.join(dirpath,f)).encode() + b"\0")
+        except FileNotFoundError:
+            return None
+        return h.hexdigest()
+
+    def passed_before(self,repo,path,key):
+        """Did the test pass the last time it was run with the same key"""
+        return key is not None and self.__state.get(os.path.abspath(path)) == key
+
+    def record(self,result,key):
+        """Record the test_result of a test with the given key"""
+        if result.passed and key is not None:
+            self.__state.set(os.path.abspath(result.path),key)
+        else:
+            self.__state.remove(os.path.abspath(result.path))
+
+    def save(self):
+        """Write the keys to disk"""
+        self.__state.save()
+
+class test_runner:
+    """
+    Run the test executables in the tests directory of the builds of
+    repositories (by default build/tests, for a build configuration
+    build-<name>/tests).
+
+    The tests are run as asynchronous subprocesses. Up to jobs tests run at
+    the same time, also if run_async() is awaited several times at once.
+    Tests exceeding the timeout are killed together with all processes they
+    started.
+    """
+
+    def __init__(self,jobs=1,timeout=None,governor=None,cache=None,force=False,abort_early=False,
+            echo=False):
+        """
+        jobs:         Maximal number of tests to run at once
+        timeout:      Timeout per test in seconds or None
+        governor:     Optional governor.resource_governor, which needs to admit
+                      each test before it is started
+        cache:        Optional test_cache. Tests which passed before and did
+                      not change are not run again.
+        force:        Run all tests, even if they are unchanged
+        abort_early:  Kill a test as soon as its output matches FAILURE_PATTERN
+        echo:         Print the output of the tests while they run (prefixed
+                      by the repository)
+        """
+        if jobs < 1:
+            raise ValueError("jobs needs to be at least 1")
+        self.__timeout = timeout
+        self.__governor = governor
+        self.__cache = cache
+        self.__force = force
+        self.__abort_early = abort_early
+        self.__slots = asyncio.Semaphore(jobs)
+        self.__echo = echo
+
+    @staticmethod
+    def find_tests(repo,build_directory=None):
+        """
+        Sorted list of the test executables of a repository, which are
+        taken from the build directory (default: repo/build)
+        """
+        if build_directory is None:
+            build_directory = os.path.join(repo,"build")
+        testdir = os.path.join(build_directory,"tests")
+        if not os.path.isdir(testdir):
+            return []
+        return sorted( os.path.join(testdir,f) for f in os.listdir(testdir)
+                if os.path.isfile(os.path.join(testdir,f)) and os.access(os.path.join(testdir,f),os.X_OK) )
+
+    async def run_test(self,repo,path,label=None):
+        """
+        Coroutine running a single test of repo and returning its test_result,
+        in which and in whose log the test is recorded under label (default: repo)
+        """
+        if label is None:
+            label = repo
+
+        # tests are run from the tests directory of the repository
+        cwd = os.path.join(repo,"tests")
+        if not os.path.isdir(cwd):
+            cwd = repo
+
+        key = None
+        if self.__cache is not None:
+            key = await asyncio.to_thread(self.__cache.key,repo,path)
+            if not self.__force and self.__cache.passed_before(repo,path,key):
+                result = test_result(label,path,0,0.0,"",cached=True)
+                sys.stdout.write("Running {0} ... {1}\n\n".format(path,result.status))
+                sys.stdout.flush()
+                return result
+
+        echo = None
+        if self.__echo:
+            prefix = label + "/" + os.path.basename(path) + " | "
+            echo = lambda line: sys.stdout.write(prefix + line)
+
+        async with self.__slots:
+            admit = nullcontext() if self.__governor is None else self.__governor.admit_async(path,"test")
+            async with admit:
+                with log_stream(log_path(label,"test-" + os.path.basename(path)),FAILURE_PATTERN,
+                        self.__abort_early) as log:
+                    p = await process.run_async([ os.path.abspath(path) ],cwd=cwd,timeout=self.__timeout,
+                            log=log,echo=echo)
+        if self.__governor is not None:
+            self.__governor.record(path,"test",p.max_rss)
+
+        result = test_result(label,path,p.returncode,p.wall_time,p.output,p.timed_out,p.cpu_time,p.max_rss,
+                failure=log.failure,log=log.path)
+        if self.__cache is not None:
+            self.__cache.record(result,key)
+
+        sys.stdout.write("Running {0} ... {1} ({2:.1f}s)\n".format(path,result.status,result.duration))
+        if not result.passed:
+            sys.stdout.write("".join( "   " + l for l in result.output.splitlines(True) ))
+            sys.stdout.write("   (complete output in " + log.path + ")\n")
+        sys.stdout.write("\n")
+        sys.stdout.flush()
+        return result
+
+    def save(self):
+        """Write the test cache (if any) to disk"""
+        if self.__cache is not None:
+            self.__cache.save()
+
+    async def run_build_async(self,repo,build_directory=None,label=None):
+        """
+        Coroutine running the tests in the build directory (default:
+        repo/build) of repo and returning the list of test_result objects,
+        in which the tests are recorded under label (default: repo)
+        """
+        tests = test_runner.find_tests(repo,build_directory)
+        return list(await asyncio.gather(*[ self.run_test(repo,path,label) for path in tests ]))
+
+    async def run_async(self,repos,configurations=[]):
+        """
+        Coroutine running the tests of all repositories in the builds of each
+        of the project_file.build_configuration objects configurations (if
+        empty in the default build directory) and returning the list of
+        test_result objects. Builds which do not exist are skipped.
+        """
+        builds = []
+        for c in configurations or [ None ]:
+            for repo in repos:
+                build = os.path.join(repo,build_matrix.build_directory_name(c))
+                label = build_matrix.configured_label(repo,c)
+                if os.path.isdir(build):
+                    builds.append(self.run_build_async(repo,build,label))
+                else:
+                    sys.stdout.write("skipping testing " + label + " (no build folder)\n")
+        results = await asyncio.gather(*builds)
+        return [ r for rs in results for r in rs ]
+
+    def run(self,repos,configurations=[]):
+        """Run the tests of all repositories and return the list of test_result objects (see run_async)"""
+        return asyncio.run(self.run_async(repos,configurations))
+
+# ------------------------------------------------------------------------
+
+def write_json(results,path):
+    """Write the list of test_result objects to path as JSON"""
+    with open(path,"w") as f:
+        json.dump([ r.to_dict() for r in results ],f,indent=1)
+
+def write_junit(results,path):
+    """Write the list of test_result objects to path as JUnit XML (one testsuite per repository)"""
+    root = ElementTree.Element("testsuites")
+    suites = dict()
+    for r in results:
+        if r.repo not in suites:
+            suites[r.repo] = ElementTree.SubElement(root,"testsuite",name=r.repo)
+        case = ElementTree.SubElement(suites[r.repo],"testcase",classname=r.repo,
+                name=r.name,time="{0:.3f}".format(r.duration))
+        if not r.passed:
+            failure = ElementTree.SubElement(case,"failure",message=r.status)
+            failure.text = "exit status {0}".format(r.returncode)
+        elif r.cached:
+            ElementTree.SubElement(case,"skipped",message="passed before and unchanged since")
+        ElementTree.SubElement(case,"system-out").text = r.output
+
+    for suite in suites.values():
+        cases = suite.findall("testcase")
+        suite.set("tests",str(len(cases)))
+        suite.set("failures",str(sum( 1 for c in cases if c.find("failure") is not None )))
+        suite.set("time","{0:.3f}".format(sum( float(c.get("time")) for c in cases )))
+
+    ElementTree.ElementTree(root).write(path,encoding="utf-8",xml_declaration=True)
+
+def write_results(results,directory):
+    """Write results.json and junit.xml for the list of test_result objects into directory"""
+    os.makedirs(directory,exist_ok=True)
+    write_json(results,os.path.join(directory,"results.json"))
+    write_junit(results,os.path.join(directory,"junit.xml"))
+
+def print_summary(results):
+    """Print the failed tests and return True if all tests passed"""
+    failed = [ r for r in results if not r.passed ]
+    if len(failed) == 0:
+        return True
+
+    print()
+    print("-----------------------------------")
+    print()
+    print("The following tests have failed:")
+    for r in failed:
+        print("   " + r.path + " (" + r.status + ")")
+        if r.failure is not None:
+            print("      " + r.failure)
+    return False
+
+if __name__ == "__main__":
+    import argparse
+    import project_file
+    from state_file import state_file, STATE_DIRECTORY
+
+    parser = argparse.ArgumentParser(description="Run the tests in build/tests of the given repositories")
+    parser.add_argument("repos", metavar="repo", nargs="*", help="The directories of the repositories")
+    parser.add_argument("--project", metavar="project.yaml", default=None, help="The project file defining "
+            "the build configurations")
+    parser.add_argument("--configuration", metavar="NAME[=OPTIONS]", action="append", default=[],
+            help="Run the tests of this configuration in the build directory build-NAME, may be given several "
+            "times. NAME alone selects a build configuration of the project file, the OPTIONS of NAME=OPTIONS "
+            "are ignored. Default: all configurations of the project file or, if it has none (or no project "
+            "file is given), the tests in build")
+    parser.add_argument("-j","--jobs", type=int, default=os.cpu_count(), help="The number of tests to run at the same time")
+    parser.add_argument("--timeout", type=float, default=None, help="Timeout for each test in seconds")
+    parser.add_argument("--force", action="store_true", help="Run all tests, even those which passed before "
+            "and did not change since")
+    parser.add_argument("--abort-early", action="store_true", help="Kill a test as soon as its output "
+            "indicates a failure")
+    parser.add_argument("-v","--verbose", action="store_true", help="Print the output of the tests while "
+            "they run")
+    parser.add_argument("--results", default=os.path.join(STATE_DIRECTORY,"test_results"),
+            help="Directory to write results.json and junit.xml to")
+    args = parser.parse_args()
+
+    known = []
+    if args.project is not None:
+        with open(args.project) as f:
+            known = project_file.reader(f).build_configurations
+    try:
+        configurations = [ build_matrix.parse_configuration(c,known) for c in args.configuration ]
+    except ValueError as e:
+        parser.error(str(e))
+    if len(args.configuration) == 0:
+        configurations = list(known)
+    if len(set( c.name for c in configurations )) < len(configurations):
+        parser.error("Each build configuration may only be given once")
+
+    runner = test_runner(jobs=args.jobs,timeout=args.timeout,cache=test_cache(state_file("test_cache")),
+            force=args.force,abort_early=args.abort_early,echo=args.verbose)
+    results = runner.run(args.repos,configurations)
+    runner.save()
+    write_results(results,args.results)
+    sys.exit(0 if print_summary(results) else 1)
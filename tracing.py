@@ -0,0 +1,119 @@
+# vi: set et ts=4 sw=4 sts=4:
+
+import json
+import os
+import threading
+import time
+from dependency_node import critical_path
+
+# The order in which the phases are shown in the summary
+PHASES = [ "checkout", "update", "restore", "configure", "build", "test", "store", "doxygen" ]
+
+class tracer:
+    """
+    Collect the timeline of the phases of a run as spans, one per repository
+    and phase, and write them in the Chrome trace-event format, which can be
+    loaded in chrome://tracing or Perfetto.
+
+    Each span is shown on the track given when it is added, e.g. the worker
+    slot of the scheduler running the phase. Spans added without a track
+    are shown on a separate track for each thread adding them.
+    """
+
+    def __init__(self):
+        self.__spans = []
+        self.__threads = dict()
+        self.__tracks = set()
+        self.__lock = threading.Lock()
+
+    def add_span(self,repo,phase,start,wall_time,cpu_time=None,max_rss=None,returncode=None,track=None):
+        """
+        Add a span for a phase of a repository.
+
+        start:       Start time as given by time.time()
+        wall_time:   Duration in seconds
+        cpu_time:    CPU time in seconds used by the phase
+        max_rss:     Peak resident set size in bytes
+        returncode:  Exit code of the phase
+        track:       Number of the track to show the span on, default: one
+                     track per thread
+        """
+        with self.__lock:
+            tid = track
+            if tid is None:
+                tid = self.__threads.setdefault(threading.get_ident(),len(self.__threads) + 1)
+            self.__tracks.add(tid)
+            self.__spans.append({ "repo": repo, "phase": phase, "start": start, "wall_time": wall_time,
+                "cpu_time": cpu_time, "max_rss": max_rss, "returncode": returncode, "tid": tid })
+
+    def add_result(self,repo,phase,start,result,track=None):
+        """Add a span for a phase from a process.process_result"""
+        self.add_span(repo,phase,start,result.wall_time,result.cpu_time,result.max_rss,result.returncode,track)
+
+    def durations(self):
+        """Dict from repository to a dict from phase to the total wall time"""
+        ret = dict()
+        with self.__lock:
+            for s in self.__spans:
+                phases = ret.setdefault(s["repo"],dict())
+                phases[s["phase"]] = phases.get(s["phase"],0) + s["wall_time"]
+        return ret
+
+    def write(self,path):
+        """Write the spans to path in the trace-event format"""
+        pid = os.getpid()
+        with self.__lock:
+            t0 = min( [ s["start"] for s in self.__spans ] + [ time.time() ] )
+            events = [ { "name": "process_name", "ph": "M", "pid": pid, "args": { "name": "repoiser" } } ]
+            for tid in sorted(self.__tracks):
+                events.append({ "name": "thread_name", "ph": "M", "pid": pid, "tid": tid,
+                    "args": { "name": "worker " + str(tid) } })
+
+            for s in self.__spans:
+                args = { "wall_time_s": s["wall_time"] }
+                if s["cpu_time"] is not None:
+                    args["cpu_time_s"] = s["cpu_time"]
+                if s["max_rss"] is not None:
+                    args["peak_rss_mb"] = s["max_rss"] / 1024**2
+                if s["returncode"] is not None:
+                    args["exit_code"] = s["returncode"]
+                events.append({ "name": s["repo"] + " " + s["phase"], "cat": s["phase"], "ph": "X",
+                    "pid": pid, "tid": s["tid"], "ts": (s["start"] - t0) * 1e6,
+                    "dur": s["wall_time"] * 1e6, "args": args })
+
+        with open(path,"w") as f:
+            json.dump({ "traceEvents": events, "displayTimeUnit": "ms" },f)
+
+    def print_summary(self,projects=None):
+        """
+        Print a table of the wall time per repository and phase. If the
+        build_matrix.configured_project objects are given, the critical path
+        through their dependency graph (weighted by the total wall time) is
+        shown.
+        """
+        durations = self.durations()
+        phases = [ p for p in PHASES if any( p in d for d in durations.values() ) ]
+        total = lambda repo: sum(durations.get(repo,{}).values())
+
+        on_path = []
+        length = 0
+        if projects is not None:
+            length, path = critical_path(projects,lambda p: total(p.label))
+            on_path = [ p.label for p in path ]
+
+        width = max( [ len(r) for r in durations ] + [ 10 ] )
+        print()
+        print("Time spent (wall time in seconds, * marks the critical path):")
+        print("  " + "repository".ljust(width) + "".join( p.rjust(11) for p in phases ) + "total".rjust(11))
+        for repo in sorted(durations,key=total,reverse=True):
+            line = ("*" if repo in on_path else " ") + " " + repo.ljust(width)
+            for p in phases:
+                if p in durations[repo]:
+                    line += "{0:11.1f}".format(durations[repo][p])
+                else:
+                    line += "-".rjust(11)
+            print(line + "{0:11.1f}".format(total(repo)))
+
+        if len(on_path) > 0:
+            print()
+            print("Critical path ({0:.1f}s): {1}".format(length," -> ".join(on_path)))
@@ -0,0 +1,130 @@
+# vi: set et ts=4 sw=4 sts=4:
+
+import os
+import subprocess
+import xml.etree.ElementTree as ElementTree
+
+def __query(command,strip=True):
+    """Run command and return its (stripped) output or None if it failed"""
+    try:
+        p = subprocess.run(command,stdout=subprocess.PIPE,stderr=subprocess.DEVNULL,
+                universal_newlines=True)
+    except OSError:
+        return None
+    if p.returncode != 0:
+        return None
+    if strip:
+        return p.stdout.strip()
+    return p.stdout
+
+def revision(project):
+    """
+    Return the revision currently checked out for the project_file.project
+    project as a string or None if it cannot be determined.
+
+    For git this is the commit hash of HEAD, for svn the last revision in
+    which the checked out directory was changed.
+    """
+    vcs_type = project.project_policy.source.type
+    if vcs_type == "git":
+        return __query([ "git", "-C", project.directory, "rev-parse", "HEAD" ])
+    elif vcs_type == "svn":
+        return __query([ "svn", "info", "--show-item", "last-changed-revision", project.directory ])
+    else:
+        raise ValueError("Unknown source type: " + vcs_type)
+
+def modified_files(project):
+    """
+    Return the list of tracked files of the project_file.project project,
+    which have local modifications, as paths relative to the directory of
+    the project or None if this cannot be determined.
+    """
+    vcs_type = project.project_policy.source.type
+    if vcs_type == "git":
+        out = __query([ "git", "-C", project.directory, "status", "--porcelain", "-z", "--untracked-files=no" ],strip=False)
+        if out is None:
+            return None
+
+        ret = []
+        entries = iter(out.split("\0"))
+        for entry in entries:
+            if entry == "":
+                continue
+            ret.append(entry[3:])
+            if entry[0] in "RC":
+                # the original path of renames or copies follows
+                ret.append(next(entries))
+        return ret
+    elif vcs_type == "svn":
+        out = __query([ "svn", "status", "-q", project.directory ],strip=False)
+        if out is None:
+            return None
+        return [ os.path.relpath(line[8:],project.directory) for line in out.splitlines() if len(line) > 8 ]
+    else:
+        raise ValueError("Unknown source type: " + vcs_type)
+
+def upstream_revision(project):
+    """
+    Return a tuple (location, revision) describing what the checkout of the
+    project_file.project project was last updated to or None if this cannot
+    be determined. This only looks at the checkout and needs no network.
+
+    For git the location is the branch in the remote repository, which the
+    checked out branch follows, and the revision the commit it pointed to
+    when it was last fetched. For svn the location is the URL the working
+    copy was checked out from and the revision its last changed revision.
+    """
+    vcs_type = project.project_policy.source.type
+    if vcs_type == "git":
+        branch = __query([ "git", "-C", project.directory, "symbolic-ref", "--short", "-q", "HEAD" ])
+        if branch is None:
+            return None
+        ref = __query([ "git", "-C", project.directory, "config", "--get", "branch." + branch + ".merge" ])
+        rev = __query([ "git", "-C", project.directory, "rev-parse", "-q", "--verify", "@{upstream}" ])
+        if ref is None or rev is None:
+            return None
+        return (ref, rev)
+    elif vcs_type == "svn":
+        info = svn_info([ project.directory ])
+        if info is None or len(info) != 1:
+            return None
+        return info[0]
+    else:
+        raise ValueError("Unknown source type: " + vcs_type)
+
+def git_remote_revision(url,ref):
+    """
+    The commit ref (e.g. refs/heads/master) points to in the git repository
+    at url or None if it cannot be determined
+    """
+    out = __query([ "git", "ls-remote", url, ref ])
+    if out is None:
+        return None
+    for line in out.splitlines():
+        rev, _, name = line.partition("\t")
+        if name == ref:
+            return rev
+    return None
+
+def svn_info(targets):
+    """
+    Return the list of tuples (URL, last changed revision) of the svn
+    working copies or URLs targets, obtained using a single svn command,
+    or None if this fails.
+    """
+    out = __query([ "svn", "info", "--xml" ] + list(targets),strip=False)
+    if out is None:
+        return None
+    try:
+        root = ElementTree.fromstring(out)
+    except ElementTree.ParseError:
+        return None
+
+    ret = []
+    for entry in root.iter("entry"):
+        url = entry.findtext("url")
+        commit = entry.find("commit")
+        if url is None or commit is None:
+            return None
+        ret.append((url, commit.get("revision")))
+    return ret